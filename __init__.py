@@ -12,6 +12,21 @@ Modules:
     - ms_file_control: Microsoft SharePointファイル操作
     - send_email_message: Azure Communication Service メール送信
     - utils: ユーティリティ関数
+    - export_stream: NDJSON/CSV エクスポートのストリーミング出力
+    - events: Redis pub/sub によるプロジェクト変更通知 (SSE)
+    - graph_client: Microsoft Graph 用の共有 HTTP クライアント
+    - profile_cache: Graph /me プロフィールの Redis キャッシュ
+    - threadpool: 同期処理用スレッドプールの容量設定とメトリクス
+    - fast_json: 一覧・詳細レスポンスの高速 JSON シリアライズ
+    - compression: gzip/brotli レスポンス圧縮と圧縮済みキャッシュ
+    - metrics: Prometheus メトリクス (/metrics)
+    - profiler: 管理者向けのリクエスト単位プロファイラー
+    - rate_limit: Redis トークンバケットによるレート制限とアドミッション制御
+    - single_flight: 同時に届いた同一リクエストの集約
+    - health: 依存先の定期確認と /healthz・/readyz
+    - warmup: 起動時のウォームアップ（接続・クエリ・キャッシュの準備）
+    - loadtest: ローカルの代替サービスを使った負荷試験 (python -m loadtest)
+    - query_counter: SQL 実行回数の計測 (N+1 検出・クエリ数の上限チェック)
     - app_config: アプリケーション設定
 """
 
@@ -25,5 +40,19 @@ __all__ = [
     "ms_file_control",
     "send_email_message",
     "utils",
+    "export_stream",
+    "events",
+    "query_counter",
+    "graph_client",
+    "profile_cache",
+    "threadpool",
+    "fast_json",
+    "compression",
+    "metrics",
+    "profiler",
+    "rate_limit",
+    "single_flight",
+    "health",
+    "warmup",
     "app_config",
 ]
@@ -4,6 +4,7 @@ from typing import Optional, Dict
 from fastapi import Cookie, HTTPException, Request, Header
 from msal import ConfidentialClientApplication, SerializableTokenCache
 from redis_client import redis_client
+import metrics
 
 # Azure AD設定
 CLIENT_ID = os.environ.get("CLIENT_ID")
@@ -11,6 +12,7 @@ CLIENT_SECRET = os.environ.get("CLIENT_SECRET")
 AUTHORITY = os.environ.get("AUTHORITY")
 SCOPE = ["https://graph.microsoft.com/.default"]
 
+@metrics.timed("redis")
 def get_ms_oid_from_session_cookie(session_cookie: str) -> Optional[str]:
     """
     Flaskのsession cookieからms_oidを取得
@@ -30,6 +32,7 @@ def get_ms_oid_from_session_cookie(session_cookie: str) -> Optional[str]:
     
     return None
 
+@metrics.timed("redis")
 def get_ms_oid_from_user_id(user_id: int) -> Optional[str]:
     """
     user_idからms_oidを取得（フォールバック）
@@ -46,6 +49,7 @@ def get_ms_oid_from_user_id(user_id: int) -> Optional[str]:
     
     return None
 
+@metrics.timed("redis")
 def get_token_info_from_redis(ms_oid: str) -> Optional[Dict]:
     """
     Redisからtoken_infoを取得（簡易版）
@@ -65,6 +69,7 @@ def get_token_info_from_redis(ms_oid: str) -> Optional[Dict]:
     
     return None
 
+@metrics.timed("redis")
 def get_msal_token_cache(ms_oid: str) -> Optional[SerializableTokenCache]:
     """
     RedisからMSAL token cacheを取得
@@ -138,7 +143,8 @@ def get_access_token_for_user(ms_oid: str) -> Optional[str]:
         if token_cache. has_state_changed:
             try:
                 cache_blob = token_cache.serialize()
-                redis_client.set(f"msal_cache:{ms_oid}", cache_blob, ex=60 * 60 * 8)
+                with metrics.track("redis", "set_msal_cache"):
+                    redis_client.set(f"msal_cache:{ms_oid}", cache_blob, ex=60 * 60 * 8)
                 print(f"✓ Updated MSAL cache in Redis for ms_oid: {ms_oid}")
             except Exception as e:
                 print(f"Failed to update MSAL cache: {e}")
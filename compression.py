@@ -0,0 +1,297 @@
+"""
+レスポンス圧縮モジュール (gzip / brotli)
+
+船上・造船所の回線から使うタブレット向けに、大きく繰り返しの多い JSON を
+Accept-Encoding に応じて圧縮します。
+
+- CompressionMiddleware: COMPRESSION_MIN_SIZE バイト以上のレスポンスを圧縮する
+  ASGI ミドルウェア。StreamingResponse（エクスポートなど）はチャンクごとに
+  逐次圧縮するので、全体をメモリに溜めない。SSE と圧縮済みのレスポンスは対象外
+- precompressed_response / cached_response: 船舶一覧のように更新が少なく頻繁に
+  読まれるレスポンスを、ETag をキーに圧縮済みのまま保持して使い回す
+圧縮したレスポンスの ETag には圧縮方式ごとの接尾辞を付けます (utils.encoded_etag)。
+brotli は brotli パッケージがインストールされている場合のみ使います。
+"""
+
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+from utils import encoded_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+PRECOMPRESSED_CACHE_SIZE = int(os.getenv("PRECOMPRESSED_CACHE_SIZE", 64))
+
+# 圧縮しない Content-Type（逐次配信が前提のもの・既に圧縮済みの形式）
+_SKIP_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip")
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Accept-Encoding から使用する圧縮方式を選ぶ（br を優先、q=0 は除外、* は未指定の方式すべて）"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """bytes を一括で圧縮する"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class _StreamCompressor:
+    """チャンクを逐次圧縮する（gzip は zlib の gzip ヘッダー付きモード）"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """Accept-Encoding に応じてレスポンスを gzip / brotli で圧縮する ASGI ミドルウェア"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = None
+        if_none_match = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+            elif name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            # 圧縮しない場合も、共有キャッシュが他のクライアントへ使い回さないよう Vary を付ける
+            async def send_with_vary(message):
+                if message["type"] == "http.response.start" and self._compressible(message):
+                    message = self._with_vary(message)
+                await send(message)
+
+            await self.app(scope, receive, send_with_vary)
+            return
+
+        start_message = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                if message["status"] == 304 and b"etag" in headers:
+                    # クライアントが圧縮版の ETag で確認してきた場合は同じ ETag を返す
+                    message = self._revalidated_start(message, encoding, if_none_match)
+                if not self._compressible(message) or message["status"] in (204, 304):
+                    passthrough = True
+                    if self._compressible(message):
+                        message = self._with_vary(message)
+                    await send(message)
+                    return
+                # 本文の最初のチャンクを見てから圧縮するか決める
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body:
+                    # 本文が1回で完結する場合は一括で圧縮（小さければそのまま）
+                    if len(body) < self.minimum_size:
+                        passthrough = True
+                        await send(self._with_vary(start_message))
+                        await send(message)
+                        return
+                    compressed = compress(body, encoding)
+                    await send(self._compressed_start(start_message, encoding, len(compressed)))
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                # ストリーミングは長さが分からないので逐次圧縮する
+                compressor = _StreamCompressor(encoding)
+                await send(self._compressed_start(start_message, encoding, None))
+
+            chunk = compressor.process(body)
+            if not more_body:
+                chunk += compressor.finish()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _compressible(message) -> bool:
+        """圧縮対象になり得るレスポンスか（圧縮済み・SSE・画像などは対象外）"""
+        headers = {name.lower(): value for name, value in message.get("headers", [])}
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        return b"content-encoding" not in headers and not content_type.startswith(_SKIP_CONTENT_TYPES)
+
+    @staticmethod
+    def _with_vary(message):
+        """Vary に Accept-Encoding を追加する"""
+        headers = [(name, value) for name, value in message.get("headers", []) if name.lower() != b"vary"]
+        vary = [value for name, value in message.get("headers", []) if name.lower() == b"vary"]
+        if not any(b"accept-encoding" in value.lower() for value in vary):
+            vary.append(b"Accept-Encoding")
+        headers.append((b"vary", b", ".join(vary)))
+        return {**message, "headers": headers}
+
+    @staticmethod
+    def _revalidated_start(message, encoding: str, if_none_match: str):
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        headers = []
+        for name, value in message.get("headers", []):
+            if name.lower() == b"etag":
+                tag = encoded_etag(value.decode("latin-1"), encoding)
+                if tag in candidates or tag.removeprefix("W/") in candidates:
+                    value = tag.encode("latin-1")
+            headers.append((name, value))
+        return {**message, "headers": headers}
+
+    @staticmethod
+    def _compressed_start(message, encoding: str, length: Optional[int]):
+        headers = [
+            (name, value) for name, value in message.get("headers", [])
+            if name.lower() not in (b"content-length", b"etag")
+        ]
+        for name, value in message.get("headers", []):
+            if name.lower() == b"etag":
+                headers.append((b"etag", encoded_etag(value.decode("latin-1"), encoding).encode("latin-1")))
+        headers.append((b"content-encoding", encoding.encode("latin-1")))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode("latin-1")))
+        return CompressionMiddleware._with_vary({**message, "headers": headers})
+
+
+class PrecompressedCache:
+    """(キー, 圧縮方式) -> 圧縮済み本文 の LRU キャッシュ"""
+
+    def __init__(self, max_entries: int = PRECOMPRESSED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, encoding: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get((key, encoding))
+            if body is not None:
+                self._entries.move_to_end((key, encoding))
+            return body
+
+    def set(self, key: str, encoding: str, body: bytes) -> None:
+        with self._lock:
+            self._entries[(key, encoding)] = body
+            self._entries.move_to_end((key, encoding))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+precompressed_cache = PrecompressedCache()
+
+
+def prime(key: str, body: bytes) -> None:
+    """起動時などに、本文を対応しているすべての圧縮方式でキャッシュへ入れておく"""
+    precompressed_cache.set(key, "identity", body)
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return
+    precompressed_cache.set(key, "gzip", compress(body, "gzip"))
+    if brotli is not None:
+        precompressed_cache.set(key, "br", compress(body, "br"))
+
+
+def _encoded_response(body: bytes, encoding: str, media_type: str, headers: Dict[str, str]) -> Response:
+    headers = dict(headers or {})
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+        if "ETag" in headers:
+            headers["ETag"] = encoded_etag(headers["ETag"], encoding)
+    headers["Vary"] = "Accept-Encoding"
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def cached_response(request: Request, key: str, media_type: str = "application/json",
+                    headers: Dict[str, str] = None) -> Optional[Response]:
+    """
+    キー（ETag など版を含む値）に対応する圧縮済みレスポンスがあれば返す
+
+    Returns:
+        Response: キャッシュがある場合。ない場合は None
+    """
+    encoding = choose_encoding(request.headers.get("accept-encoding")) or "identity"
+    body = precompressed_cache.get(key, encoding)
+    if body is None:
+        return None
+    return _encoded_response(body, encoding, media_type, headers)
+
+
+def precompressed_response(request: Request, key: str, body: bytes, media_type: str = "application/json",
+                           headers: Dict[str, str] = None) -> Response:
+    """
+    本文をクライアントの Accept-Encoding に合わせて圧縮し、キャッシュしてから返す
+
+    圧縮前の本文も "identity" として保持するので、他の圧縮方式の要求にも
+    クエリを実行せずに応えられる（precompressed_cache.get(key, "identity")）。
+    """
+    precompressed_cache.set(key, "identity", body)
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        encoding = "identity"
+    else:
+        body = compress(body, encoding)
+        precompressed_cache.set(key, encoding, body)
+    return _encoded_response(body, encoding, media_type, headers)
@@ -0,0 +1,98 @@
+"""
+pytest 共通設定・フィクスチャ
+
+DATABASE_URL を指定していない場合は、一時ディレクトリの SQLite に対してテストを実行します
+（ntb_data は database.py と同じく別ファイルとして ATTACH される）。
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='ntb-test-'), 'test.db')}"
+)
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+# API のテストでは Redis を使うレート制限を無効にする
+os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+
+import pytest
+
+import models
+from database import SessionLocal, engine
+from models import Base
+from query_counter import assert_max_queries
+
+
+@pytest.fixture
+def db():
+    """テストごとにテーブルを作り直したセッション"""
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def query_budget():
+    """テスト内で `with query_budget(n):` としてクエリ数の上限をチェックする"""
+    return assert_max_queries
+
+
+@pytest.fixture
+def owner(db):
+    """プロジェクトのオーナー (ms_id: oid-owner)"""
+    user = models.User(id=1, email="owner@example.com", name="Owner", ms_id="oid-owner")
+    db.add(user)
+    db.add(models.Ship(id=1, name="Ship"))
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def outsider(db):
+    """どのプロジェクトにも割り当てられていないユーザー (ms_id: oid-outsider)"""
+    user = models.User(id=2, email="outsider@example.com", name="Outsider", ms_id="oid-outsider")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def project(db, owner):
+    """owner のプロジェクト（タスク1件・Todo1件）"""
+    db_project = models.Project(name="Project", owner_id=owner.id, ship_id=1)
+    db.add(db_project)
+    db.flush()
+    task = models.Task(project_id=db_project.id, name="task")
+    db.add(task)
+    db.flush()
+    db.add(models.Todo(project_id=db_project.id, task_number=task.task_number, description="todo"))
+    db.commit()
+    return db_project
+
+
+@pytest.fixture
+def client(db):
+    """API のテストクライアント（X-Test-User ヘッダーの ms_oid でログインしたものとして扱う）"""
+    from fastapi import HTTPException, Request
+    from fastapi.testclient import TestClient
+
+    import main
+    from auth import get_current_user
+
+    def current_user(request: Request):
+        ms_oid = request.headers.get("x-test-user")
+        if not ms_oid:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return {"ms_oid": ms_oid, "access_token": "test-token"}
+
+    main.app.dependency_overrides[get_current_user] = current_user
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.pop(get_current_user, None)
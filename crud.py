@@ -1,14 +1,20 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from typing import Any, Dict, Iterator, List, Optional, Set, Union
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import and_, or_, func, update, delete, select, literal, union, union_all, exists, tuple_
 from datetime import datetime
+import base64
+import binascii
+import heapq
+import json
+from itertools import islice
 
 from models import (
     User, Role, UserHasRoles, Ship,
     Project, ProjectAssignment, Task, Todo,
     TaskAssignment, TodoAssignment,
     TaskAttachment, TodoAttachment,
-    TaskComment, TodoComment, ProjectPhoto
+    TaskComment, TodoComment, ProjectPhoto,
+    Tombstone, SYNC_MODELS, tombstone_insert_from_select
 )
 from schemas import (
     ProjectCreate, ProjectUpdate,
@@ -18,8 +24,52 @@ from schemas import (
     TaskAssignmentCreate, TodoAssignmentCreate,
     TaskAttachmentCreate, TodoAttachmentCreate,
     TaskCommentCreate, TodoCommentCreate,
-    ProjectPhotoCreate
+    ProjectPhotoCreate,
+    ProjectInDB, ProjectAssignmentInDB,
+    TaskInDB, TodoInDB,
+    TaskAssignmentInDB, TodoAssignmentInDB,
+    TaskAttachmentInDB, TodoAttachmentInDB,
+    TaskCommentInDB, TodoCommentInDB,
+    ProjectPhotoInDB,
+    BatchOperation
 )
+from events import queue_change
+
+# ===== 単一ステートメント更新・削除の共通処理 =====
+def _update_where(db: Session, model, criteria: list, values: Dict[str, Any],
+                  project_id: Optional[int] = None, key: Optional[Dict[str, Any]] = None) -> bool:
+    """SELECT せずに UPDATE ... WHERE を1文で実行し、対象行が存在したかを返す
+
+    ORM の flush イベントを経由しないため、変更通知は project_id を指定した場合に
+    events.queue_change で明示的に積む。
+    """
+    stmt = update(model).where(*criteria).execution_options(synchronize_session=False)
+    if values:
+        stmt = stmt.values(**values)
+    result = db.execute(stmt)
+    if result.rowcount > 0:
+        queue_change(db, project_id, model.__tablename__, "updated", key or {})
+    db.commit()
+    return result.rowcount > 0
+
+
+def _delete_where(db: Session, model, criteria: list,
+                  project_id: Optional[int] = None, key: Optional[Dict[str, Any]] = None) -> bool:
+    """SELECT せずに DELETE ... WHERE を1文で実行し、対象行が存在したかを返す
+
+    差分同期の対象モデルは、同じトランザクション内で INSERT ... SELECT により
+    Tombstone を先に記録する（ORM の after_delete イベントが発火しないため）。
+    変更通知は project_id を指定した場合のみ送る。
+    """
+    if model in SYNC_MODELS:
+        db.execute(tombstone_insert_from_select(model, criteria))
+    stmt = delete(model).where(*criteria).execution_options(synchronize_session=False)
+    result = db.execute(stmt)
+    if result.rowcount > 0:
+        queue_change(db, project_id, model.__tablename__, "deleted", key or {})
+    db.commit()
+    return result.rowcount > 0
+
 
 # ===== User CRUD (読み取り専用 - ntb_data テーブル) =====
 def get_user(db: Session, user_id: int) -> Optional[User]:
@@ -32,11 +82,36 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
 
 
+def get_user_by_ms_id(db: Session, ms_id: str) -> Optional[User]:
+    """ユーザーを Microsoft ID (ms_oid) で取得 (ntb_data.users)"""
+    return db.query(User).filter(User.ms_id == ms_id).first()
+
+
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
     """ユーザー一覧を取得 (ntb_data.users)"""
     return db.query(User).offset(skip).limit(limit).all()
 
 
+def _version_columns(model, key_column) -> tuple:
+    """ETag 用の版を求める集計列
+
+    updated_at は秒単位のため、最大値と件数だけでは同じ秒に別の行が更新されても
+    版が変わらない。updated_at（UNIX 時刻）と主キーの合計を加えて検出する。
+    同じ行を同じ秒に2回更新した場合は区別できないので、ETag は弱い ETag にする。
+    """
+    return (
+        func.max(model.updated_at),
+        func.count(),
+        func.sum(key_column),
+        func.sum(func.unix_timestamp(model.updated_at)),
+    )
+
+
+def get_users_version(db: Session) -> tuple:
+    """ETag 用にユーザー一覧の版を取得"""
+    return tuple(db.query(*_version_columns(User, User.id)).one())
+
+
 # ===== Ship CRUD (読み取り専用 - ntb_data テーブル) =====
 def get_ship(db: Session, ship_id: int) -> Optional[Ship]:
     """船舶をIDで取得 (ntb_data.ships)"""
@@ -48,6 +123,11 @@ def get_ships(db: Session, skip: int = 0, limit: int = 100) -> List[Ship]:
     return db.query(Ship).offset(skip).limit(limit).all()
 
 
+def get_ships_version(db: Session) -> tuple:
+    """ETag 用に船舶一覧の版を取得"""
+    return tuple(db.query(*_version_columns(Ship, Ship.id)).one())
+
+
 # ===== Role CRUD (読み取り専用 - ntb_data テーブル) =====
 def get_role(db: Session, role_id: int) -> Optional[Role]:
     """ロールをIDで取得 (ntb_data.roles)"""
@@ -80,6 +160,81 @@ def get_project(db: Session, project_id: int) -> Optional[Project]:
     return db.query(Project).filter(Project.id == project_id).first()
 
 
+def get_project_tree(db: Session, project_id: int) -> Optional[Project]:
+    """プロジェクトを船舶・オーナー・タスク・Todo・担当者・添付ファイル込みで取得
+
+    リレーションは selectinload でまとめて読み込み、コメント件数は
+    集計クエリ2本で取得するため、タスク・Todo の件数に関係なく
+    クエリ数は一定になる。
+    """
+    db_project = db.query(Project).options(
+        joinedload(Project.ship),
+        joinedload(Project.owner),
+        selectinload(Project.tasks).selectinload(Task.assignments),
+        selectinload(Project.tasks).selectinload(Task.attachments),
+        selectinload(Project.tasks).selectinload(Task.todos).selectinload(Todo.assignments),
+        selectinload(Project.tasks).selectinload(Task.todos).selectinload(Todo.attachments),
+    ).filter(Project.id == project_id).first()
+    if db_project is None:
+        return None
+
+    task_comment_counts = dict(
+        db.query(TaskComment.task_number, func.count(TaskComment.id))
+        .filter(TaskComment.project_id == project_id)
+        .group_by(TaskComment.task_number)
+        .all()
+    )
+    todo_comment_counts = {
+        (task_number, todo_number): count
+        for task_number, todo_number, count in db.query(
+            TodoComment.task_number, TodoComment.todo_number, func.count(TodoComment.id)
+        )
+        .filter(TodoComment.project_id == project_id)
+        .group_by(TodoComment.task_number, TodoComment.todo_number)
+        .all()
+    }
+
+    # コメント件数はマップされていない属性としてインスタンスに載せ、
+    # schemas.ProjectTree の from_attributes でそのまま読めるようにする
+    for db_task in db_project.tasks:
+        db_task.comment_count = task_comment_counts.get(db_task.task_number, 0)
+        for db_todo in db_task.todos:
+            db_todo.comment_count = todo_comment_counts.get(
+                (db_todo.task_number, db_todo.todo_number), 0
+            )
+    return db_project
+
+
+def get_project_tree_version(db: Session, project_id: int) -> Optional[tuple]:
+    """ETag 用にプロジェクトツリーの版を1クエリで取得
+
+    プロジェクト本体・船舶・オーナーと、ツリーに含まれる各テーブルについて
+    _version_columns の集計を UNION ALL でまとめて返す。
+    件数を含めるので、子レコードの削除も版の変化として検出できる。
+    プロジェクトが存在しない場合は None を返す。
+    """
+    project_ship_id = select(Project.ship_id).where(Project.id == project_id).scalar_subquery()
+    project_owner_id = select(Project.owner_id).where(Project.id == project_id).scalar_subquery()
+    parts = [
+        select(literal(0), *_version_columns(Project, Project.id)).where(Project.id == project_id),
+        select(literal(1), *_version_columns(Ship, Ship.id)).where(Ship.id == project_ship_id),
+        select(literal(2), *_version_columns(User, User.id)).where(User.id == project_owner_id),
+    ]
+    for i, (model, key_column) in enumerate((
+        (Task, Task.task_number), (Todo, Todo.todo_number),
+        (TaskAssignment, TaskAssignment.id), (TodoAssignment, TodoAssignment.id),
+        (TaskAttachment, TaskAttachment.id), (TodoAttachment, TodoAttachment.id),
+        (TaskComment, TaskComment.id), (TodoComment, TodoComment.id),
+    ), start=3):
+        parts.append(
+            select(literal(i), *_version_columns(model, key_column)).where(model.project_id == project_id)
+        )
+    rows = sorted(tuple(row) for row in db.execute(union_all(*parts)).all())
+    if not rows or rows[0][2] == 0:
+        return None
+    return tuple(rows)
+
+
 def get_projects(db: Session, skip: int = 0, limit: int = 100) -> List[Project]:
     """プロジェクト一覧を取得"""
     return db.query(Project).offset(skip).limit(limit).all()
@@ -116,6 +271,23 @@ def delete_project(db: Session, project_id: int) -> bool:
     return True
 
 
+def update_project_direct(db: Session, project_id: int, project_update: ProjectUpdate,
+                          reread: bool = False) -> Union[bool, Optional[Project]]:
+    """プロジェクトを UPDATE 1文で更新（reread=True の場合のみ更新後の行を再取得して返す）"""
+    updated = _update_where(db, Project, [Project.id == project_id],
+                            project_update.model_dump(exclude_unset=True),
+                            project_id=project_id, key={"id": project_id})
+    if not reread:
+        return updated
+    return get_project(db, project_id) if updated else None
+
+
+def delete_project_direct(db: Session, project_id: int) -> bool:
+    """プロジェクトを DELETE 1文で削除"""
+    return _delete_where(db, Project, [Project.id == project_id],
+                         project_id=project_id, key={"id": project_id})
+
+
 # ===== ProjectAssignment CRUD =====
 def create_project_assignment(db: Session, assignment: ProjectAssignmentCreate) -> ProjectAssignment:
     """プロジェクト担当者を追加"""
@@ -142,6 +314,12 @@ def delete_project_assignment(db: Session, assignment_id: int) -> bool:
     return True
 
 
+def delete_project_assignment_direct(db: Session, assignment_id: int, project_id: Optional[int] = None) -> bool:
+    """プロジェクト担当者を DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, ProjectAssignment, [ProjectAssignment.id == assignment_id],
+                         project_id=project_id, key={"id": assignment_id})
+
+
 # ===== Task CRUD =====
 def create_task(db: Session, task: TaskCreate) -> Task:
     """タスクを作成"""
@@ -190,6 +368,25 @@ def delete_task(db: Session, project_id: int, task_number: int) -> bool:
     return True
 
 
+def update_task_direct(db: Session, project_id: int, task_number: int, task_update: TaskUpdate,
+                       reread: bool = False) -> Union[bool, Optional[Task]]:
+    """タスクを UPDATE 1文で更新（reread=True の場合のみ更新後の行を再取得して返す）"""
+    updated = _update_where(db, Task, [Task.project_id == project_id, Task.task_number == task_number],
+                            task_update.model_dump(exclude_unset=True),
+                            project_id=project_id,
+                            key={"project_id": project_id, "task_number": task_number})
+    if not reread:
+        return updated
+    return get_task(db, project_id, task_number) if updated else None
+
+
+def delete_task_direct(db: Session, project_id: int, task_number: int) -> bool:
+    """タスクを DELETE 1文で削除"""
+    return _delete_where(db, Task, [Task.project_id == project_id, Task.task_number == task_number],
+                         project_id=project_id,
+                         key={"project_id": project_id, "task_number": task_number})
+
+
 # ===== Todo CRUD =====
 def create_todo(db: Session, todo: TodoCreate) -> Todo:
     """Todoを作成"""
@@ -244,6 +441,30 @@ def delete_todo(db: Session, project_id: int, task_number: int, todo_number: int
     return True
 
 
+def update_todo_direct(db: Session, project_id: int, task_number: int, todo_number: int,
+                       todo_update: TodoUpdate, reread: bool = False) -> Union[bool, Optional[Todo]]:
+    """Todoを UPDATE 1文で更新（reread=True の場合のみ更新後の行を再取得して返す）"""
+    updated = _update_where(db, Todo, [
+        Todo.project_id == project_id,
+        Todo.task_number == task_number,
+        Todo.todo_number == todo_number,
+    ], todo_update.model_dump(exclude_unset=True), project_id=project_id,
+        key={"project_id": project_id, "task_number": task_number, "todo_number": todo_number})
+    if not reread:
+        return updated
+    return get_todo(db, project_id, task_number, todo_number) if updated else None
+
+
+def delete_todo_direct(db: Session, project_id: int, task_number: int, todo_number: int) -> bool:
+    """Todoを DELETE 1文で削除"""
+    return _delete_where(db, Todo, [
+        Todo.project_id == project_id,
+        Todo.task_number == task_number,
+        Todo.todo_number == todo_number,
+    ], project_id=project_id,
+        key={"project_id": project_id, "task_number": task_number, "todo_number": todo_number})
+
+
 def complete_todo(db: Session, project_id: int, task_number: int, todo_number: int) -> Optional[Todo]:
     """Todoを完了にする"""
     db_todo = get_todo(db, project_id, task_number, todo_number)
@@ -284,6 +505,12 @@ def delete_task_assignment(db: Session, assignment_id: int) -> bool:
     return True
 
 
+def delete_task_assignment_direct(db: Session, assignment_id: int, project_id: Optional[int] = None) -> bool:
+    """タスク担当者を DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, TaskAssignment, [TaskAssignment.id == assignment_id],
+                         project_id=project_id, key={"id": assignment_id})
+
+
 # ===== TodoAssignment CRUD =====
 def create_todo_assignment(db: Session, assignment: TodoAssignmentCreate) -> TodoAssignment:
     """Todo担当者を追加"""
@@ -316,6 +543,12 @@ def delete_todo_assignment(db: Session, assignment_id: int) -> bool:
     return True
 
 
+def delete_todo_assignment_direct(db: Session, assignment_id: int, project_id: Optional[int] = None) -> bool:
+    """Todo担当者を DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, TodoAssignment, [TodoAssignment.id == assignment_id],
+                         project_id=project_id, key={"id": assignment_id})
+
+
 # ===== TaskAttachment CRUD =====
 def create_task_attachment(db: Session, attachment: TaskAttachmentCreate) -> TaskAttachment:
     """タスク添付ファイルを追加"""
@@ -344,6 +577,12 @@ def delete_task_attachment(db: Session, attachment_id: int) -> bool:
     return True
 
 
+def delete_task_attachment_direct(db: Session, attachment_id: int, project_id: Optional[int] = None) -> bool:
+    """タスク添付ファイルを DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, TaskAttachment, [TaskAttachment.id == attachment_id],
+                         project_id=project_id, key={"id": attachment_id})
+
+
 # ===== TodoAttachment CRUD =====
 def create_todo_attachment(db: Session, attachment: TodoAttachmentCreate) -> TodoAttachment:
     """Todo添付ファイルを追加"""
@@ -376,6 +615,12 @@ def delete_todo_attachment(db: Session, attachment_id: int) -> bool:
     return True
 
 
+def delete_todo_attachment_direct(db: Session, attachment_id: int, project_id: Optional[int] = None) -> bool:
+    """Todo添付ファイルを DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, TodoAttachment, [TodoAttachment.id == attachment_id],
+                         project_id=project_id, key={"id": attachment_id})
+
+
 # ===== TaskComment CRUD =====
 def create_task_comment(db: Session, comment: TaskCommentCreate) -> TaskComment:
     """タスクコメントを追加"""
@@ -404,6 +649,12 @@ def delete_task_comment(db: Session, comment_id: int) -> bool:
     return True
 
 
+def delete_task_comment_direct(db: Session, comment_id: int, project_id: Optional[int] = None) -> bool:
+    """タスクコメントを DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, TaskComment, [TaskComment.id == comment_id],
+                         project_id=project_id, key={"id": comment_id})
+
+
 # ===== TodoComment CRUD =====
 def create_todo_comment(db: Session, comment: TodoCommentCreate) -> TodoComment:
     """Todoコメントを追加"""
@@ -436,6 +687,12 @@ def delete_todo_comment(db: Session, comment_id: int) -> bool:
     return True
 
 
+def delete_todo_comment_direct(db: Session, comment_id: int, project_id: Optional[int] = None) -> bool:
+    """Todoコメントを DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, TodoComment, [TodoComment.id == comment_id],
+                         project_id=project_id, key={"id": comment_id})
+
+
 # ===== ProjectPhoto CRUD =====
 def create_project_photo(db: Session, photo: ProjectPhotoCreate) -> ProjectPhoto:
     """プロジェクト写真を追加"""
@@ -469,3 +726,546 @@ def delete_project_photo(db: Session, photo_id: int) -> bool:
     db.delete(db_photo)
     db.commit()
     return True
+
+
+def delete_project_photo_direct(db: Session, photo_id: int, project_id: Optional[int] = None) -> bool:
+    """プロジェクト写真を DELETE 1文で削除（project_id を指定した場合はそのプロジェクトへ変更通知を送る）"""
+    return _delete_where(db, ProjectPhoto, [ProjectPhoto.id == photo_id],
+                         project_id=project_id, key={"id": photo_id})
+
+
+
+# ===== My work (担当者本人の未完了一覧) =====
+def get_open_todos_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Todo]:
+    """ユーザーに割り当てられた未完了Todoを全プロジェクト横断で取得
+
+    ix_todo_assignments_user_todo (user_id, project_id, task_number, todo_number) の
+    順に並べるため、ソートなしの1回のインデックス範囲走査で済む。
+    """
+    return db.query(Todo).join(TodoAssignment, and_(
+        TodoAssignment.project_id == Todo.project_id,
+        TodoAssignment.task_number == Todo.task_number,
+        TodoAssignment.todo_number == Todo.todo_number,
+    )).filter(
+        TodoAssignment.user_id == user_id,
+        Todo.is_completed.is_(None),
+    ).order_by(
+        TodoAssignment.project_id, TodoAssignment.task_number, TodoAssignment.todo_number
+    ).offset(skip).limit(limit).all()
+
+
+def get_open_tasks_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Task]:
+    """ユーザーに割り当てられた未完了タスク（未完了Todoを持つタスク）を全プロジェクト横断で取得
+
+    ix_task_assignments_user_task (user_id, project_id, task_number) の順に並べる。
+    """
+    open_todo = exists().where(
+        Todo.project_id == Task.project_id,
+        Todo.task_number == Task.task_number,
+        Todo.is_completed.is_(None),
+    )
+    return db.query(Task).join(TaskAssignment, and_(
+        TaskAssignment.project_id == Task.project_id,
+        TaskAssignment.task_number == Task.task_number,
+    )).filter(
+        TaskAssignment.user_id == user_id,
+        open_todo,
+    ).order_by(
+        TaskAssignment.project_id, TaskAssignment.task_number
+    ).offset(skip).limit(limit).all()
+
+
+# ===== Timeline (コメント・添付ファイル・写真の時系列) =====
+# 種別 -> (モデル, 本文として返す列)
+TIMELINE_SOURCES = {
+    "photo": (ProjectPhoto, {"file_id": "file_id", "title": "category", "content": "description"}),
+    "task_attachment": (TaskAttachment, {"file_id": "file_id", "title": "title", "content": "originname"}),
+    "task_comment": (TaskComment, {"content": "content"}),
+    "todo_attachment": (TodoAttachment, {"file_id": "file_id", "title": "title", "content": "originname"}),
+    "todo_comment": (TodoComment, {"content": "content"}),
+}
+
+
+def encode_timeline_cursor(entry: Dict[str, Any]) -> str:
+    """タイムラインの位置 (created_at, kind, id) をカーソル文字列にする"""
+    return f"{entry['created_at'].isoformat()}|{entry['kind']}|{entry['id']}"
+
+
+def decode_timeline_cursor(cursor: str) -> tuple:
+    """カーソル文字列を (created_at, kind, id) に戻す（不正な場合は ValueError）"""
+    created_at, kind, entry_id = cursor.split("|")
+    if kind not in TIMELINE_SOURCES:
+        raise ValueError(f"Unknown timeline kind: {kind}")
+    return datetime.fromisoformat(created_at), kind, int(entry_id)
+
+
+def _timeline_source(db: Session, kind: str, project_id: int,
+                     cursor: Optional[tuple], limit: int) -> List[Dict[str, Any]]:
+    """1種別分を (created_at, id) の降順でカーソルより後ろから最大 limit 件取得"""
+    model, fields = TIMELINE_SOURCES[kind]
+    query = db.query(model).filter(model.project_id == project_id)
+    if cursor is not None:
+        # 並び順は (created_at, kind, id) の降順。kind はこの種別で固定なので、
+        # カーソルの kind との大小で同時刻の行を含めるかが決まる
+        cursor_at, cursor_kind, cursor_id = cursor
+        if kind < cursor_kind:
+            query = query.filter(model.created_at <= cursor_at)
+        elif kind == cursor_kind:
+            query = query.filter(or_(
+                model.created_at < cursor_at,
+                and_(model.created_at == cursor_at, model.id < cursor_id),
+            ))
+        else:
+            query = query.filter(model.created_at < cursor_at)
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit).all()
+
+    entries = []
+    for row in rows:
+        entry = {
+            "kind": kind,
+            "id": row.id,
+            "project_id": row.project_id,
+            "task_number": row.task_number,
+            "todo_number": getattr(row, "todo_number", None),
+            "user_id": row.user_id,
+            "created_at": row.created_at,
+            "file_id": None,
+            "title": None,
+            "content": None,
+        }
+        for name, attr in fields.items():
+            entry[name] = getattr(row, attr)
+        entries.append(entry)
+    return entries
+
+
+def get_project_timeline(db: Session, project_id: int, cursor: Optional[str] = None,
+                         limit: int = 50) -> Dict[str, Any]:
+    """タスク・Todoのコメント、添付ファイル、写真を新しい順にまとめたタイムラインを取得
+
+    各テーブルから (project_id, created_at) インデックスでカーソル以降を最大 limit 件ずつ読み、
+    heapq.merge で k-way マージして先頭 limit 件を返す。コメント履歴全体は読み込まない。
+
+    Returns:
+        dict: items と、続きがある場合の next_cursor
+    """
+    position = decode_timeline_cursor(cursor) if cursor else None
+    sources = [
+        _timeline_source(db, kind, project_id, position, limit)
+        for kind in TIMELINE_SOURCES
+    ]
+    merged = heapq.merge(
+        *sources,
+        key=lambda entry: (entry["created_at"], entry["kind"], entry["id"]),
+        reverse=True,
+    )
+    items = list(islice(merged, limit))
+    next_cursor = encode_timeline_cursor(items[-1]) if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+# ===== Sync (updated_at による差分同期) =====
+# レスポンスのキー -> モデル
+SYNC_ENTITIES = {
+    "projects": Project,
+    "tasks": Task,
+    "todos": Todo,
+    "task_comments": TaskComment,
+    "todo_comments": TodoComment,
+    "task_attachments": TaskAttachment,
+    "todo_attachments": TodoAttachment,
+    "photos": ProjectPhoto,
+}
+
+
+def encode_sync_cursor(positions: Dict[str, tuple]) -> str:
+    """テーブルごとの位置 {名前: (更新日時, 主キー)} をカーソル文字列にする
+
+    主キーが None の位置（以前の形式のカーソルから進んでいないテーブル）は、その日時以上から読む。
+    """
+    payload = {
+        name: [at.isoformat(), list(key) if key is not None else None]
+        for name, (at, key) in positions.items()
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+
+
+def decode_sync_cursor(cursor: str) -> Dict[str, tuple]:
+    """カーソル文字列を {名前: (更新日時, 主キー)} に戻す（不正な場合は ValueError）
+
+    以前の形式（ISO 8601 の日時だけ）も受け付け、全テーブルをその日時「以上」から読む。
+    """
+    try:
+        since = datetime.fromisoformat(cursor)
+    except ValueError:
+        pass
+    else:
+        return {name: (since, None) for name in [*SYNC_ENTITIES, "tombstones"]}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            name: (datetime.fromisoformat(at), tuple(key) if key is not None else None)
+            for name, (at, key) in payload.items()
+            if name in SYNC_ENTITIES or name == "tombstones"
+        }
+    except (TypeError, AttributeError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid sync cursor: {e}")
+
+
+def get_changes_since(db: Session, since: Optional[str] = None,
+                      project_id: Optional[int] = None, limit: int = 1000,
+                      user_id: Optional[int] = None) -> Dict[str, Any]:
+    """since（前回の cursor）以降に作成・更新・削除されたレコードを取得
+
+    各テーブルを (updated_at, 主キー) の昇順に、前回の位置より後ろから最大 limit 件返す。
+    位置はテーブルごとに (updated_at, 主キー) で持つので、同じ時刻の行が
+    limit 件を超えても取りこぼし・重複なく進む（一括更新・インポート直後など）。
+    削除は tombstones から (deleted_at, id) の順で返す。
+    user_id を指定した場合は、そのユーザーがアクセスできるプロジェクトの行だけを返す。
+    削除済みプロジェクトの tombstones は担当者の記録も消えているため、
+    プロジェクトが存在しなくなったものは返す（中身は主キーのみ）。
+
+    Returns:
+        dict: 各エンティティの一覧、tombstones、次回用の cursor、has_more
+
+    Raises:
+        ValueError: since が不正な場合
+    """
+    positions = decode_sync_cursor(since) if since else {}
+    changes: Dict[str, Any] = {}
+    truncated = False
+
+    def collect(name, query, column, key_columns):
+        nonlocal truncated
+        position = positions.get(name)
+        if position is not None:
+            at, key = position
+            if key is None:
+                query = query.filter(column >= at)
+            else:
+                query = query.filter(tuple_(column, *key_columns) > tuple_(at, *key))
+        rows = query.order_by(column, *key_columns).limit(limit).all()
+        changes[name] = rows
+        if rows:
+            last = rows[-1]
+            positions[name] = (
+                getattr(last, column.key),
+                tuple(getattr(last, key_column.key) for key_column in key_columns),
+            )
+            if len(rows) == limit:
+                truncated = True
+
+    for name, model in SYNC_ENTITIES.items():
+        query = db.query(model)
+        project_column = model.id if model is Project else model.project_id
+        if project_id is not None:
+            query = query.filter(project_column == project_id)
+        if user_id is not None:
+            query = query.filter(project_column.in_(accessible_project_ids(user_id)))
+        collect(name, query, model.updated_at, list(model.__table__.primary_key.columns))
+
+    query = db.query(Tombstone)
+    if project_id is not None:
+        query = query.filter(Tombstone.project_id == project_id)
+    if user_id is not None:
+        query = query.filter(or_(
+            Tombstone.project_id.in_(accessible_project_ids(user_id)),
+            ~exists().where(Project.id == Tombstone.project_id),
+        ))
+    collect("tombstones", query, Tombstone.deleted_at, [Tombstone.id])
+
+    changes["cursor"] = encode_sync_cursor(positions) if positions else None
+    changes["has_more"] = truncated
+    return changes
+
+
+# ===== Workload (担当者別の未完了件数集計) =====
+def get_workload(db: Session, project_id: Optional[int] = None,
+                 start_from: Optional[datetime] = None,
+                 start_to: Optional[datetime] = None,
+                 user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """担当者ごとの未完了Todo件数・未完了タスク件数・最古の開始日時を集計
+
+    集計は GROUP BY user_id の2クエリで MySQL 側で行い、ユーザー単位の
+    集計結果（1ユーザー1行）だけを受け取ってマージする。
+    未完了タスクは「未完了の Todo を1件以上持つタスク」とする。
+    start_from / start_to は Todo.start に対する絞り込み。
+    user_id を指定した場合は、そのユーザーがアクセスできるプロジェクトだけを集計する。
+    """
+    todo_join = and_(
+        TodoAssignment.project_id == Todo.project_id,
+        TodoAssignment.task_number == Todo.task_number,
+        TodoAssignment.todo_number == Todo.todo_number,
+    )
+    todo_filters = [Todo.is_completed.is_(None)]
+    if project_id is not None:
+        todo_filters.append(TodoAssignment.project_id == project_id)
+    if user_id is not None:
+        todo_filters.append(TodoAssignment.project_id.in_(accessible_project_ids(user_id)))
+    if start_from is not None:
+        todo_filters.append(Todo.start >= start_from)
+    if start_to is not None:
+        todo_filters.append(Todo.start < start_to)
+
+    todo_rows = db.query(
+        TodoAssignment.user_id,
+        func.count(TodoAssignment.id),
+        func.min(Todo.start),
+    ).join(Todo, todo_join).filter(*todo_filters).group_by(TodoAssignment.user_id).all()
+
+    open_todo_filters = [
+        Todo.project_id == TaskAssignment.project_id,
+        Todo.task_number == TaskAssignment.task_number,
+        Todo.is_completed.is_(None),
+    ]
+    if start_from is not None:
+        open_todo_filters.append(Todo.start >= start_from)
+    if start_to is not None:
+        open_todo_filters.append(Todo.start < start_to)
+    task_filters = [exists().where(*open_todo_filters)]
+    if project_id is not None:
+        task_filters.append(TaskAssignment.project_id == project_id)
+    if user_id is not None:
+        task_filters.append(TaskAssignment.project_id.in_(accessible_project_ids(user_id)))
+
+    task_rows = db.query(
+        TaskAssignment.user_id,
+        func.count(TaskAssignment.id),
+    ).filter(*task_filters).group_by(TaskAssignment.user_id).all()
+
+    workload: Dict[int, Dict[str, Any]] = {}
+    for user_id, open_todos, oldest_start in todo_rows:
+        workload[user_id] = {
+            "user_id": user_id,
+            "open_todos": open_todos,
+            "open_tasks": 0,
+            "oldest_start": oldest_start,
+        }
+    for user_id, open_tasks in task_rows:
+        entry = workload.setdefault(user_id, {
+            "user_id": user_id,
+            "open_todos": 0,
+            "open_tasks": 0,
+            "oldest_start": None,
+        })
+        entry["open_tasks"] = open_tasks
+    return sorted(workload.values(), key=lambda entry: entry["user_id"])
+
+
+# ===== Export (サーバーサイドカーソルでのストリーミング読み出し) =====
+EXPORT_MODELS = {
+    "projects": Project,
+    "tasks": Task,
+    "todos": Todo,
+}
+
+
+def get_export_columns(entity: str) -> List[str]:
+    """エクスポート対象テーブルの列名一覧を取得"""
+    return [column.key for column in EXPORT_MODELS[entity].__table__.columns]
+
+
+def iter_export_rows(db: Session, entity: str, project_id: Optional[int] = None,
+                     batch_size: int = 1000, user_id: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """エクスポート対象テーブルの行を1行ずつ返す
+
+    user_id を指定した場合は、そのユーザーがアクセスできるプロジェクトの行だけを返す。
+    yield_per によりサーバーサイドカーソル (stream_results) で batch_size 行ずつ
+    取得するため、件数に関係なくメモリ使用量は一定になる。
+    ORM インスタンスは作らず列の値をそのまま dict で返す。
+    """
+    table = EXPORT_MODELS[entity].__table__
+    stmt = select(table).order_by(*table.primary_key.columns)
+    project_column = table.c.id if entity == "projects" else table.c.project_id
+    if project_id is not None:
+        stmt = stmt.where(project_column == project_id)
+    if user_id is not None:
+        stmt = stmt.where(project_column.in_(accessible_project_ids(user_id)))
+
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    try:
+        for row in result.mappings():
+            yield dict(row)
+    finally:
+        result.close()
+
+
+# ===== Batch (1トランザクションでの一括更新) =====
+# 操作名 -> (入力スキーマ, モデル, 出力スキーマ)
+_BATCH_CREATE = {
+    "create_project": (ProjectCreate, Project, ProjectInDB),
+    "create_project_assignment": (ProjectAssignmentCreate, ProjectAssignment, ProjectAssignmentInDB),
+    "create_task": (TaskCreate, Task, TaskInDB),
+    "create_todo": (TodoCreate, Todo, TodoInDB),
+    "create_task_assignment": (TaskAssignmentCreate, TaskAssignment, TaskAssignmentInDB),
+    "create_todo_assignment": (TodoAssignmentCreate, TodoAssignment, TodoAssignmentInDB),
+    "create_task_attachment": (TaskAttachmentCreate, TaskAttachment, TaskAttachmentInDB),
+    "create_todo_attachment": (TodoAttachmentCreate, TodoAttachment, TodoAttachmentInDB),
+    "create_task_comment": (TaskCommentCreate, TaskComment, TaskCommentInDB),
+    "create_todo_comment": (TodoCommentCreate, TodoComment, TodoCommentInDB),
+    "create_project_photo": (ProjectPhotoCreate, ProjectPhoto, ProjectPhotoInDB),
+}
+
+# 操作名 -> (モデル, 主キー名, 入力スキーマ, 出力スキーマ)
+_BATCH_UPDATE = {
+    "update_project": (Project, ("project_id",), ProjectUpdate, ProjectInDB),
+    "update_task": (Task, ("project_id", "task_number"), TaskUpdate, TaskInDB),
+    "update_todo": (Todo, ("project_id", "task_number", "todo_number"), TodoUpdate, TodoInDB),
+    "complete_todo": (Todo, ("project_id", "task_number", "todo_number"), None, TodoInDB),
+}
+
+# 操作名 -> (モデル, 主キー名)
+_BATCH_DELETE = {
+    "delete_project": (Project, ("project_id",)),
+    "delete_project_assignment": (ProjectAssignment, ("assignment_id",)),
+    "delete_task": (Task, ("project_id", "task_number")),
+    "delete_todo": (Todo, ("project_id", "task_number", "todo_number")),
+    "delete_task_assignment": (TaskAssignment, ("assignment_id",)),
+    "delete_todo_assignment": (TodoAssignment, ("assignment_id",)),
+    "delete_task_attachment": (TaskAttachment, ("attachment_id",)),
+    "delete_todo_attachment": (TodoAttachment, ("attachment_id",)),
+    "delete_task_comment": (TaskComment, ("comment_id",)),
+    "delete_todo_comment": (TodoComment, ("comment_id",)),
+    "delete_project_photo": (ProjectPhoto, ("photo_id",)),
+}
+
+
+def _resolve_batch_refs(value: Any, results: Dict[str, Any], declared: set) -> Any:
+    """"$参照名.フィールド" 形式の値を先行操作の結果で置き換える
+
+    参照名がバッチ内の操作の ref として宣言されていない文字列（"$100 budget" など）は
+    そのまま値として扱う。"$$" で始まる文字列は先頭の "$" を1つ外した値になる。
+    """
+    if isinstance(value, dict):
+        return {k: _resolve_batch_refs(v, results, declared) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve_batch_refs(v, results, declared) for v in value]
+    if isinstance(value, str) and value.startswith("$$"):
+        return value[1:]
+    if isinstance(value, str) and value.startswith("$"):
+        ref, _, field = value[1:].partition(".")
+        if ref not in declared:
+            return value
+        if ref not in results:
+            raise ValueError(f"Batch reference to a later operation: {value}")
+        result = results[ref]
+        if not field:
+            return result
+        if not isinstance(result, dict) or field not in result:
+            raise ValueError(f"Unknown batch reference field: {value}")
+        return result[field]
+    return value
+
+
+def _batch_identity(model, key_names, key: Dict[str, Any]) -> tuple:
+    """操作の key から Session.get 用の主キーを組み立てる"""
+    missing = [name for name in key_names if name not in key]
+    if missing:
+        raise ValueError(f"Missing key for {model.__tablename__}: {', '.join(missing)}")
+    return tuple(key[name] for name in key_names)
+
+
+def can_access_project(db: Session, project_id: int, user_id: int) -> bool:
+    """ユーザーがプロジェクトのオーナーか、プロジェクトに割り当てられているか"""
+    owned = exists().where(Project.id == project_id, Project.owner_id == user_id)
+    assigned = exists().where(
+        ProjectAssignment.project_id == project_id, ProjectAssignment.user_id == user_id
+    )
+    return bool(db.query(or_(owned, assigned)).scalar())
+
+
+def filter_accessible_projects(db: Session, project_ids: List[int], user_id: int) -> Set[int]:
+    """project_ids のうち、ユーザーがアクセスできるプロジェクトIDだけを返す"""
+    rows = db.query(Project.id).filter(
+        Project.id.in_(project_ids),
+        Project.id.in_(accessible_project_ids(user_id)),
+    ).all()
+    return {project_id for project_id, in rows}
+
+
+def accessible_project_ids(user_id: int):
+    """ユーザーがオーナーまたは担当者のプロジェクトIDの副問い合わせ（IN 句で使う）"""
+    return union(
+        select(Project.id).where(Project.owner_id == user_id),
+        select(ProjectAssignment.project_id).where(ProjectAssignment.user_id == user_id),
+    )
+
+
+def _check_batch_access(db: Session, operation: str, db_obj, user_id: int, allowed: set) -> None:
+    """操作対象の行が属するプロジェクトにユーザーがアクセスできなければ PermissionError"""
+    project_id = db_obj.id if isinstance(db_obj, Project) else db_obj.project_id
+    if project_id in allowed:
+        return
+    if project_id is None or not can_access_project(db, project_id, user_id):
+        raise PermissionError(f"{operation}: access denied to project {project_id}")
+    allowed.add(project_id)
+
+
+def execute_batch(db: Session, operations: List[BatchOperation], user_id: int) -> List[Dict[str, Any]]:
+    """複数の作成・更新・削除を1トランザクションで実行し、結果をまとめて返す
+
+    各操作の後に flush のみ行い、task_number / todo_number などの採番結果を
+    後続の操作から "$参照名.フィールド" で参照できるようにする（"$" で始まる
+    通常の文字列は、参照名が宣言されていなければそのまま、"$$" で始めれば確実に値として扱う）。
+    commit は最後に1回だけ行い、途中で失敗した場合はすべてロールバックする。
+    存在しない対象を更新・削除しようとした場合は LookupError を、
+    user_id がオーナーでも担当者でもないプロジェクトの行を操作しようとした場合は
+    PermissionError を送出する（プロジェクトの作成は owner_id が user_id の場合のみ）。
+    """
+    results: List[Dict[str, Any]] = []
+    results_by_ref: Dict[str, Any] = {}
+    declared = {operation.ref for operation in operations if operation.ref}
+    # アクセスを確認済みのプロジェクトID
+    allowed: set = set()
+    try:
+        for operation in operations:
+            key = _resolve_batch_refs(operation.key, results_by_ref, declared)
+            data = _resolve_batch_refs(operation.data, results_by_ref, declared)
+
+            if operation.op in _BATCH_CREATE:
+                create_schema, model, out_schema = _BATCH_CREATE[operation.op]
+                db_obj = model(**create_schema(**data).model_dump())
+                if model is Project:
+                    if db_obj.owner_id != user_id:
+                        raise PermissionError(f"{operation.op}: owner_id must be the current user")
+                else:
+                    _check_batch_access(db, operation.op, db_obj, user_id, allowed)
+                db.add(db_obj)
+                db.flush()
+                result = out_schema.model_validate(db_obj).model_dump(mode="json")
+            elif operation.op in _BATCH_UPDATE:
+                model, key_names, update_schema, out_schema = _BATCH_UPDATE[operation.op]
+                db_obj = db.get(model, _batch_identity(model, key_names, key))
+                if db_obj is None:
+                    raise LookupError(f"{operation.op}: target not found {key}")
+                _check_batch_access(db, operation.op, db_obj, user_id, allowed)
+                if update_schema is None:
+                    db_obj.is_completed = datetime.now()
+                else:
+                    for field, value in update_schema(**data).model_dump(exclude_unset=True).items():
+                        setattr(db_obj, field, value)
+                    # 別のプロジェクトへ移す場合は移動先も確認する
+                    _check_batch_access(db, operation.op, db_obj, user_id, allowed)
+                db.flush()
+                result = out_schema.model_validate(db_obj).model_dump(mode="json")
+            elif operation.op in _BATCH_DELETE:
+                model, key_names = _BATCH_DELETE[operation.op]
+                db_obj = db.get(model, _batch_identity(model, key_names, key))
+                if db_obj is None:
+                    raise LookupError(f"{operation.op}: target not found {key}")
+                _check_batch_access(db, operation.op, db_obj, user_id, allowed)
+                db.delete(db_obj)
+                db.flush()
+                result = True
+            else:
+                raise ValueError(f"Unknown batch operation: {operation.op}")
+
+            if operation.ref:
+                results_by_ref[operation.ref] = result
+            results.append({"op": operation.op, "ref": operation.ref, "result": result})
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return results
@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+from datetime import datetime
 import urllib.parse
 from dotenv import load_dotenv
 import logging
@@ -12,28 +14,64 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# データベース接続情報の取得
-# ntb_projects に接続すると ntb_data のテーブルも参照可能
-user = os.getenv("MYSQL_USER")
-password = urllib.parse.quote_plus(os.getenv("MYSQL_PASSWORD", ""))
-host = os.getenv("MYSQL_HOST")
-database = os.getenv("MYSQL_DATABASE")
-ssl_ca = os.getenv("MYSQL_SSL_CA")
+# ローカル開発・負荷試験用: DATABASE_URL を指定すると Azure MySQL の代わりに接続する
+# （例: sqlite:///./loadtest.db, mysql+pymysql://root@127.0.0.1:3306/ntb_projects）
+DATABASE_URL = os.getenv("DATABASE_URL")
 
-# 接続情報の確認
-if not all([user, host, database]):
-    raise ValueError("Database configuration is incomplete. Check your .env file.")
+if DATABASE_URL:
+    SQLALCHEMY_DATABASE_URL = DATABASE_URL
+    logger.info(f"Connecting to DATABASE_URL: {make_url(DATABASE_URL).render_as_string(hide_password=True)}")
+else:
+    # データベース接続情報の取得
+    # ntb_projects に接続すると ntb_data のテーブルも参照可能
+    user = os.getenv("MYSQL_USER")
+    password = urllib.parse.quote_plus(os.getenv("MYSQL_PASSWORD", ""))
+    host = os.getenv("MYSQL_HOST")
+    database = os.getenv("MYSQL_DATABASE")
+    ssl_ca = os.getenv("MYSQL_SSL_CA")
 
-logger.info(f"Connecting to Azure MySQL: {database}@{host}")
-logger.info("ntb_data tables are accessible from ntb_projects connection")
+    # 接続情報の確認
+    if not all([user, host, database]):
+        raise ValueError("Database configuration is incomplete. Check your .env file.")
 
-# Azure MySQL 用の接続URL
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{user}:{password}@{host}:3306/{database}?ssl_ca={ssl_ca}&ssl_verify_identity=true"
+    logger.info(f"Connecting to Azure MySQL: {database}@{host}")
+    logger.info("ntb_data tables are accessible from ntb_projects connection")
 
-logger.info("SSL connection enabled for Azure MySQL")
+    # Azure MySQL 用の接続URL
+    SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{user}:{password}@{host}:3306/{database}?ssl_ca={ssl_ca}&ssl_verify_identity=true"
+
+    logger.info("SSL connection enabled for Azure MySQL")
+
+# コネクションプールの設定（スレッドプールの容量 THREADPOOL_SIZE と合わせて調整する）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+
+_url = make_url(SQLALCHEMY_DATABASE_URL)
 
 # エンジンの作成
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    connect_args={"check_same_thread": False} if _url.get_backend_name() == "sqlite" else {},
+)
+
+if _url.get_backend_name() == "sqlite":
+    # SQLite には別データベースのスキーマがないため、ntb_data を別ファイルとして ATTACH する
+    SQLITE_NTB_DATA_PATH = os.getenv("SQLITE_NTB_DATA_PATH", f"{_url.database}.ntb_data")
+
+    @event.listens_for(engine, "connect")
+    def _attach_ntb_data(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{SQLITE_NTB_DATA_PATH}' AS ntb_data")
+        # ETag の版取得 (crud._version_columns) で使う MySQL の UNIX_TIMESTAMP の代わり
+        dbapi_connection.create_function("unix_timestamp", 1, sqlite_unix_timestamp, deterministic=True)
+
+
+def sqlite_unix_timestamp(value):
+    """SQLite に保存された日時文字列を UNIX 時刻（整数秒）にする"""
+    if value is None:
+        return None
+    return int(datetime.fromisoformat(value).timestamp())
 
 # セッションの作成
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,267 @@
+"""
+プロジェクト変更通知モジュール (Redis pub/sub + Server-Sent Events)
+
+crud の書き込み結果をプロジェクトごとの Redis チャネルへ小さなイベントとして
+publish し、各ワーカーは1本の購読 (psubscribe) で受け取ったイベントを
+SSE で接続中のクライアントへ配信します。クライアントはイベントを受けたときだけ
+該当データを再取得すればよく、定期的なポーリングが不要になります。
+
+- ORM 経由の作成・更新・削除は SessionLocal の flush/commit イベントで自動的に通知
+- UPDATE/DELETE を直接発行する crud の *_direct 関数は queue_change で明示的に通知
+- 通知は commit 後に publish 用スレッドへ渡してまとめて publish し、rollback 時は破棄
+  （リクエストのスレッドは Redis の応答を待たない）
+"""
+
+import asyncio
+import json
+import queue
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, inspect
+
+from database import SessionLocal
+from redis_client import publisher_redis_client, async_redis_client
+
+CHANNEL_PREFIX = "project_events:"
+# 1接続あたりの未送信イベントの上限（超えた分は捨て、クライアントには resync を送る）
+QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+# publish 待ちのコミット数の上限（Redis が詰まって超えた分は捨てる）
+PUBLISH_QUEUE_SIZE = 10000
+
+
+def _channel(project_id: int) -> str:
+    return f"{CHANNEL_PREFIX}{project_id}"
+
+
+def queue_change(session, project_id: Optional[int], entity: str, action: str, key: Dict[str, Any]) -> None:
+    """
+    commit 後に publish する変更イベントをセッションに積む
+
+    Args:
+        session: 変更を行った SQLAlchemy セッション
+        project_id: 通知先プロジェクト（None の場合は通知しない）
+        entity: テーブル名 (tasks, todos など)
+        action: created / updated / deleted
+        key: 変更された行の主キー
+    """
+    if project_id is None:
+        return
+    session.info.setdefault("pending_events", []).append({
+        "project_id": project_id,
+        "entity": entity,
+        "action": action,
+        "key": key,
+    })
+
+
+def publish_changes(changes: Iterable[Dict[str, Any]]) -> None:
+    """変更イベントをプロジェクトごとのチャネルへまとめて publish する"""
+    changes = list(changes)
+    if not changes:
+        return
+    try:
+        pipe = publisher_redis_client.pipeline(transaction=False)
+        for change in changes:
+            pipe.publish(_channel(change["project_id"]), json.dumps(change, default=str))
+        pipe.execute()
+    except Exception as e:
+        print(f"Failed to publish project events: {e}")
+
+
+class EventPublisher:
+    """
+    commit 済みの変更イベントを専用スレッドから publish する
+
+    after_commit はキューに積むだけで戻り、Redis への送信（溜まった分は1回の
+    pipeline にまとめる）はこのスレッドで行います。
+    """
+
+    def __init__(self, maxsize: int = PUBLISH_QUEUE_SIZE):
+        self._queue: "queue.Queue[List[Dict[str, Any]]]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, changes: List[Dict[str, Any]]) -> None:
+        if not changes:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(changes)
+        except queue.Full:
+            print(f"Project event queue is full; dropped {len(changes)} events")
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="project-event-publisher", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self) -> None:
+        while True:
+            changes = list(self._queue.get())
+            taken = 1
+            while True:
+                try:
+                    changes.extend(self._queue.get_nowait())
+                    taken += 1
+                except queue.Empty:
+                    break
+            try:
+                publish_changes(changes)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    def join(self, timeout: float = 5.0) -> bool:
+        """キューが空になるまで待つ（テスト・シャットダウン用）。空になれば True"""
+        deadline = threading.Event()
+        waiter = threading.Thread(target=lambda: (self._queue.join(), deadline.set()), daemon=True)
+        waiter.start()
+        return deadline.wait(timeout)
+
+
+publisher = EventPublisher()
+
+
+def _project_id_of(obj) -> Optional[int]:
+    if getattr(obj, "__tablename__", None) == "projects":
+        return obj.id
+    return getattr(obj, "project_id", None)
+
+
+def _primary_key_of(obj) -> Dict[str, Any]:
+    mapper = inspect(obj).mapper
+    return {column.key: getattr(obj, column.key) for column in mapper.primary_key}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_flushed_changes(session, flush_context):
+    """flush された ORM オブジェクトから変更イベントを作る"""
+    for action, objects in (("created", session.new), ("updated", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            if action == "updated" and not session.is_modified(obj, include_collections=False):
+                continue
+            queue_change(session, _project_id_of(obj), obj.__tablename__, action, _primary_key_of(obj))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_committed_changes(session):
+    publisher.submit(session.info.pop("pending_events", []))
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop("pending_events", None)
+
+
+class ProjectEventHub:
+    """
+    ワーカー内で1本の Redis 購読を多数の SSE 接続へ振り分けるハブ
+
+    lifespan で start()/stop() を呼び出して使います。
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self, project_ids: List[int]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        for project_id in project_ids:
+            self._subscribers.setdefault(project_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, project_ids: List[int]) -> None:
+        for project_id in project_ids:
+            queues = self._subscribers.get(project_id)
+            if queues is None:
+                continue
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[project_id]
+
+    def _dispatch(self, project_id: int, data: str) -> None:
+        for queue in self._subscribers.get(project_id, ()):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                # 取りこぼしたクライアントには全体の再取得を促す
+                queue.get_nowait()
+                queue.put_nowait(json.dumps({"project_id": project_id, "action": "resync"}))
+
+    async def _listen(self) -> None:
+        """Redis の購読を維持し、切断時は待機してから再接続する"""
+        backoff = 1
+        while True:
+            pubsub = async_redis_client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                print("✓ Subscribed to project events")
+                backoff = 1
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode("utf-8")
+                    try:
+                        project_id = int(channel[len(CHANNEL_PREFIX):])
+                    except ValueError:
+                        continue
+                    self._dispatch(project_id, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Project event subscription error: {e}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+hub = ProjectEventHub()
+
+
+async def event_stream(project_ids: List[int]):
+    """
+    SSE 用の非同期ジェネレータ
+
+    購読したプロジェクトのイベントを "event: change" として送り、
+    無通信時は HEARTBEAT_SECONDS ごとにコメント行を送って接続を維持する。
+    """
+    queue = hub.subscribe(project_ids)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: change\ndata: {data}\n\n"
+    finally:
+        hub.unsubscribe(queue, project_ids)
@@ -0,0 +1,111 @@
+"""
+エクスポート用ストリーミング出力モジュール
+
+crud.iter_export_rows で読み出した行を NDJSON / CSV に変換し、
+StreamingResponse にそのまま渡せるジェネレータを提供します。
+同期ジェネレータは1回の yield ごとにスレッドプールを往復するため、
+出力は EXPORT_CHUNK_SIZE バイト程度にまとめてから yield します。
+セッションはジェネレータ内で開閉するため、レスポンス送信中も
+リクエストの依存性 (get_db) の寿命に縛られません。
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import crud
+from database import SessionLocal
+
+# 1回の yield で送る目安のバイト数
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 64 * 1024))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _json_default(value: Any):
+    """json.dumps で扱えない値を変換する"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def ndjson_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """行を NDJSON (1行1オブジェクト) に変換する"""
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+
+
+def csv_lines(columns: List[str], rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """行を CSV に変換する（先頭にヘッダー行、Excel向けに BOM 付き）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line.encode("utf-8")
+
+    writer.writerow(columns)
+    yield b"\xef\xbb\xbf" + flush()
+    for row in rows:
+        writer.writerow([
+            row[column].isoformat() if isinstance(row[column], (datetime, date)) else row[column]
+            for column in columns
+        ])
+        yield flush()
+
+
+def chunked(lines: Iterable[bytes], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """行を chunk_size バイト以上になるまで溜めてから1つにまとめて返す"""
+    pending: List[bytes] = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b"".join(pending)
+
+
+def stream_export(entity: str, fmt: str, project_id: Optional[int] = None,
+                  batch_size: int = 1000, chunk_size: int = EXPORT_CHUNK_SIZE,
+                  user_id: Optional[int] = None) -> Iterator[bytes]:
+    """
+    エクスポートを chunk_size バイト程度のチャンクごとに生成する
+
+    Args:
+        entity: "projects" / "tasks" / "todos"
+        fmt: "ndjson" または "csv"
+        project_id: 指定した場合はそのプロジェクトの行のみ
+        batch_size: サーバーサイドカーソルから1回に取得する行数
+        chunk_size: 1回の yield にまとめる目安のバイト数
+        user_id: 指定した場合はそのユーザーがアクセスできるプロジェクトの行のみ
+
+    Yields:
+        bytes: 出力の複数行分
+    """
+    db = SessionLocal()
+    try:
+        rows = crud.iter_export_rows(
+            db, entity, project_id=project_id, batch_size=batch_size, user_id=user_id
+        )
+        if fmt == "csv":
+            lines = csv_lines(crud.get_export_columns(entity), rows)
+        else:
+            lines = ndjson_lines(rows)
+        yield from chunked(lines, chunk_size)
+    finally:
+        db.close()
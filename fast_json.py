@@ -0,0 +1,108 @@
+"""
+一覧・詳細レスポンスの高速 JSON シリアライズ
+
+response_model=list[...] で ORM オブジェクトを返すと、FastAPI は1件ずつ
+from_attributes で検証した後に jsonable_encoder を通して JSON にします。
+件数が多い一覧ではこれが CPU の大部分を占めるため、次の経路を用意します。
+
+- dump_list / dump_model: スキーマごとに1度だけ作った TypeAdapter で検証し、
+  dump_json で直接 bytes にする（jsonable_encoder を通さない）
+- FAST_JSON_RESPONSES=True: 一覧 (encode_list) で dump_list を使う。既定では
+  FastAPI の response_model と同じく jsonable_encoder + JSONResponse で bytes にする
+  一覧・プロジェクト詳細はこの bytes を single-flight・圧縮キャッシュで共有する
+- FAST_JSON_TRUSTED=True: FAST_JSON_RESPONSES の一覧について crud が返す行を信頼して検証も省略し、
+  スキーマのフィールドだけを取り出して orjson で bytes にする
+  （orjson がない場合は標準の json を使う）
+"""
+
+import enum
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES") == "True"
+FAST_JSON_TRUSTED = os.getenv("FAST_JSON_TRUSTED") == "True"
+
+# スキーマ -> TypeAdapter(list[スキーマ]) / TypeAdapter(スキーマ)
+_list_adapters: Dict[Type[BaseModel], TypeAdapter] = {}
+_model_adapters: Dict[Type[BaseModel], TypeAdapter] = {}
+
+
+def list_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    """list[schema] 用の TypeAdapter を取得する（スキーマごとに1度だけ構築）"""
+    adapter = _list_adapters.get(schema)
+    if adapter is None:
+        adapter = TypeAdapter(list[schema])
+        _list_adapters[schema] = adapter
+    return adapter
+
+
+def model_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    """schema 用の TypeAdapter を取得する（スキーマごとに1度だけ構築）"""
+    adapter = _model_adapters.get(schema)
+    if adapter is None:
+        adapter = TypeAdapter(schema)
+        _model_adapters[schema] = adapter
+    return adapter
+
+
+def _default(value: Any):
+    """orjson / json が直接扱えない値を変換する"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dump_list(schema: Type[BaseModel], rows: Iterable[Any], trusted: bool = False) -> bytes:
+    """
+    ORM オブジェクトの一覧を JSON の bytes にする
+
+    Args:
+        schema: 各要素のレスポンススキーマ
+        rows: crud が返した ORM オブジェクトの一覧
+        trusted: True の場合は検証を省略し、スキーマのフィールドをそのまま出力する
+    """
+    if trusted:
+        fields = list(schema.model_fields)
+        data = [{field: getattr(row, field, None) for field in fields} for row in rows]
+        if orjson is not None:
+            return orjson.dumps(data, default=_default)
+        return json.dumps(data, default=_default, ensure_ascii=False).encode("utf-8")
+
+    adapter = list_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def dump_model(schema: Type[BaseModel], obj: Any) -> bytes:
+    """ORM オブジェクト1件をスキーマで検証して JSON の bytes にする"""
+    adapter = model_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+
+
+def encode_list(schema: Type[BaseModel], rows: Iterable[Any]) -> bytes:
+    """
+    一覧レスポンスの JSON 本文を作る
+
+    FAST_JSON_RESPONSES=True の場合は dump_list（FAST_JSON_TRUSTED で検証の省略を切り替え）、
+    それ以外は FastAPI が response_model で返すのと同じ jsonable_encoder + JSONResponse の経路を使う
+    """
+    if FAST_JSON_RESPONSES:
+        return dump_list(schema, rows, trusted=FAST_JSON_TRUSTED)
+    adapter = list_adapter(schema)
+    items = adapter.validate_python(rows, from_attributes=True)
+    return JSONResponse(content=jsonable_encoder(adapter.dump_python(items, mode="json"))).body
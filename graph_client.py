@@ -0,0 +1,69 @@
+"""
+Microsoft Graph 用の共有 HTTP クライアント
+
+アプリ起動時 (lifespan) に keep-alive 付きの httpx.AsyncClient を1つ作成し、
+Graph を呼び出す処理はすべてこのクライアントを共有します。
+リクエストごとに TLS ハンドシェイクをやり直さずに済みます。
+HTTP/2 は h2 パッケージ (httpx[http2]) がインストールされている場合に有効になります。
+"""
+
+import os
+from typing import Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0")
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", 30))
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", 5))
+GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", 100))
+GRAPH_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GRAPH_MAX_KEEPALIVE_CONNECTIONS", 20))
+GRAPH_KEEPALIVE_EXPIRY = float(os.getenv("GRAPH_KEEPALIVE_EXPIRY", 60))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_graph_client() -> httpx.AsyncClient:
+    """接続プール・タイムアウト設定済みの AsyncClient を作成する"""
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=GRAPH_MAX_CONNECTIONS,
+            max_keepalive_connections=GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GRAPH_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(GRAPH_TIMEOUT, connect=GRAPH_CONNECT_TIMEOUT),
+    )
+
+
+async def init_graph_client() -> None:
+    """lifespan の起動時に共有クライアントを作成する"""
+    global _client
+    if _client is None:
+        _client = create_graph_client()
+        print(f"✓ Graph client initialized (http2={HTTP2_AVAILABLE})")
+
+
+async def close_graph_client() -> None:
+    """lifespan の終了時に共有クライアントを閉じる"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_graph_client() -> httpx.AsyncClient:
+    """
+    共有クライアントを取得する
+
+    lifespan の外（スクリプトやテスト）から呼ばれた場合はその場で作成する。
+    """
+    global _client
+    if _client is None:
+        _client = create_graph_client()
+    return _client
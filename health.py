@@ -0,0 +1,170 @@
+"""
+死活監視 (/healthz) と受け入れ可否 (/readyz)
+
+DB・Redis・Graph への疎通確認はバックグラウンドで HEALTH_CHECK_INTERVAL 秒ごとに行い、
+プローブには最後の結果をそのまま返します。プローブ自体は DB や Redis に
+アクセスしないので、アクセスが集中している最中に何度呼ばれても負荷になりません。
+
+- /healthz: プロセスが応答できれば 200（依存先の状態は参考情報として返す）
+- /readyz: 起動処理が終わっていて、READINESS_REQUIRED の依存先がすべて正常なら 200、
+  そうでなければ 503。Graph は障害時もアプリの大半が動くため既定では必須にしない
+
+DB の確認はアプリ用スレッドプールとは別の専用スレッドで、確認専用の1本の接続を
+使い回して SELECT 1 を実行します。アプリのコネクションプールからは借りないので、
+プールが使い切られていても pool_timeout まで待たされません（プールの状態は
+チェックアウトせずに統計値だけを報告します）。
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import create_engine, text
+
+import graph_client
+from database import engine
+from redis_client import async_redis_client
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 10))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 3))
+READINESS_REQUIRED = tuple(
+    name.strip() for name in os.getenv("READINESS_REQUIRED", "database,redis").split(",") if name.strip()
+)
+
+
+def _pool_status() -> Dict:
+    pool = engine.pool
+    status = {}
+    for name in ("size", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            status[name] = method()
+    return status
+
+
+def _create_probe_engine():
+    """DB 確認専用のエンジン（接続1本のみ、アプリのプールとは共有しない）"""
+    if engine.url.get_backend_name() == "sqlite":
+        connect_args = {"check_same_thread": False}
+    else:
+        connect_args = {"connect_timeout": max(1, int(HEALTH_CHECK_TIMEOUT))}
+    return create_engine(
+        engine.url,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=HEALTH_CHECK_TIMEOUT,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+
+
+_probe_engine = _create_probe_engine()
+
+
+def _ping_database() -> Dict:
+    with _probe_engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    return {"pool": _pool_status()}
+
+
+class HealthMonitor:
+    """依存先の疎通確認を定期的に実行し、結果を保持する"""
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.results: Dict[str, Dict] = {}
+        self.last_run: Optional[float] = None
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+        # DB の確認はアプリのスレッドプールが埋まっていても実行できるよう専用スレッドで行う
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="health-check")
+
+    async def check_database(self) -> Dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _ping_database)
+
+    async def check_redis(self) -> Dict:
+        await async_redis_client.ping()
+        return {}
+
+    async def check_graph(self) -> Dict:
+        # 認証なしのリクエストで 401 などが返れば到達可能とみなす
+        response = await graph_client.get_graph_client().get(graph_client.GRAPH_BASE_URL, timeout=self.timeout)
+        if response.status_code >= 500:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return {"status_code": response.status_code}
+
+    async def _run_check(self, name: str, check: Callable[[], Awaitable[Dict]]) -> None:
+        started = time.perf_counter()
+        result = {"ok": False}
+        try:
+            details = await asyncio.wait_for(check(), timeout=self.timeout)
+            result = {"ok": True, **details}
+        except asyncio.TimeoutError:
+            result["error"] = f"timed out after {self.timeout}s"
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        result["checked_at"] = datetime.now(timezone.utc).isoformat()
+        self.results[name] = result
+
+    async def run_checks(self) -> None:
+        """すべての依存先を並行して確認する"""
+        await asyncio.gather(
+            self._run_check("database", self.check_database),
+            self._run_check("redis", self.check_redis),
+            self._run_check("graph", self.check_graph),
+        )
+        self.last_run = time.monotonic()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_checks()
+
+    async def start(self) -> None:
+        """1回目の確認を終えてから、以降の定期確認をバックグラウンドで開始する"""
+        await self.run_checks()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self.ready = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def mark_ready(self) -> None:
+        """起動処理が終わり、リクエストを受け付けられる状態にする"""
+        self.ready = True
+
+    def _summary(self) -> Dict:
+        age = round(time.monotonic() - self.last_run, 3) if self.last_run is not None else None
+        return {"checks": self.results, "checked_seconds_ago": age}
+
+    def liveness(self) -> Dict:
+        return {"status": "ok", **self._summary()}
+
+    def readiness(self) -> Dict:
+        failing = [name for name in READINESS_REQUIRED if not self.results.get(name, {}).get("ok")]
+        # 定期確認が止まっている場合は結果を信用しない
+        if self.last_run is None or time.monotonic() - self.last_run > self.interval * 3 + self.timeout:
+            failing.append("stale_checks")
+        ready = self.ready and not failing
+        return {
+            "status": "ready" if ready else "not_ready",
+            "started": self.ready,
+            "failing": failing,
+            **self._summary(),
+        }
+
+
+monitor = HealthMonitor()
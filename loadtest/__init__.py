@@ -0,0 +1,22 @@
+"""
+負荷試験パッケージ
+
+main.app のスループットとレイテンシを、再現可能な条件で計測します。
+外部サービスはすべてローカルの代替に置き換えます。
+
+- DB: SQLite（ntb_data は別ファイルを ATTACH）またはローカルの MySQL (DATABASE_URL)
+- Redis: ローカルの redis-server。shared:ms_oid_by_session:* / token_info:* を偽のセッションで投入
+- Microsoft Graph: graph_stub の HTTP サーバー (GRAPH_BASE_URL)
+
+使い方（リポジトリのルートで実行）:
+    # アプリをプロセス内 (httpx.ASGITransport) で起動し、SQLite で全シナリオを実行
+    python -m loadtest --redis-url redis://127.0.0.1:6379/15
+
+    # uvicorn の複数ワーカー・ローカル MySQL で実行し、前回の結果と比較
+    python -m loadtest --mode uvicorn --workers 4 \\
+        --database-url mysql+pymysql://root@127.0.0.1:3306/ntb_projects \\
+        --concurrency 50 --duration 30 --compare loadtest/results/<前回>.json
+
+結果は loadtest/results/<コミット>-<モード>.json に保存されます。コミット・設定・
+シナリオごとの RPS とレイテンシのパーセンタイルを含むので、コミット間で比較できます。
+"""
@@ -0,0 +1,125 @@
+"""
+python -m loadtest のエントリーポイント
+
+DB・Redis・Graph スタブを準備してから、アプリを起動してシナリオを実行します。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from loadtest import fixtures, runner, scenarios
+from loadtest.graph_stub import GRAPH_STUB_LATENCY, start_graph_stub
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description="main.app の負荷試験")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess",
+                        help="inprocess: httpx.ASGITransport で直接呼び出す / uvicorn: サブプロセスで起動して HTTP で呼び出す")
+    parser.add_argument("--database-url", default=None,
+                        help="既定は一時ディレクトリの SQLite (loadtest.db)")
+    parser.add_argument("--fresh", action="store_true", help="SQLite のファイルを削除してから投入し直す")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/15",
+                        help="ローカルの redis-server（偽セッションを投入するので専用の DB 番号を推奨）")
+    parser.add_argument("--scenario", action="append", choices=sorted(scenarios.SCENARIOS),
+                        help="実行するシナリオ（複数指定可、既定はすべて）")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0, help="シナリオごとの計測時間（秒）")
+    parser.add_argument("--warmup", type=float, default=3.0, help="集計しない最初の時間（秒）")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn のワーカー数")
+    parser.add_argument("--port", type=int, default=8765, help="uvicorn の待ち受けポート")
+    parser.add_argument("--graph-latency", type=float, default=GRAPH_STUB_LATENCY,
+                        help="Graph スタブの応答遅延（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="データ投入・リクエスト選択の乱数シード")
+    parser.add_argument("--projects", type=int, default=fixtures.SeedSize.projects)
+    parser.add_argument("--users", type=int, default=fixtures.SeedSize.users)
+    parser.add_argument("--with-limits", action="store_true",
+                        help="レート制限・アドミッション制御を有効のまま計測する（既定は無効にする。"
+                             "シナリオの多くはセッションなしで同じ IP から送るため、すぐに 429 になる）")
+    parser.add_argument("--output", default=None, help="結果の JSON（既定 loadtest/results/<コミット>-<モード>.json）")
+    parser.add_argument("--compare", default=None, help="比較対象の結果 JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    names = args.scenario or list(scenarios.SCENARIOS)
+
+    database_url = args.database_url
+    if database_url is None:
+        sqlite_path = os.path.join(tempfile.gettempdir(), "loadtest.db")
+        if args.fresh:
+            for path in (sqlite_path, f"{sqlite_path}.ntb_data"):
+                if os.path.exists(path):
+                    os.remove(path)
+        database_url = f"sqlite:///{sqlite_path}"
+
+    graph_server, graph_base_url = start_graph_stub(latency=args.graph_latency)
+    env = {
+        "DATABASE_URL": database_url,
+        "REDIS_URL": args.redis_url,
+        "GRAPH_BASE_URL": graph_base_url,
+    }
+    if not args.with_limits:
+        env.update({"RATE_LIMIT_ENABLED": "False", "ADMISSION_CONTROL_ENABLED": "False"})
+    # database / redis_client は import 時に環境変数を読むので、先に設定する
+    os.environ.update(env)
+    sys.path.insert(0, runner.REPO_ROOT)
+
+    import database
+    from redis_client import redis_client
+
+    print(f"Preparing database: {database_url}")
+    fixtures.prepare_database(database.engine)
+    size = fixtures.SeedSize(projects=args.projects, users=args.users)
+    seed = fixtures.seed_database(database.SessionLocal, size, seed=args.seed)
+    fixtures.seed_redis(redis_client, seed)
+    print(f"Seeded {len(seed.user_ids)} users, {len(seed.project_ids)} projects, {len(seed.sessions)} sessions")
+
+    try:
+        if args.mode == "inprocess":
+            results = asyncio.run(runner.run_inprocess(
+                seed, names, args.concurrency, args.duration, args.warmup, args.seed,
+            ))
+        else:
+            # サブプロセスと SQLite ファイルを共有するため、親のコネクションは閉じておく
+            database.engine.dispose()
+            results = asyncio.run(runner.run_uvicorn(
+                env, args.port, args.workers, seed, names,
+                args.concurrency, args.duration, args.warmup, args.seed,
+            ))
+    finally:
+        graph_server.shutdown()
+
+    config = {
+        "mode": args.mode,
+        "database": database.engine.url.get_backend_name(),
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "workers": args.workers if args.mode == "uvicorn" else None,
+        "graph_latency": args.graph_latency,
+        "seed": args.seed,
+        "projects": args.projects,
+        "users": args.users,
+        "limits": args.with_limits,
+    }
+    report = runner.build_report(config, results)
+    output = args.output
+    if output is None:
+        commit = (report["git"]["commit"] or "unknown")[:12]
+        output = os.path.join(runner.REPO_ROOT, "loadtest", "results", f"{commit}-{args.mode}.json")
+    runner.write_report(report, output)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(runner.compare_reports(json.load(f), report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
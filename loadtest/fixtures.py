@@ -0,0 +1,137 @@
+"""
+負荷試験用のテストデータ投入
+
+DB にはユーザー・船舶・プロジェクト・タスク・Todo を、Redis には Flask アプリが
+書き込むのと同じ形式の偽セッション (shared:ms_oid_by_session:*, token_info:*) を投入します。
+乱数のシードを固定しているので、同じ引数なら毎回同じデータになります。
+"""
+
+import json
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import func, text
+from sqlalchemy.engine import make_url
+
+SESSION_PREFIX = "loadtest-session-"
+
+
+@dataclass
+class SeedSize:
+    users: int = 50
+    ships: int = 20
+    projects: int = 20
+    tasks_per_project: int = 10
+    todos_per_task: int = 5
+    comments_per_todo: int = 2
+
+
+@dataclass
+class SeedResult:
+    user_ids: List[int] = field(default_factory=list)
+    ms_oids: List[str] = field(default_factory=list)
+    project_ids: List[int] = field(default_factory=list)
+    # project_id -> [(task_number, todo_number), ...]
+    todos: dict = field(default_factory=dict)
+    # project_id -> [オーナー・担当者の user_id, ...]（/batch で書き込めるユーザー）
+    members: dict = field(default_factory=dict)
+    sessions: List[str] = field(default_factory=list)
+
+
+def prepare_database(engine) -> None:
+    """テーブルを作成する（MySQL の場合は ntb_data データベースも作成）"""
+    import models
+
+    if make_url(str(engine.url)).get_backend_name() == "mysql":
+        with engine.begin() as connection:
+            connection.execute(text("CREATE DATABASE IF NOT EXISTS ntb_data"))
+    models.Base.metadata.create_all(bind=engine)
+
+
+def seed_database(session_factory, size: SeedSize, seed: int = 0) -> SeedResult:
+    """
+    テストデータを投入する（既にユーザーがいる場合は投入済みとみなして読み出すだけ）
+    """
+    import models
+
+    rng = random.Random(seed)
+    result = SeedResult()
+    db = session_factory()
+    try:
+        if db.query(func.count(models.User.id)).scalar() == 0:
+            for i in range(1, size.users + 1):
+                db.add(models.User(
+                    id=i,
+                    email=f"user{i}@loadtest.example.com",
+                    name=f"Load Test User {i}",
+                    ms_email=f"user{i}@loadtest.example.com",
+                    ms_id=f"loadtest-oid-{i}",
+                ))
+            for i in range(1, size.ships + 1):
+                db.add(models.Ship(id=i, name=f"SHIP {i}", yard=f"Yard {i % 5}", ship_no=f"S-{i:04d}"))
+            db.flush()
+
+            base = datetime(2024, 1, 1)
+            for p in range(size.projects):
+                project = models.Project(
+                    name=f"Load Test Project {p + 1}",
+                    discription="load test",
+                    owner_id=rng.randint(1, size.users),
+                    ship_id=rng.randint(1, size.ships),
+                )
+                db.add(project)
+                db.flush()
+                for member in rng.sample(range(1, size.users + 1), min(5, size.users)):
+                    db.add(models.ProjectAssignment(member, project.id))
+                for t in range(size.tasks_per_project):
+                    task = models.Task(project_id=project.id, name=f"Task {t + 1}")
+                    db.add(task)
+                    db.flush()
+                    db.add(models.TaskAssignment(rng.randint(1, size.users), project.id, task.task_number))
+                    db.add(models.TaskComment(project.id, task.task_number, rng.randint(1, size.users), "task comment"))
+                    for d in range(size.todos_per_task):
+                        todo = models.Todo(
+                            project_id=project.id,
+                            task_number=task.task_number,
+                            description=f"Todo {d + 1}",
+                            start=base + timedelta(days=rng.randint(0, 365)),
+                        )
+                        db.add(todo)
+                        db.flush()
+                        db.add(models.TodoAssignment(rng.randint(1, size.users), project.id, task.task_number, todo.todo_number))
+                        for _ in range(size.comments_per_todo):
+                            db.add(models.TodoComment(
+                                project.id, task.task_number, todo.todo_number,
+                                rng.randint(1, size.users), "todo comment",
+                            ))
+            db.commit()
+
+        for user in db.query(models.User).order_by(models.User.id):
+            result.user_ids.append(user.id)
+            result.ms_oids.append(user.ms_id)
+        for project_id, task_number, todo_number in db.query(
+            models.Todo.project_id, models.Todo.task_number, models.Todo.todo_number
+        ):
+            result.todos.setdefault(project_id, []).append((task_number, todo_number))
+        result.project_ids = sorted(result.todos)
+        for project_id, owner_id in db.query(models.Project.id, models.Project.owner_id):
+            result.members.setdefault(project_id, []).append(owner_id)
+        for project_id, user_id in db.query(models.ProjectAssignment.project_id, models.ProjectAssignment.user_id):
+            result.members.setdefault(project_id, []).append(user_id)
+    finally:
+        db.close()
+    return result
+
+
+def seed_redis(client, result: SeedResult, ttl: int = 60 * 60 * 8) -> None:
+    """ユーザーごとに偽のセッションとアクセストークンを Redis へ投入する"""
+    pipe = client.pipeline(transaction=False)
+    for user_id, ms_oid in zip(result.user_ids, result.ms_oids):
+        session = f"{SESSION_PREFIX}{user_id}"
+        pipe.set(f"shared:ms_oid_by_session:{session}", ms_oid, ex=ttl)
+        pipe.set(f"shared:ms_oid_by_user:{user_id}", ms_oid, ex=ttl)
+        pipe.set(f"token_info:{ms_oid}", json.dumps({"access_token": f"loadtest-token-{user_id}"}), ex=ttl)
+        result.sessions.append(session)
+    pipe.execute()
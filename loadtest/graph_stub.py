@@ -0,0 +1,107 @@
+"""
+Microsoft Graph のスタブサーバー
+
+負荷試験中に Graph の代わりに応答します。レスポンスは固定で、
+GRAPH_STUB_LATENCY 秒（既定 0）の遅延を入れて実際の Graph の待ち時間を模擬できます。
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+GRAPH_STUB_LATENCY = float(os.getenv("GRAPH_STUB_LATENCY", 0))
+
+
+class GraphStubHandler(BaseHTTPRequestHandler):
+    """/me・ドライブ操作・アップロードセッションに固定のレスポンスを返す"""
+
+    protocol_version = "HTTP/1.1"
+    latency = GRAPH_STUB_LATENCY
+
+    def log_message(self, format, *args):
+        pass
+
+    def _discard_body(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        while length > 0:
+            chunk = self.rfile.read(min(length, 64 * 1024))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def _send_json(self, status: int, payload: Optional[dict]) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/me"):
+            self._send_json(200, {
+                "id": "loadtest-user",
+                "displayName": "Load Test",
+                "mail": "loadtest@example.com",
+                "jobTitle": "Engineer",
+                "officeLocation": "Dock",
+            })
+        elif path.endswith("/children"):
+            self._send_json(200, {"value": []})
+        elif path.endswith("/content"):
+            body = b"x" * 1024
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(200, {"id": uuid.uuid4().hex, "name": path.rsplit("/", 1)[-1]})
+
+    def do_POST(self):
+        self._discard_body()
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/createUploadSession"):
+            self._send_json(200, {"uploadUrl": f"{self._base_url()}/upload/{uuid.uuid4().hex}"})
+        elif path.endswith("/createLink"):
+            self._send_json(200, {"link": {"webUrl": f"{self._base_url()}/shared/{uuid.uuid4().hex}"}})
+        elif path.endswith("/preview"):
+            self._send_json(200, {"getUrl": f"{self._base_url()}/preview/{uuid.uuid4().hex}"})
+        else:
+            self._send_json(201, {"id": uuid.uuid4().hex, "name": path.rsplit("/", 1)[-1]})
+
+    def do_PUT(self):
+        self._discard_body()
+        path = self.path.split("?", 1)[0]
+        name = path.rsplit("/", 1)[-1].replace(":", "")
+        self._send_json(201, {"id": uuid.uuid4().hex, "name": name})
+
+    def do_DELETE(self):
+        self._send_json(204, None)
+
+
+def start_graph_stub(host: str = "127.0.0.1", port: int = 0, latency: float = GRAPH_STUB_LATENCY) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    スタブサーバーをバックグラウンドスレッドで起動する
+
+    Returns:
+        (server, base_url): 停止は server.shutdown()、base_url は GRAPH_BASE_URL に指定する値
+    """
+    handler = type("ConfiguredGraphStubHandler", (GraphStubHandler,), {"latency": latency})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="graph-stub", daemon=True)
+    thread.start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}/v1.0"
@@ -0,0 +1,248 @@
+"""
+負荷試験の実行と集計
+
+アプリをプロセス内 (httpx.ASGITransport) または uvicorn のサブプロセスとして起動し、
+指定した同時実行数でシナリオを一定時間実行して RPS とレイテンシを集計します。
+"""
+
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadtest import scenarios
+from loadtest.fixtures import SeedResult
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """ソート済みの値から nearest-rank 法でパーセンタイルを求める"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _is_ok(status) -> bool:
+    return status != "error" and 200 <= int(status) < 400
+
+
+def _latency_summary(values: List[float]) -> Dict:
+    summary = {f"p{pct}": round(percentile(values, pct) * 1000, 3) for pct in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values) * 1000, 3) if values else 0.0
+    summary["max"] = round(values[-1] * 1000, 3) if values else 0.0
+    return summary
+
+
+def summarize(latencies: List[float], error_latencies: List[float], statuses: Counter, elapsed: float) -> Dict:
+    """
+    成功 (2xx/3xx) と失敗を分けて集計する
+
+    rps と latency_ms は成功したリクエストのみ。すぐに返る 429 などの失敗は
+    error_rps / error_latency_ms に分けて、スループットやレイテンシを良く見せないようにする。
+    """
+    values = sorted(latencies)
+    error_values = sorted(error_latencies)
+    return {
+        "requests": len(values) + len(error_values),
+        "errors": len(error_values),
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "error_rps": round(len(error_values) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": _latency_summary(values),
+        "error_latency_ms": _latency_summary(error_values),
+        "status": dict(sorted((str(status), n) for status, n in statuses.items())),
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    scenario_name: str,
+    seed: SeedResult,
+    concurrency: int,
+    duration: float,
+    warmup: float = 0.0,
+    rng_seed: int = 0,
+) -> Dict:
+    """
+    concurrency 個のワーカーで duration 秒間シナリオを実行する
+
+    最初の warmup 秒に開始したリクエストは集計しない。
+    """
+    scenario = scenarios.SCENARIOS[scenario_name]
+    # (経過秒, 成功したか)
+    latencies: List[tuple] = []
+    statuses: Counter = Counter()
+    by_request: Dict[str, List[tuple]] = defaultdict(list)
+    by_request_status: Dict[str, Counter] = defaultdict(Counter)
+
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker(index: int) -> None:
+        rng = random.Random(rng_seed * 10_000 + index)
+        while True:
+            request_started = time.perf_counter()
+            if request_started >= deadline:
+                return
+            name, method, url, kwargs = scenarios.pick(scenario, seed, rng)
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            elapsed = time.perf_counter() - request_started
+            if request_started >= measure_from:
+                sample = (elapsed, _is_ok(status))
+                latencies.append(sample)
+                statuses[status] += 1
+                by_request[name].append(sample)
+                by_request_status[name][status] += 1
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    measured = time.perf_counter() - measure_from
+
+    def split(samples):
+        return [t for t, ok in samples if ok], [t for t, ok in samples if not ok]
+
+    result = summarize(*split(latencies), statuses, measured)
+    result["by_request"] = {
+        name: summarize(*split(samples), by_request_status[name], measured)
+        for name, samples in sorted(by_request.items())
+    }
+    return result
+
+
+async def run_scenarios(client, seed: SeedResult, names: List[str], concurrency: int,
+                        duration: float, warmup: float, rng_seed: int) -> Dict:
+    results = {}
+    for name in names:
+        print(f"Running {name}: concurrency={concurrency} duration={duration}s")
+        results[name] = await drive(client, name, seed, concurrency, duration, warmup, rng_seed)
+        summary = results[name]
+        print(
+            f"  {summary['rps']:.1f} req/s  p50={summary['latency_ms']['p50']}ms  "
+            f"p99={summary['latency_ms']['p99']}ms  errors={summary['errors']} ({summary['error_rps']:.1f}/s)"
+        )
+    return results
+
+
+async def run_inprocess(seed: SeedResult, names: List[str], concurrency: int,
+                        duration: float, warmup: float, rng_seed: int) -> Dict:
+    """main.app をこのプロセス内で起動して実行する（環境変数は設定済みであること）"""
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            return await run_scenarios(client, seed, names, concurrency, duration, warmup, rng_seed)
+
+
+def start_uvicorn(env: Dict[str, str], port: int, workers: int, startup_timeout: float = 60) -> subprocess.Popen:
+    """uvicorn main:app をサブプロセスで起動し、/ が応答するまで待つ"""
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers),
+        "--no-access-log", "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env={**os.environ, **env})
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+async def run_uvicorn(env: Dict[str, str], port: int, workers: int, seed: SeedResult, names: List[str],
+                      concurrency: int, duration: float, warmup: float, rng_seed: int) -> Dict:
+    process = start_uvicorn(env, port, workers)
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            return await run_scenarios(client, seed, names, concurrency, duration, warmup, rng_seed)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_info() -> Dict:
+    """結果をコミット間で比較できるよう、計測時のコミットを記録する"""
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.check_output(["git", *args], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    commit = git("rev-parse", "HEAD")
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": commit,
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(status) if status is not None else None,
+    }
+
+
+def build_report(config: Dict, results: Dict) -> Dict:
+    return {
+        "git": git_info(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "scenarios": results,
+    }
+
+
+def write_report(report: Dict, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def compare_reports(base: Dict, current: Dict) -> str:
+    """2つの結果のシナリオごとの RPS と p50 / p99 の変化率を表にする"""
+    def change(old: float, new: float) -> str:
+        if not old:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    base_commit = (base.get("git") or {}).get("commit") or "?"
+    current_commit = (current.get("git") or {}).get("commit") or "?"
+    lines = [
+        f"base {base_commit[:12]} -> current {current_commit[:12]}",
+        f"{'scenario':<16}{'rps':>22}{'p50 ms':>24}{'p99 ms':>24}",
+    ]
+    for name, now in current["scenarios"].items():
+        before = base.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        lines.append(
+            f"{name:<16}"
+            f"{before['rps']:>9.1f} {now['rps']:>7.1f} {change(before['rps'], now['rps']):>4}"
+            f"{before['latency_ms']['p50']:>9.2f} {now['latency_ms']['p50']:>7.2f} {change(before['latency_ms']['p50'], now['latency_ms']['p50']):>6}"
+            f"{before['latency_ms']['p99']:>9.2f} {now['latency_ms']['p99']:>7.2f} {change(before['latency_ms']['p99'], now['latency_ms']['p99']):>6}"
+        )
+    return "\n".join(lines)
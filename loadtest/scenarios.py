@@ -0,0 +1,107 @@
+"""
+負荷試験のシナリオ
+
+各シナリオは (重み, リクエスト生成関数) のリストで、ワーカーは重みに従って
+リクエストを選びます。リクエスト生成関数は fixtures.SeedResult と乱数を受け取り、
+(名前, メソッド, URL, httpx のキーワード引数) を返します。
+
+main.app にはファイルアップロードのエンドポイントがないため、
+書き込みの経路は /batch（Todo コメントの作成）で計測します。
+"""
+
+import random
+from typing import Callable, Dict, List, Tuple
+
+from loadtest.fixtures import SESSION_PREFIX, SeedResult
+
+Request = Tuple[str, str, str, dict]
+Builder = Callable[[SeedResult, random.Random], Request]
+
+
+def _session_cookies(seed: SeedResult, rng: random.Random) -> dict:
+    # httpx はリクエスト単位の cookies 引数を非推奨にしているのでヘッダーで渡す
+    return {"headers": {"Cookie": f"session={rng.choice(seed.sessions)}"}}
+
+
+def _member_cookies(seed: SeedResult, rng: random.Random, project_id: int) -> Tuple[int, dict]:
+    """プロジェクト単位のエンドポイントはオーナー・担当者しか使えないので、メンバーのセッションで送る"""
+    user_id = rng.choice(seed.members[project_id])
+    return user_id, {"headers": {"Cookie": f"session={SESSION_PREFIX}{user_id}"}}
+
+
+def protected(seed: SeedResult, rng: random.Random) -> Request:
+    return ("GET /api/protected", "GET", "/api/protected", _session_cookies(seed, rng))
+
+
+def graph_me(seed: SeedResult, rng: random.Random) -> Request:
+    return ("GET /api/graph/me", "GET", "/api/graph/me", _session_cookies(seed, rng))
+
+
+def my_work(seed: SeedResult, rng: random.Random) -> Request:
+    return ("GET /me/work", "GET", "/me/work", _session_cookies(seed, rng))
+
+
+def users(seed: SeedResult, rng: random.Random) -> Request:
+    return ("GET /users/", "GET", "/users/", {})
+
+
+def ships(seed: SeedResult, rng: random.Random) -> Request:
+    return ("GET /ships/", "GET", "/ships/", {})
+
+
+def project_tree(seed: SeedResult, rng: random.Random) -> Request:
+    project_id = rng.choice(seed.project_ids)
+    _, kwargs = _member_cookies(seed, rng, project_id)
+    return ("GET /projects/{project_id}/tree", "GET", f"/projects/{project_id}/tree", kwargs)
+
+
+def project_timeline(seed: SeedResult, rng: random.Random) -> Request:
+    project_id = rng.choice(seed.project_ids)
+    _, kwargs = _member_cookies(seed, rng, project_id)
+    return ("GET /projects/{project_id}/timeline", "GET", f"/projects/{project_id}/timeline", kwargs)
+
+
+def workload(seed: SeedResult, rng: random.Random) -> Request:
+    return ("GET /workload/", "GET", "/workload/", _session_cookies(seed, rng))
+
+
+def add_todo_comment(seed: SeedResult, rng: random.Random) -> Request:
+    project_id = rng.choice(seed.project_ids)
+    task_number, todo_number = rng.choice(seed.todos[project_id])
+    # /batch はプロジェクトのオーナー・担当者しか書き込めない
+    user_id, kwargs = _member_cookies(seed, rng, project_id)
+    body = {"operations": [{
+        "op": "create_todo_comment",
+        "data": {
+            "project_id": project_id,
+            "task_number": task_number,
+            "todo_number": todo_number,
+            "user_id": user_id,
+            "content": "load test comment",
+        },
+    }]}
+    return ("POST /batch", "POST", "/batch", {"json": body, **kwargs})
+
+
+SCENARIOS: Dict[str, List[Tuple[int, Builder]]] = {
+    # 認証付きの読み取り（Redis のセッション参照・Graph スタブ経由のプロフィール）
+    "auth_reads": [(3, protected), (3, my_work), (2, graph_me)],
+    # マスターデータの一覧
+    "master_reads": [(1, users), (1, ships)],
+    # プロジェクト画面
+    "project_views": [(3, project_tree), (1, project_timeline), (1, workload)],
+    # 書き込み
+    "writes": [(1, add_todo_comment)],
+    # 実際の利用比率に近い混合
+    "mixed": [
+        (4, project_tree), (2, my_work), (2, ships), (1, users), (1, protected),
+        (1, graph_me), (1, project_timeline), (1, add_todo_comment),
+    ],
+}
+
+
+def pick(scenario: List[Tuple[int, Builder]], seed: SeedResult, rng: random.Random) -> Request:
+    """重みに従ってシナリオからリクエストを1つ選ぶ"""
+    weights = [weight for weight, _ in scenario]
+    builder = rng.choices([builder for _, builder in scenario], weights=weights)[0]
+    return builder(seed, rng)
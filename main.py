@@ -1,19 +1,37 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
 
 # 相対インポートから絶対インポートに変更（main.pyを直接実行する場合）
 import crud
 import models
 import schemas
-from database import engine, get_db, test_connection
+import export_stream
+import events
+import query_counter
+import graph_client
+import profile_cache
+import threadpool
+import fast_json
+import compression
+import metrics
+import profiler
+import rate_limit
+import single_flight
+import health
+import warmup
+from database import engine, get_db, test_connection, SessionLocal
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import asyncio
 import redis
 from auth import get_current_user
-from typing import Dict, Optional
-import httpx
+from utils import make_etag, etag_matches
+from typing import Dict, Literal, Optional
+from datetime import datetime
 
 
 @asynccontextmanager
@@ -29,19 +47,63 @@ async def lifespan(app: FastAPI):
             print("Warning: Could not connect to database")
     except Exception as e:
         print(f"Database startup warning: {e}")
+
+    # 同期処理用スレッドプールの容量（DB コネクションプールと合わせて調整）
+    capacity = threadpool.configure_threadpool()
+    print(f"Threadpool capacity: {capacity}")
+
+    # SQL 実行時間を Prometheus メトリクスに記録
+    metrics.instrument_engine(engine)
+
+    # Graph API 用の共有クライアント（keep-alive で接続を使い回す）
+    await graph_client.init_graph_client()
+
+    # プロジェクト変更通知の購読を開始（ワーカーごとに1本）
+    events.hub.start()
+
+    # DB・Redis・Graph の疎通確認を開始
+    await health.monitor.start()
+
+    # 接続・マッパー・クエリのコンパイル・TypeAdapter・マスターデータのキャッシュを準備してから
+    # /readyz で受け付け可能にする
+    await warmup.run_warmup(primers=[_prime_ship_list])
+    health.monitor.mark_ready()
     
     yield
     
     # Shutdown
+    await health.monitor.stop()
+    await events.hub.stop()
+    await asyncio.to_thread(events.publisher.join)
+    await graph_client.close_graph_client()
     print("Application shutdown")
 
-app = FastAPI(lifespan=lifespan)
+# すべてのルートでユーザー × ルートのレート制限を行う
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(rate_limit.enforce_rate_limit)])
 
 origins = [
     "http://localhost:3000",
 ]
 
+# 開発用: リクエストごとの SQL 実行回数を計測し、N+1 の疑いを警告する
+if query_counter.QUERY_DEBUG:
+    app.add_middleware(query_counter.QueryDebugMiddleware)
+
+# 管理者向け: X-Profile ヘッダー付きのリクエストをサンプリングプロファイラーで計測
+if profiler.PROFILER_ADMIN_OIDS:
+    app.add_middleware(profiler.ProfilingMiddleware)
+
+# DB・スレッドプールが埋まる前に、処理中リクエスト数の上限で 429 を返す
+app.add_middleware(rate_limit.AdmissionControlMiddleware)
+
+# Accept-Encoding に応じて gzip / brotli で圧縮（COMPRESSION_MIN_SIZE 未満はそのまま）
+app.add_middleware(compression.CompressionMiddleware)
+
+# ルートテンプレートごとのレイテンシ・処理中リクエスト数を Prometheus 用に記録
+app.add_middleware(metrics.MetricsMiddleware)
+
 # CORS設定（Reactから呼び出す場合）
+# 最後に追加して最も外側にし、429 などミドルウェアが返すレスポンスにも CORS ヘッダーを付ける
 app. add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -56,6 +118,28 @@ app. add_middleware(
     allow_headers=["*"],
 )
 
+# ===== 認可（プロジェクト単位のアクセス権） =====
+def get_current_db_user(user: Dict = Depends(get_current_user), db: Session = Depends(get_db)) -> models.User:
+    """ログインユーザーの User 行を取得（登録されていなければ 403）"""
+    db_user = crud.get_user_by_ms_id(db, ms_id=user["ms_oid"])
+    if db_user is None:
+        raise HTTPException(status_code=403, detail="User not found")
+    return db_user
+
+def check_project_access(db: Session, project_id: int, db_user: models.User) -> None:
+    """ユーザーがプロジェクトのオーナーでも担当者でもなければ 403"""
+    if not crud.can_access_project(db, project_id, db_user.id):
+        raise HTTPException(status_code=403, detail="Access to this project is not allowed")
+
+def require_project_access(
+    project_id: int,
+    db_user: models.User = Depends(get_current_db_user),
+    db: Session = Depends(get_db),
+) -> models.User:
+    """パスの project_id にアクセスできるログインユーザー（依存関係として使う）"""
+    check_project_access(db, project_id, db_user)
+    return db_user
+
 @app.get("/")
 async def root():
     """ヘルスチェック"""
@@ -64,6 +148,19 @@ async def root():
         "auth": "Shared with Flask via Redis"
     }
 
+@app.get("/healthz")
+async def healthz():
+    """死活監視（依存先の状態はバックグラウンドで確認した最新の結果）"""
+    return health.monitor.liveness()
+
+@app.get("/readyz")
+async def readyz():
+    """受け付け可否: 起動処理が終わり、DB・Redis が正常なら 200、それ以外は 503"""
+    readiness = health.monitor.readiness()
+    if readiness["status"] != "ready":
+        return JSONResponse(readiness, status_code=503)
+    return readiness
+
 @app.get("/api/protected")
 async def protected_route(user: Dict = Depends(get_current_user)):
     """
@@ -79,27 +176,17 @@ async def protected_route(user: Dict = Depends(get_current_user)):
 async def get_user_profile(user: Dict = Depends(get_current_user)):
     """
     Microsoft Graph APIを呼び出してユーザー情報を取得
+
+    プロフィールは ms_oid ごとに Redis（＋プロセス内）へキャッシュし、
+    期限切れ後は古い値を返しつつバックグラウンドで再取得します
     """
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://graph.microsoft.com/v1.0/me",
-            headers={"Authorization": f"Bearer {user['access_token']}"},
-            timeout=30.0
+    try:
+        return await profile_cache.get_profile(user["ms_oid"], user["access_token"])
+    except profile_cache.GraphProfileError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Graph API error: {e.detail}"
         )
-        
-        if response.status_code == 200:
-            user_data = response.json()
-            return {
-                "displayName": user_data.get("displayName"),
-                "mail": user_data.get("mail"),
-                "jobTitle": user_data.get("jobTitle"),
-                "officeLocation": user_data.get("officeLocation"),
-            }
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Graph API error: {response.text}"
-            )
 
 @app.get("/api/debug/session")
 async def debug_session(
@@ -115,6 +202,26 @@ async def debug_session(
     }
 
 
+@app.get("/api/debug/threadpool")
+async def debug_threadpool(user: Dict = Depends(get_current_user)):
+    """
+    デバッグ用：スレッドプールとDBコネクションプールの状態
+    """
+    return {
+        "threadpool": threadpool.snapshot(),
+        "db_pool": {
+            "size": engine.pool.size(),
+            "checked_out": engine.pool.checkedout(),
+            "overflow": engine.pool.overflow(),
+        },
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus テキスト形式のメトリクス"""
+    return metrics.metrics_response()
+
+
 # ===== Users (読み取り専用 - ntb_data テーブル参照) =====
 @app.get("/users/{user_id}", response_model=schemas.User)
 def read_user(user_id: int, db: Session = Depends(get_db)):
@@ -123,18 +230,75 @@ def read_user(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
+def _users_etag(skip: int, limit: int) -> str:
+    """ユーザー一覧の版から ETag を作る"""
+    db = SessionLocal()
+    try:
+        return make_etag("users", crud.get_users_version(db), skip, limit)
+    finally:
+        db.close()
+
+def _users_body(skip: int, limit: int) -> bytes:
+    """ユーザー一覧の JSON 本文"""
+    db = SessionLocal()
+    try:
+        users = crud.get_users(db, skip=skip, limit=limit)
+        return fast_json.encode_list(schemas.User, users)
+    finally:
+        db.close()
+
 @app.get("/users/", response_model=list[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return users
+async def read_users(request: Request, skip: int = 0, limit: int = 100):
+    # 同時に届いた同じ条件のリクエストは、版の確認と一覧の取得を1回ずつ共有する
+    key = single_flight.request_key(request)
+    etag = await single_flight.group.run_sync(f"{key}:etag", _users_etag, skip, limit)
+    # 一覧の版が変わっていなければ本体のクエリを実行せずに 304 を返す
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    body = await single_flight.group.run_sync(f"{key}:{etag}", _users_body, skip, limit)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 # Note: User はマスターデータ(ntb_data)のため、作成・更新・削除エンドポイントは提供しません
 
 # ===== Ships (読み取り専用 - ntb_data テーブル参照) =====
+def _ships_etag(skip: int, limit: int) -> str:
+    """船舶一覧の版から ETag を作る"""
+    db = SessionLocal()
+    try:
+        return make_etag("ships", crud.get_ships_version(db), skip, limit)
+    finally:
+        db.close()
+
+def _ships_body(skip: int, limit: int) -> bytes:
+    """船舶一覧の JSON 本文"""
+    db = SessionLocal()
+    try:
+        ships = crud.get_ships(db, skip=skip, limit=limit)
+        return fast_json.encode_list(schemas.Ship, ships)
+    finally:
+        db.close()
+
+def _prime_ship_list() -> None:
+    """起動時: 既定の条件の船舶一覧を圧縮済みキャッシュへ入れておく"""
+    etag = _ships_etag(0, 100)
+    compression.prime(etag, _ships_body(0, 100))
+
 @app.get("/ships/", response_model=list[schemas.Ship])
-def read_ships(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    ships = crud.get_ships(db, skip=skip, limit=limit)
-    return ships
+async def read_ships(request: Request, skip: int = 0, limit: int = 100):
+    # 同時に届いた同じ条件のリクエストは、版の確認と一覧の取得を1回ずつ共有する
+    key = single_flight.request_key(request)
+    etag = await single_flight.group.run_sync(f"{key}:etag", _ships_etag, skip, limit)
+    # 一覧の版が変わっていなければ本体のクエリを実行せずに 304 を返す
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    # 船舶一覧はほとんど変わらないため、ETag ごとに圧縮済みの本文を使い回す
+    cached = compression.cached_response(request, etag, headers={"ETag": etag})
+    if cached is not None:
+        return cached
+    body = compression.precompressed_cache.get(etag, "identity")
+    if body is None:
+        body = await single_flight.group.run_sync(f"{key}:{etag}", _ships_body, skip, limit)
+    return compression.precompressed_response(request, etag, body, headers={"ETag": etag})
 
 @app.get("/ships/{ship_id}", response_model=schemas.Ship)
 def read_ship(ship_id: int, db: Session = Depends(get_db)):
@@ -145,6 +309,218 @@ def read_ship(ship_id: int, db: Session = Depends(get_db)):
 
 # Note: Ship はマスターデータ(ntb_data)のため、作成・更新・削除エンドポイントは提供しません
 
+# ===== Projects =====
+def _project_tree_etag(project_id: int) -> Optional[str]:
+    """プロジェクト詳細の版から ETag を作る（プロジェクトが存在しない場合は None）"""
+    db = SessionLocal()
+    try:
+        version = crud.get_project_tree_version(db, project_id=project_id)
+        if version is None:
+            return None
+        return make_etag("project_tree", project_id, version)
+    finally:
+        db.close()
+
+def _project_tree_body(project_id: int) -> Optional[bytes]:
+    """プロジェクト詳細の JSON 本文（プロジェクトが存在しない場合は None）"""
+    db = SessionLocal()
+    try:
+        db_project = crud.get_project_tree(db, project_id=project_id)
+        if db_project is None:
+            return None
+        return fast_json.dump_model(schemas.ProjectTree, db_project)
+    finally:
+        db.close()
+
+@app.get("/projects/{project_id}/tree", response_model=schemas.ProjectTree)
+async def read_project_tree(
+    project_id: int,
+    request: Request,
+    db_user: models.User = Depends(require_project_access),
+):
+    """プロジェクト詳細（タスク・Todo・担当者・添付ファイル・コメント件数）を一括取得"""
+    # 同じプロジェクトを同時に開いたリクエストは、版の確認と詳細の取得を1回ずつ共有する
+    key = single_flight.request_key(request)
+    etag = await single_flight.group.run_sync(f"{key}:etag", _project_tree_etag, project_id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    body = await single_flight.group.run_sync(f"{key}:{etag}", _project_tree_body, project_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+@app.get("/projects/{project_id}/timeline", response_model=schemas.TimelinePage)
+def read_project_timeline(
+    project_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db_user: models.User = Depends(require_project_access),
+    db: Session = Depends(get_db),
+):
+    """タスク・Todoのコメント、添付ファイル、写真を新しい順に取得（next_cursor で続きを取得）"""
+    try:
+        return crud.get_project_timeline(db, project_id, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# ===== Events (Server-Sent Events) =====
+def subscribable_project_ids(
+    project_ids: str,
+    db_user: models.User = Depends(get_current_db_user),
+    db: Session = Depends(get_db),
+) -> list[int]:
+    """project_ids（カンマ区切り）を検証し、すべてにアクセスできる場合だけ返す"""
+    try:
+        ids = sorted({int(value) for value in project_ids.split(",") if value.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid project_ids")
+    if not ids:
+        raise HTTPException(status_code=400, detail="project_ids is required")
+    allowed = crud.filter_accessible_projects(db, ids, db_user.id)
+    denied = [project_id for project_id in ids if project_id not in allowed]
+    if denied:
+        raise HTTPException(status_code=403, detail=f"Access to projects {denied} is not allowed")
+    return ids
+
+@app.get("/events")
+async def stream_project_events(ids: list[int] = Depends(subscribable_project_ids)):
+    """
+    プロジェクトの変更通知を Server-Sent Events で受け取る
+
+    project_ids にカンマ区切りでプロジェクトIDを指定します（例: ?project_ids=1,2）。
+    ログインユーザーがオーナーまたは担当者でないプロジェクトが含まれる場合は 403 になります。
+    各イベントの data は {"project_id", "entity", "action", "key"} の JSON で、
+    クライアントは受け取ったときだけ該当データを再取得します。
+    """
+    return StreamingResponse(
+        events.event_stream(ids),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ===== Sync =====
+@app.get("/sync", response_model=schemas.SyncResponse)
+def read_changes(
+    since: Optional[str] = None,
+    project_id: Optional[int] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    db_user: models.User = Depends(get_current_db_user),
+    db: Session = Depends(get_db),
+):
+    """
+    差分同期: since（前回レスポンスの cursor）以降の変更と削除を取得
+
+    since を省略すると全件を返します。has_more が true の場合は、
+    返された cursor を since に指定して続きを取得してください。
+    返るのはログインユーザーがオーナーまたは担当者のプロジェクトの行だけです。
+    """
+    if project_id is not None:
+        check_project_access(db, project_id, db_user)
+    try:
+        return crud.get_changes_since(db, since=since, project_id=project_id, limit=limit, user_id=db_user.id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# ===== My work =====
+@app.get("/me/work", response_model=schemas.MyWork)
+def read_my_work(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=200),
+    user: Dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """ログインユーザーに割り当てられた未完了のTodo・タスクを全プロジェクト横断で取得"""
+    db_user = crud.get_user_by_ms_id(db, ms_id=user["ms_oid"])
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {
+        "user_id": db_user.id,
+        "todos": crud.get_open_todos_for_user(db, db_user.id, skip=skip, limit=limit),
+        "tasks": crud.get_open_tasks_for_user(db, db_user.id, skip=skip, limit=limit),
+    }
+
+
+# ===== Workload =====
+@app.get("/workload/", response_model=list[schemas.WorkloadEntry])
+def read_workload(
+    project_id: Optional[int] = None,
+    start_from: Optional[datetime] = None,
+    start_to: Optional[datetime] = None,
+    db_user: models.User = Depends(get_current_db_user),
+    db: Session = Depends(get_db),
+):
+    """
+    担当者ごとの未完了Todo・タスク件数と最古の開始日時（集計はDB側で実行）
+
+    集計するのはログインユーザーがオーナーまたは担当者のプロジェクトだけです。
+    """
+    if project_id is not None:
+        check_project_access(db, project_id, db_user)
+    return crud.get_workload(
+        db, project_id=project_id, start_from=start_from, start_to=start_to, user_id=db_user.id
+    )
+
+
+# ===== Export =====
+@app.get("/export/{entity}")
+def export_rows(
+    entity: Literal["projects", "tasks", "todos"],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    project_id: Optional[int] = None,
+    db_user: models.User = Depends(get_current_db_user),
+    db: Session = Depends(get_db),
+):
+    """
+    プロジェクト・タスク・Todoを NDJSON / CSV でストリーミング出力
+
+    出力されるのはログインユーザーがオーナーまたは担当者のプロジェクトの行だけです。
+    サーバーサイドカーソルで読みながら EXPORT_CHUNK_SIZE ごとにまとめて送信するため、
+    件数に関係なくメモリ使用量は一定で、最初のチャンクはすぐに返り始めます。
+    """
+    if project_id is not None:
+        check_project_access(db, project_id, db_user)
+    return StreamingResponse(
+        export_stream.stream_export(entity, format, project_id=project_id, user_id=db_user.id),
+        media_type=export_stream.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'},
+    )
+
+
+# ===== Batch =====
+@app.post("/batch", response_model=schemas.BatchResponse)
+def run_batch(
+    batch: schemas.BatchRequest,
+    user: Dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    複数の作成・更新・削除を1トランザクションで実行
+
+    後続の操作は "$参照名.フィールド" で先行操作の結果（採番された todo_number など）を参照できます。
+    "$" で始まる文字列をそのまま保存したい場合は "$$" と書いてください（例: "$$100" → "$100"）。
+    操作できるのはログインユーザーがオーナーまたは担当者のプロジェクトの行だけです。
+    いずれかの操作が失敗した場合はすべてロールバックされます。
+    """
+    db_user = crud.get_user_by_ms_id(db, ms_id=user["ms_oid"])
+    if db_user is None:
+        raise HTTPException(status_code=403, detail="User not found")
+    try:
+        results = crud.execute_batch(db, batch.operations, user_id=db_user.id)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": results}
+
 
 
 # http://127.0.0.1:8000/redoc （ReDoc） 
@@ -0,0 +1,257 @@
+"""
+Prometheus メトリクス (/metrics)
+
+次の値を Prometheus のテキスト形式で公開します。
+
+- http_request_duration_seconds: ルートテンプレート (/projects/{project_id} など) ごとのレイテンシ
+- http_requests_in_progress: 処理中のリクエスト数
+- db_query_duration_seconds: SQL 1回ごとの実行時間
+- redis_call_duration_seconds: auth.py の Redis 呼び出し時間
+- graph_call_duration_seconds: ms_file_control.py などの Graph 呼び出し時間
+- http_request_dependency_seconds: 1リクエスト内の DB / Redis / Graph の合計時間
+- threadpool_active_threads / threadpool_queue_depth: スレッドプールの状態
+- threadpool_wait_seconds: スレッドプールへ投入されてから実行が始まるまでの時間
+- http_requests_rejected_total: レート制限・アドミッション制御で拒否したリクエスト数
+- single_flight_shared_total: 実行中の同一リクエストの結果を共有した回数
+
+uvicorn を複数ワーカーで動かす場合は、起動前に PROMETHEUS_MULTIPROC_DIR に
+空のディレクトリを指定してください。各ワーカーの値がファイル経由で集計されます。
+METRICS_ENABLED=False で計測を無効にできます。
+"""
+
+import contextvars
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+import anyio.to_thread
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being processed",
+    multiprocess_mode="livesum",
+)
+REQUEST_DEPENDENCY_TIME = Histogram(
+    "http_request_dependency_seconds",
+    "Total DB / Redis / Graph time spent within one request",
+    ["route", "dependency"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_TIME = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    ["operation"],
+    buckets=CALL_BUCKETS,
+)
+REDIS_CALL_TIME = Histogram(
+    "redis_call_duration_seconds",
+    "Redis call time",
+    ["operation"],
+    buckets=CALL_BUCKETS,
+)
+GRAPH_CALL_TIME = Histogram(
+    "graph_call_duration_seconds",
+    "Microsoft Graph call time",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+THREADPOOL_ACTIVE = Gauge(
+    "threadpool_active_threads",
+    "Worker threads currently running sync handlers",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_QUEUE = Gauge(
+    "threadpool_queue_depth",
+    "Tasks waiting for a free worker thread",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_WAIT = Histogram(
+    "threadpool_wait_seconds",
+    "Time from submitting a sync call to the threadpool until it starts running",
+    buckets=CALL_BUCKETS,
+)
+
+REQUESTS_REJECTED = Counter(
+    "http_requests_rejected_total",
+    "Requests rejected with 429 by rate limiting or admission control",
+    ["reason"],
+)
+SINGLE_FLIGHT_SHARED = Counter(
+    "single_flight_shared_total",
+    "Requests that reused the result of an identical in-flight request",
+)
+
+_HISTOGRAMS = {
+    "db": DB_QUERY_TIME,
+    "redis": REDIS_CALL_TIME,
+    "graph": GRAPH_CALL_TIME,
+}
+
+# リクエストごとの {"db": 秒, "redis": 秒, "graph": 秒}
+# 辞書を共有するので、スレッドプール側での加算もリクエスト全体から見える
+_request_totals: contextvars.ContextVar = contextvars.ContextVar("metrics_request_totals", default=None)
+_instrumented_engines = set()
+
+
+def _observe(dependency: str, operation: str, seconds: float) -> None:
+    _HISTOGRAMS[dependency].labels(operation=operation).observe(seconds)
+    totals = _request_totals.get()
+    if totals is not None:
+        totals[dependency] += seconds
+
+
+def observe_threadpool_wait(seconds: float) -> None:
+    """スレッドプールの待ち時間を記録する（threadpool.instrument_run_sync から呼ばれる）"""
+    if METRICS_ENABLED:
+        THREADPOOL_WAIT.observe(seconds)
+
+
+@contextmanager
+def track(dependency: str, operation: str):
+    """ブロックの実行時間を dependency ("db" / "redis" / "graph") の時間として記録する"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe(dependency, operation, time.perf_counter() - started)
+
+
+def timed(dependency: str, operation: Optional[str] = None):
+    """
+    関数の実行時間を記録するデコレーター（同期関数・async 関数の両方に対応）
+
+    使い方:
+        @metrics.timed("redis")
+        def get_token_info_from_redis(ms_oid): ...
+    """
+    def decorator(func):
+        name = operation or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track(dependency, name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(dependency, name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_query_start"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    _observe("db", operation, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # エラー時は after_cursor_execute が呼ばれないので開始時刻を捨てる
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("metrics_query_start"):
+        conn.info["metrics_query_start"].pop()
+
+
+def instrument_engine(engine=None) -> None:
+    """エンジンに SQL 実行時間の計測イベントを登録する（同じエンジンには1回だけ）"""
+    if not METRICS_ENABLED:
+        return
+    if engine is None:
+        from database import engine
+    if id(engine) in _instrumented_engines:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    _instrumented_engines.add(id(engine))
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ルートテンプレートごとのレイテンシと処理中リクエスト数を記録する"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+        totals = {"db": 0.0, "redis": 0.0, "graph": 0.0}
+        token = _request_totals.set(totals)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            _request_totals.reset(token)
+            route = _route_template(scope)
+            REQUEST_LATENCY.labels(
+                method=scope["method"], route=route, status=str(status["code"])
+            ).observe(time.perf_counter() - started)
+            for dependency, seconds in totals.items():
+                REQUEST_DEPENDENCY_TIME.labels(route=route, dependency=dependency).observe(seconds)
+            pool = anyio.to_thread.current_default_thread_limiter().statistics()
+            THREADPOOL_ACTIVE.set(pool.borrowed_tokens)
+            THREADPOOL_QUEUE.set(pool.tasks_waiting)
+
+
+def metrics_response() -> Response:
+    """/metrics 用のレスポンス（マルチプロセス時は全ワーカー分を集計）"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,10 +1,11 @@
 from datetime import datetime
 from pytz import timezone
-from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, Text, Boolean, PrimaryKeyConstraint, ForeignKeyConstraint, event, text, Numeric, Enum, Table
+from sqlalchemy import select, literal, func, Column, DateTime, String, Integer, ForeignKey, Text, Boolean, PrimaryKeyConstraint, ForeignKeyConstraint, Index, event, text, Numeric, Enum, Table
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.declarative import declared_attr, declarative_base
 from sqlalchemy.orm import relationship
 import enum
+import json
 
 # SQLAlchemy Base
 Base = declarative_base()
@@ -32,11 +33,13 @@ class TimestampMixin:
 
     @declared_attr
     def updated_at(cls):
+        # 差分同期 (crud.get_changes_since) と ETag の版取得で範囲検索するためインデックスを張る
         return Column(
             DateTime,
             default=lambda: datetime.now(timezone("Asia/Tokyo")),
             onupdate=lambda: datetime.now(timezone("Asia/Tokyo")),
             nullable=False,
+            index=True,
         )
 
 
@@ -246,6 +249,8 @@ class TaskAssignment(Base, TimestampMixin):
             ["project_id", "task_number"],
             ["tasks.project_id", "tasks.task_number"],
         ),
+        # 担当者ごとの一覧 (crud.get_open_tasks_for_user) を1回のインデックス範囲走査で取得するため
+        Index("ix_task_assignments_user_task", "user_id", "project_id", "task_number"),
     )
 
     # Relationships
@@ -274,6 +279,8 @@ class TodoAssignment(Base, TimestampMixin):
             ["project_id", "task_number", "todo_number"],
             ["todos.project_id", "todos.task_number", "todos.todo_number"],
         ),
+        # 担当者ごとの一覧 (crud.get_open_todos_for_user) を1回のインデックス範囲走査で取得するため
+        Index("ix_todo_assignments_user_todo", "user_id", "project_id", "task_number", "todo_number"),
     )
 
     # Relationships
@@ -307,6 +314,8 @@ class TaskAttachment(Base, TimestampMixin):
             ["project_id", "task_number"],
             ["tasks.project_id", "tasks.task_number"],
         ),
+        # プロジェクトのタイムライン (crud.get_project_timeline) を新しい順に読むため
+        Index("ix_task_attachments_project_created", "project_id", "created_at"),
     )
 
     # Relationships
@@ -345,6 +354,8 @@ class TodoAttachment(Base, TimestampMixin):
             ["project_id", "task_number", "todo_number"],
             ["todos.project_id", "todos.task_number", "todos.todo_number"],
         ),
+        # プロジェクトのタイムライン (crud.get_project_timeline) を新しい順に読むため
+        Index("ix_todo_attachments_project_created", "project_id", "created_at"),
     )
 
     # Relationships
@@ -379,6 +390,8 @@ class TaskComment(Base, TimestampMixin):
             ["project_id", "task_number"],
             ["tasks.project_id", "tasks.task_number"],
         ),
+        # プロジェクトのタイムライン (crud.get_project_timeline) を新しい順に読むため
+        Index("ix_task_comments_project_created", "project_id", "created_at"),
     )
 
     # Relationships
@@ -409,6 +422,8 @@ class TodoComment(Base, TimestampMixin):
             ["project_id", "task_number", "todo_number"],
             ["todos.project_id", "todos.task_number", "todos.todo_number"],
         ),
+        # プロジェクトのタイムライン (crud.get_project_timeline) を新しい順に読むため
+        Index("ix_todo_comments_project_created", "project_id", "created_at"),
     )
 
     # Relationships
@@ -445,6 +460,8 @@ class ProjectPhoto(Base, TimestampMixin):
             use_alter=True,
             ondelete="SET NULL"
         ),
+        # プロジェクトのタイムライン (crud.get_project_timeline) を新しい順に読むため
+        Index("ix_project_photos_project_created", "project_id", "created_at"),
     )
 
     # Relationships
@@ -483,3 +500,69 @@ class ProjectPhoto(Base, TimestampMixin):
         self.todo_number = todo_number
         self.category = category
         self.description = description
+
+
+# Tombstone Model (差分同期用の削除記録)
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(64), nullable=False)
+    project_id = Column(Integer, nullable=True, index=True)
+    record_key = Column(String(255), nullable=False)  # 削除した行の主キー (JSON)
+    deleted_at = Column(
+        DateTime,
+        default=lambda: datetime.now(timezone("Asia/Tokyo")),
+        nullable=False,
+        index=True,
+    )
+
+
+# 差分同期の対象モデル（削除時に Tombstone を記録する）
+SYNC_MODELS = (
+    Project, Task, Todo,
+    TaskComment, TodoComment,
+    TaskAttachment, TodoAttachment,
+    ProjectPhoto,
+)
+
+
+def _tombstone_after_delete(mapper, connection, target):
+    """ORM 経由の削除時に Tombstone を記録する"""
+    key = {column.key: getattr(target, column.key) for column in mapper.primary_key}
+    project_id = target.id if isinstance(target, Project) else target.project_id
+    connection.execute(
+        Tombstone.__table__.insert().values(
+            table_name=mapper.local_table.name,
+            project_id=project_id,
+            record_key=json.dumps(key, sort_keys=True),
+            deleted_at=datetime.now(timezone("Asia/Tokyo")),
+        )
+    )
+
+
+def tombstone_insert_from_select(model, criteria):
+    """DELETE ... WHERE を直接発行する前に実行する INSERT ... SELECT を組み立てる
+
+    削除対象の行から主キーと project_id を DB 側で読み取って Tombstone を作るため、
+    Python 側へ行を読み込む必要がない。
+    """
+    table = model.__table__
+    project_column = table.c.id if model is Project else table.c.project_id
+    key_args = []
+    for column in table.primary_key.columns:
+        key_args.extend([literal(column.key), column])
+    rows = select(
+        literal(table.name),
+        project_column,
+        func.json_object(*key_args),
+        literal(datetime.now(timezone("Asia/Tokyo"))),
+    ).where(*criteria)
+    return Tombstone.__table__.insert().from_select(
+        ["table_name", "project_id", "record_key", "deleted_at"], rows
+    )
+
+
+# `after_delete` イベントで Tombstone を記録
+for _model in SYNC_MODELS:
+    event.listen(_model, "after_delete", _tombstone_after_delete)
@@ -9,9 +9,21 @@ FlaskからFastAPIへ移植し、async/awaitに対応しています。
 - FastAPIの UploadFile オブジェクトに対応
 - file.read() を await file.read() に変更
 - file.seek(0) を file.file.seek(0) に変更（FastAPIのUploadFileは同期seek）
+
+同期版の関数は requests のセッションを共有し、接続を使い回します。
+async の関数と *_async 版の関数は graph_client の共有 httpx.AsyncClient（接続プール付き）で
+Graph を呼び出すので、転送中もイベントループを止めません。トークン取得は
+MSAL の更新で通信が発生することがあるため、スレッドプールで実行します。
+
+UploadFile やファイルパスからのアップロードは全体を読み込まず、一時ファイルから
+UPLOAD_CHUNK_SIZE ずつ使い回しのバッファに読み込んで送ります（4MB を超える場合は
+アップロードセッション）。1件あたりのメモリ使用量はファイルサイズによらず一定です。
 """
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from starlette.concurrency import run_in_threadpool
 from io import BytesIO
 import re, os
 from datetime import datetime
@@ -27,74 +39,152 @@ try:
     from . import app_config
 except ImportError:
     import app_config
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+try:
+    from . import graph_client
+except ImportError:
+    import graph_client
+
+GRAPH_BASE_URL = graph_client.GRAPH_BASE_URL
+
+# 同期版の関数が共有するセッション（プールの大きさは graph_client の keep-alive 数に合わせる）
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_maxsize=graph_client.GRAPH_MAX_KEEPALIVE_CONNECTIONS))
+_session.mount("http://", HTTPAdapter(pool_maxsize=graph_client.GRAPH_MAX_KEEPALIVE_CONNECTIONS))
+
+# Graph の単純アップロード (PUT .../content) の上限。これを超えるとアップロードセッションを使う
+SIMPLE_UPLOAD_LIMIT = 4 * 1024 * 1024
+# アップロードセッションで1回に送るサイズ。Graph の要件で 320KiB の倍数にする（既定 10MiB）
+UPLOAD_CHUNK_UNIT = 320 * 1024
+UPLOAD_CHUNK_SIZE = max(
+    UPLOAD_CHUNK_UNIT,
+    int(os.getenv("GRAPH_UPLOAD_CHUNK_SIZE", 10 * 1024 * 1024)) // UPLOAD_CHUNK_UNIT * UPLOAD_CHUNK_UNIT,
+)
+# 送信時にソケットへ一度に渡すサイズ
+SEND_PIECE_SIZE = 256 * 1024
+
 
+async def _get_token_async(auth, app_config):
+    return await run_in_threadpool(auth.get_token_for_user, app_config.SCOPE)
 
+
+def _drive_url(app_config, path):
+    return f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/{path}'
+
+
+def _file_size(fileobj):
+    """ファイルオブジェクトのサイズを返し、読み込み位置を先頭にする"""
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
+
+
+def _readinto(fileobj, view):
+    """view が埋まるまで読み込み、読み込んだバイト数を返す（ファイル末尾では短くなる）"""
+    filled = 0
+    while filled < len(view):
+        read = fileobj.readinto(view[filled:])
+        if not read:
+            break
+        filled += read
+    return filled
+
+
+async def _put_view(client, url, view, headers):
+    """
+    memoryview をコピーせずに送信する（Content-Length を明示してチャンク転送にしない）
+
+    HTTP ライブラリ側で渡した単位ごとに bytes が作られるため、SEND_PIECE_SIZE ずつ渡す
+    """
+    async def body():
+        for offset in range(0, len(view), SEND_PIECE_SIZE):
+            yield view[offset:offset + SEND_PIECE_SIZE]
+    return await client.put(url, headers={**headers, 'Content-Length': str(len(view))}, content=body())
+
+
+async def _stream_upload(fileobj, file_name, folder_id, access_token, app_config):
+    """
+    ファイルオブジェクトを先頭から読みながら folder_id に file_name でアップロードする
+
+    4MB以下は単純アップロード、それを超える場合はアップロードセッションで送る。
+    読み込みはスレッドプールで行い、バッファは1つを使い回す。
+
+    Returns:
+        (file_id, status_code): 失敗時は file_id が None
+    """
+    size = await run_in_threadpool(_file_size, fileobj)
+    if size > SIMPLE_UPLOAD_LIMIT:
+        file_id, _, status_code = await upload_large_file_to_spo_async(fileobj, file_name, folder_id, access_token, app_config)
+        return file_id, status_code
+
+    buffer = memoryview(bytearray(size))
+    read = await run_in_threadpool(_readinto, fileobj, buffer)
+    endpoint = _drive_url(app_config, f'items/{folder_id}:/{file_name}:/content')
+    headers = {
+        'Authorization': 'Bearer ' + access_token,
+        'Content-Type': 'application/octet-stream'
+    }
+    response = await _put_view(graph_client.get_graph_client(), endpoint, buffer[:read], headers)
+    if response.status_code in (200, 201):
+        return response.json()['id'], response.status_code
+    return None, response.status_code
+
+
+async def _stream_upload_file(file, file_name, folder_id, access_token, app_config):
+    """UploadFile を一時ファイルから直接アップロードし、読み込み位置を先頭に戻す"""
+    # FastAPI UploadFileはseekが同期メソッド
+    fileobj = file.file if hasattr(file, 'file') else file
+    try:
+        return await _stream_upload(fileobj, file_name, folder_id, access_token, app_config)
+    finally:
+        fileobj.seek(0)
+
+
+@metrics.timed("graph")
 async def upload_file_to_sharepoint(file, auth, app_config):
     try:
-        token_response = auth.get_token_for_user(app_config.SCOPE)
+        token_response = await _get_token_async(auth, app_config)
         if not token_response:
             return None, 401
 
-        headers = {
-            'Authorization': 'Bearer ' + token_response['access_token'],
-            'Content-Type': 'application/octet-stream'
-        }
-        file_name = file.filename
-        file_content = await file.read()
-        # FastAPI UploadFileはseekが同期メソッド
-        if hasattr(file, 'file'):
-            file.file.seek(0)
         # MOL DRIVE
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{app_config.parent_folder_id}:/{file_name}:/content'
-
-        response = requests.put(endpoint, headers=headers, data=file_content)
-
-        if response.status_code in (200, 201):
-            file_info = response.json()
-            file_id = file_info['id']
+        file_id, status_code = await _stream_upload_file(
+            file, file.filename, app_config.parent_folder_id, token_response['access_token'], app_config
+        )
+        if file_id:
             return file_id, None
         else:
-            return None, response.status_code
+            return None, status_code
     except Exception as e:
         # print(f"Error in upload_file_to_sharepoint: {e}")
-        if 'response' in locals():
-            return None, response.status_code
-        else:
-            return None, 500
+        return None, 500
 
 # 添付ファイルをアップロード       
+@metrics.timed("graph")
 async def upload_attachment_to_sharepoint(file, auth, app_config):
     try:
-        token_response = auth.get_token_for_user(app_config.SCOPE)
+        token_response = await _get_token_async(auth, app_config)
         if not token_response:
             return None, 401
 
-        headers = {
-            'Authorization': 'Bearer ' + token_response['access_token'],
-            'Content-Type': 'application/octet-stream'
-        }
         file_name = generate_unique_filename(file)
-        file_content = await file.read()
-        # FastAPI UploadFileはseekが同期メソッド
-        if hasattr(file, 'seek'):
-            file.file.seek(0)
         # MOL DRIVE
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{app_config.attached_maint_folder_id}:/{file_name}:/content'
-
-        response = requests.put(endpoint, headers=headers, data=file_content)
-
-        if response.status_code in (200, 201):
-            file_info = response.json()
-            return file_info['id'], app_config.attached_maint_folder_id, response.status_code
+        file_id, status_code = await _stream_upload_file(
+            file, file_name, app_config.attached_maint_folder_id, token_response['access_token'], app_config
+        )
+        if file_id:
+            return file_id, app_config.attached_maint_folder_id, status_code
         else:
-            return None, response.status_code
+            return None, status_code
     except Exception as e:
         # print(f"Error in upload_file_to_sharepoint: {e}")
-        if 'response' in locals():
-            return None, response.status_code
-        else:
-            return None, 500
+        return None, 500
 
+@metrics.timed("graph")
 def upload_edited_files(file_content,file_name, auth, app_config):
     try:
         token_response = auth.get_token_for_user(app_config.SCOPE)
@@ -106,9 +196,9 @@ def upload_edited_files(file_content,file_name, auth, app_config):
             'Content-Type': 'application/octet-stream'
         }
         # MOL DRIVE
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{app_config.Edited_Files}:/{file_name}:/content'
+        endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{app_config.Edited_Files}:/{file_name}:/content'
 
-        response = requests.put(endpoint, headers=headers, data=file_content)
+        response = _session.put(endpoint, headers=headers, data=file_content)
 
         if response.status_code in (200, 201):
             file_info = response.json()
@@ -123,36 +213,23 @@ def upload_edited_files(file_content,file_name, auth, app_config):
         else:
             return None, 500
 
+@metrics.timed("graph")
 async def upload_file_to_specific_folder(file, folder_id, auth, app_config):
     try:
-        token_response = auth.get_token_for_user(app_config.SCOPE)
+        token_response = await _get_token_async(auth, app_config)
         if not token_response:
             return None
 
-        headers = {
-            'Authorization': 'Bearer ' + token_response['access_token'],
-            'Content-Type': 'application/octet-stream'
-        }
-        file_name = file.filename
-        file_content = await file.read()
-        # FastAPI UploadFileはseekが同期メソッド
-        if hasattr(file, 'file'):
-            file.file.seek(0)
         # MOL DRIVE
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{folder_id}:/{file_name}:/content'
-        
-        response = requests.put(endpoint, headers=headers, data=file_content)
-        
-        if response.status_code in (200, 201):
-            file_info = response.json()
-            file_id = file_info['id']
-            return file_id
-        else:
-            return None
+        file_id, _ = await _stream_upload_file(
+            file, file.filename, folder_id, token_response['access_token'], app_config
+        )
+        return file_id
     except Exception as e:
         # print(f"Error in upload_file_to_specific_folder: {e}")
         return None
 
+@metrics.timed("graph")
 def list_files(auth, folder_id=None, app_config=None):
     token_response = auth.get_token_for_user(app_config.SCOPE)
     if not token_response:
@@ -165,12 +242,12 @@ def list_files(auth, folder_id=None, app_config=None):
     }
     # NTB DRIVE
     if folder_id:
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{folder_id}/children'
+        endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{folder_id}/children'
     else:
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{app_config.parent_folder_id}/children'
+        endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{app_config.parent_folder_id}/children'
         # endpoint = app_config.ENDPOINT
 
-    response = requests.get(endpoint, headers=headers)
+    response = _session.get(endpoint, headers=headers)
     
     if response.status_code == 200:
         items = response.json()['value']
@@ -183,6 +260,7 @@ def list_files(auth, folder_id=None, app_config=None):
     else:
         return None, None, None, None, response.status_code, response
 
+@metrics.timed("graph")
 def download_file(file_id, auth, app_config):
     token_response = auth.get_token_for_user(app_config.SCOPE)
     if not token_response:
@@ -192,15 +270,16 @@ def download_file(file_id, auth, app_config):
         'Accept': 'application/octet-stream'
     }
     # MOL DRIVE
-    endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}/content'
+    endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}/content'
 
 
-    response = requests.get(endpoint, headers=headers, stream=True)
+    response = _session.get(endpoint, headers=headers, stream=True)
     if response.status_code == 200:
         return BytesIO(response.content),  response.status_code
     else:
         return None, response.status_code
     
+@metrics.timed("graph")
 def get_shared_link(file_id, auth, app_config):
     token_response = auth.get_token_for_user(app_config.SCOPE)
     if not token_response:
@@ -211,13 +290,13 @@ def get_shared_link(file_id, auth, app_config):
         'Accept': 'application/json',
         'Content-Type': 'application/json'
     }
-    endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}/createLink'
+    endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}/createLink'
     body = {
         "type": "view",
         "scope": "anonymous"
     }
 
-    response = requests.post(endpoint, headers=headers, json=body)
+    response = _session.post(endpoint, headers=headers, json=body)
     # print(f"SharePoint API response: {response.status_code}")
     # print(f"Response content: {response.content}")
     if response.status_code in [200, 201, 202]:  # 成功の可能性があるコードを追加
@@ -231,6 +310,7 @@ def get_shared_link(file_id, auth, app_config):
         return None, response.status_code
 
     
+@metrics.timed("graph")
 def get_preview_url(file_id, auth, app_config):
     """Office ファイルのプレビュー URL を取得する"""
     # トークンを取得
@@ -242,13 +322,13 @@ def get_preview_url(file_id, auth, app_config):
     access_token = token_response['access_token']
     
     # ファイル情報を取得（ダウンロードURLを含む）
-    endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}'
+    endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}'
     headers = {
         'Authorization': 'Bearer ' + access_token,
         'Accept': 'application/json'
     }
     
-    response = requests.get(endpoint, headers=headers)
+    response = _session.get(endpoint, headers=headers)
     # print(f"SharePoint API response: {response.status_code}")
     
     if response.status_code == 200:
@@ -267,6 +347,7 @@ def get_preview_url(file_id, auth, app_config):
         # print(f"Response content: {response.text}")
         return None, response.status_code
         
+@metrics.timed("graph")
 def create_folder(folder_name, auth, app_config):
     token_response = auth.get_token_for_user(app_config.SCOPE)
     if not token_response:
@@ -278,11 +359,11 @@ def create_folder(folder_name, auth, app_config):
     }
 
     # MOL DRIVE
-    endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/root/children'
+    endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/root/children'
     
     if folder_name:
         # フォルダが存在するか確認
-        response = requests.get(endpoint, headers=headers)
+        response = _session.get(endpoint, headers=headers)
         if response.status_code in (200, 201):
             children = response.json().get('value', [])
             for child in children:
@@ -298,7 +379,7 @@ def create_folder(folder_name, auth, app_config):
         "@microsoft.graph.conflictBehavior": "rename"
     }
 
-    response = requests.post(endpoint, headers=headers, json=folder_data)
+    response = _session.post(endpoint, headers=headers, json=folder_data)
     
     if response.status_code in (200, 201):
         folder_id = response.json().get('id')
@@ -306,6 +387,7 @@ def create_folder(folder_name, auth, app_config):
     else:
         return None, response.status_code
 
+@metrics.timed("graph")
 def user_info(auth, app_config=None):
     token_response = auth.get_token_for_user(app_config.SCOPE)
     if not token_response:
@@ -316,9 +398,9 @@ def user_info(auth, app_config=None):
         'Accept': 'application/json'
     }
 
-    endpoint = "https://graph.microsoft.com/v1.0/me"
+    endpoint = f'{GRAPH_BASE_URL}/me'
     
-    response = requests.get(endpoint, headers=headers)
+    response = _session.get(endpoint, headers=headers)
     user_info = response.json()
 
     return user_info    
@@ -336,6 +418,7 @@ def id_from_filename(filename):
         # マッチングしなかった場合はエラーを発生させる
         raise ValueError(f"Invalid filename format: {filename}")
 
+@metrics.timed("graph")
 def delete_file(file_id, auth, app_config):
     try:
         # 入力値のバリデーション
@@ -374,7 +457,7 @@ def delete_file(file_id, auth, app_config):
         
         # エンドポイント構築
         try:
-            endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}'
+            endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}'
             # print(f"delete_file: Sending DELETE request to {endpoint}")
         except Exception as endpoint_error:
             print(f"delete_file: Error constructing endpoint: {endpoint_error}")
@@ -382,7 +465,7 @@ def delete_file(file_id, auth, app_config):
         
         # API呼び出し
         try:
-            response = requests.delete(endpoint, headers=headers, timeout=30)
+            response = _session.delete(endpoint, headers=headers, timeout=30)
             # print(f"delete_file: Response status_code={response.status_code}")
         except requests.exceptions.Timeout:
             print("delete_file: Request timed out")
@@ -409,6 +492,7 @@ def delete_file(file_id, auth, app_config):
         print(f"Unexpected error in delete_file: {type(e).__name__}: {e}")
         return False, 500
 
+@metrics.timed("graph")
 def delete_folder(folder_id, auth, app_config):
     try:
         token_response = auth.get_token_for_user(app_config.SCOPE)
@@ -419,9 +503,9 @@ def delete_folder(folder_id, auth, app_config):
             'Authorization': 'Bearer ' + token_response['access_token']
         }
         # MOL DRIVE
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{folder_id}'        
+        endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{folder_id}'        
         
-        response = requests.delete(endpoint, headers=headers)
+        response = _session.delete(endpoint, headers=headers)
         
         if response.status_code == 204:  # No Content, meaning the delete was successful
             return True, response.status_code
@@ -431,113 +515,83 @@ def delete_folder(folder_id, auth, app_config):
         # print(f"Error in delete_folder: {e}")
         return False, 500
         
+@metrics.timed("graph")
 async def attache_file_to_spo(file, auth, app_config, folder=None):
     try:
-         # Check if file is a string (file path)
+        token_response = await _get_token_async(auth, app_config)
+        if not token_response:
+            return None, None, 401
+
+        # Check if file is a string (file path)
         if isinstance(file, str):
-            with open(file, 'rb') as f:
-                file_content = f.read()
-                # ファイルパスから直接処理
-                token_response = auth.get_token_for_user(app_config.SCOPE)
-                if not token_response:
-                    return None, None, 401
-
-                headers = {
-                    'Authorization': 'Bearer ' + token_response['access_token'],
-                    'Content-Type': 'application/octet-stream'
-                }
-                file_name = os.path.basename(file)
-                current_datetime = datetime.now(timezone("Asia/Tokyo")).strftime("%Y%m%d%H%M%S")
-                new_file_name = f"{current_datetime}_{file_name}"
+            file_name = os.path.basename(file)
         else:
             # UploadFileオブジェクトの場合
-            token_response = auth.get_token_for_user(app_config.SCOPE)
-            if not token_response:
-                return None, None, 401
-
-            headers = {
-                'Authorization': 'Bearer ' + token_response['access_token'],
-                'Content-Type': 'application/octet-stream'
-            }
             file_name = os.path.basename(file.filename if hasattr(file, 'filename') else file.name)
-            current_datetime = datetime.now(timezone("Asia/Tokyo")).strftime("%Y%m%d%H%M%S")
-            new_file_name = f"{current_datetime}_{file_name}"
-            
-            file_content = await file.read()
-            # FastAPI UploadFileはseekが同期メソッド
-            if hasattr(file, 'file'):
-                file.file.seek(0)
-        # トークンを取得済みなので、ここから共通処理
+        current_datetime = datetime.now(timezone("Asia/Tokyo")).strftime("%Y%m%d%H%M%S")
+        new_file_name = f"{current_datetime}_{file_name}"
+
         if folder == None:
             spo_folder_id = app_config.ship_data_folder_id
         elif folder == 'request':
             spo_folder_id = app_config.request_data_folder_id
-        
-        # ファイルサイズをチェック (4MB = 4,194,304 bytes)
-        file_size = len(file_content)
-        
-        # 4MB以上のファイルはアップロードセッションを使用
-        if file_size > 4 * 1024 * 1024:
-            return upload_large_file_to_spo(file_content, new_file_name, spo_folder_id, token_response['access_token'], app_config)
-        
-        # 4MB以下のファイルは通常のPUTを使用
-        # MOL DRIVE
-        endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{spo_folder_id}:/{new_file_name}:/content'
 
-        response = requests.put(endpoint, headers=headers, data=file_content)
-        # print(response.status_code)
-        # print(response.json())
+        # 4MB以下は通常のPUT、それを超えるファイルはアップロードセッションで少しずつ送る
+        # MOL DRIVE
+        access_token = token_response['access_token']
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                file_id, status_code = await _stream_upload(f, new_file_name, spo_folder_id, access_token, app_config)
+        else:
+            file_id, status_code = await _stream_upload_file(file, new_file_name, spo_folder_id, access_token, app_config)
 
-        if response.status_code in (200, 201):
-            file_info = response.json()
-            file_id = file_info['id']
-            folder_id = spo_folder_id
-            return file_id,folder_id, response.status_code
+        if file_id:
+            return file_id, spo_folder_id, status_code
         else:
-            return None, None, response.status_code
+            return None, None, status_code
     except Exception as e:
         # print(f"Error in attache_file_to_spo: {e}")
-        if 'response' in locals():
-            return None, None, response.status_code
-        else:
-            return None, None, 500
+        return None, None, 500
 
+@metrics.timed("graph")
 def upload_large_file_to_spo(file_content, file_name, folder_id, access_token, app_config):
     """
     4MB以上のファイルをアップロードするための関数（チャンクアップロード）
     """
     try:
         # アップロードセッションを作成
-        create_session_url = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{folder_id}:/{file_name}:/createUploadSession'
+        create_session_url = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{folder_id}:/{file_name}:/createUploadSession'
         
         headers = {
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json'
         }
         
-        session_response = requests.post(create_session_url, headers=headers)
+        session_response = _session.post(create_session_url, headers=headers)
         
         if session_response.status_code not in (200, 201):
             return None, None, session_response.status_code
         
         upload_url = session_response.json()['uploadUrl']
         
-        # ファイルをチャンクに分割してアップロード (10MB チャンク)
-        chunk_size = 10 * 1024 * 1024  # 10MB
-        file_size = len(file_content)
+        # ファイルをチャンクに分割してアップロード (UPLOAD_CHUNK_SIZE ずつ)
+        # memoryview のスライスはコピーを作らない
+        chunk_size = UPLOAD_CHUNK_SIZE
+        view = memoryview(file_content)
+        file_size = len(view)
         chunks = (file_size + chunk_size - 1) // chunk_size
         
         for i in range(chunks):
             start = i * chunk_size
             end = min(start + chunk_size, file_size)
-            chunk = file_content[start:end]
+            chunk = view[start:end]
             
             chunk_headers = {
                 'Content-Length': str(len(chunk)),
                 'Content-Range': f'bytes {start}-{end-1}/{file_size}'
             }
             
-            chunk_response = requests.put(upload_url, headers=chunk_headers, data=chunk)
+            chunk_response = _session.put(upload_url, headers=chunk_headers, data=chunk)
             
             # 最後のチャンク以外は202が返る
             if i < chunks - 1 and chunk_response.status_code != 202:
@@ -555,6 +609,7 @@ def upload_large_file_to_spo(file_content, file_name, folder_id, access_token, a
         # print(f"Error in upload_large_file_to_spo: {e}")
         return None, None, 500
         
+@metrics.timed("graph")
 def get_preview_link(file_id, auth, app_config):
     token_response = auth.get_token_for_user(app_config.SCOPE)
     if not token_response:
@@ -563,9 +618,9 @@ def get_preview_link(file_id, auth, app_config):
         'Authorization': 'Bearer ' + token_response['access_token'],
         'Content-Type': 'application/json'
     }
-    endpoint = f'https://graph.microsoft.com/v1.0/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}/preview'
+    endpoint = f'{GRAPH_BASE_URL}/sites/{app_config.site_id}/drives/{app_config.drive_id}/items/{file_id}/preview'
     # print(endpoint)
-    response = requests.post(endpoint, headers=headers)
+    response = _session.post(endpoint, headers=headers)
     # print(response.status_code)
     # print(response.json())
 
@@ -578,3 +633,320 @@ def get_preview_link(file_id, auth, app_config):
     return None, response.status_code
 
         
+
+
+# ---------------------------------------------------------------------------
+# async 版（共有の httpx.AsyncClient を使用。戻り値は同期版と同じ）
+# ---------------------------------------------------------------------------
+
+@metrics.timed("graph")
+async def upload_edited_files_async(file_content, file_name, auth, app_config):
+    try:
+        token_response = await _get_token_async(auth, app_config)
+        if not token_response:
+            return None, 401
+
+        headers = {
+            'Authorization': 'Bearer ' + token_response['access_token'],
+            'Content-Type': 'application/octet-stream'
+        }
+        endpoint = _drive_url(app_config, f'items/{app_config.Edited_Files}:/{file_name}:/content')
+
+        response = await graph_client.get_graph_client().put(endpoint, headers=headers, content=file_content)
+
+        if response.status_code in (200, 201):
+            return response.json()['id'], response.status_code
+        else:
+            return None, response.status_code
+    except Exception as e:
+        if 'response' in locals():
+            return None, response.status_code
+        else:
+            return None, 500
+
+@metrics.timed("graph")
+async def list_files_async(auth, folder_id=None, app_config=None):
+    token_response = await _get_token_async(auth, app_config)
+    if not token_response:
+        return None, None, None, None, 401, None
+
+    headers = {
+        'Authorization': 'Bearer ' + token_response['access_token'],
+        'Accept': 'application/json'
+    }
+    endpoint = _drive_url(app_config, f'items/{folder_id or app_config.parent_folder_id}/children')
+
+    response = await graph_client.get_graph_client().get(endpoint, headers=headers)
+
+    if response.status_code == 200:
+        items = response.json()['value']
+        files = [item for item in items if 'file' in item]
+        folders = [item for item in items if 'folder' in item]
+        file_ids = [item['id'] for item in files]
+        folder_ids = [item['id'] for item in folders]
+        return files, folders, file_ids, folder_ids, response.status_code, response
+    else:
+        return None, None, None, None, response.status_code, response
+
+@metrics.timed("graph")
+async def download_file_async(file_id, auth, app_config):
+    token_response = await _get_token_async(auth, app_config)
+    if not token_response:
+        return None, 401
+    headers = {
+        'Authorization': 'Bearer ' + token_response['access_token'],
+        'Accept': 'application/octet-stream'
+    }
+    endpoint = _drive_url(app_config, f'items/{file_id}/content')
+
+    # /content はダウンロード URL へのリダイレクトを返す
+    response = await graph_client.get_graph_client().get(endpoint, headers=headers, follow_redirects=True)
+    if response.status_code == 200:
+        return BytesIO(response.content), response.status_code
+    else:
+        return None, response.status_code
+
+@metrics.timed("graph")
+async def get_shared_link_async(file_id, auth, app_config):
+    token_response = await _get_token_async(auth, app_config)
+    if not token_response:
+        return None, 401
+    headers = {
+        'Authorization': 'Bearer ' + token_response['access_token'],
+        'Accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+    endpoint = _drive_url(app_config, f'items/{file_id}/createLink')
+    body = {
+        "type": "view",
+        "scope": "anonymous"
+    }
+
+    response = await graph_client.get_graph_client().post(endpoint, headers=headers, json=body)
+    if response.status_code in [200, 201, 202]:
+        shared_link = response.json().get('link', {}).get('webUrl')
+        if shared_link:
+            return shared_link, 200
+        else:
+            return None, 404
+    else:
+        return None, response.status_code
+
+@metrics.timed("graph")
+async def get_preview_url_async(file_id, auth, app_config):
+    """Office ファイルのプレビュー URL を取得する"""
+    token_response = await _get_token_async(auth, app_config)
+    if not token_response:
+        return None, 401
+
+    endpoint = _drive_url(app_config, f'items/{file_id}')
+    headers = {
+        'Authorization': 'Bearer ' + token_response['access_token'],
+        'Accept': 'application/json'
+    }
+
+    response = await graph_client.get_graph_client().get(endpoint, headers=headers)
+
+    if response.status_code == 200:
+        download_url = response.json().get('@microsoft.graph.downloadUrl')
+        if download_url:
+            encoded_url = quote(download_url, safe='')
+            preview_url = f'https://view.officeapps.live.com/op/embed.aspx?src={encoded_url}&wdStartOn=1&ui=ja-JP'
+            return preview_url, 200
+        else:
+            return None, 404
+    else:
+        return None, response.status_code
+
+@metrics.timed("graph")
+async def create_folder_async(folder_name, auth, app_config):
+    token_response = await _get_token_async(auth, app_config)
+    if not token_response:
+        return None, 401
+
+    headers = {
+        'Authorization': 'Bearer ' + token_response['access_token'],
+        'Content-Type': 'application/json'
+    }
+    endpoint = _drive_url(app_config, 'items/root/children')
+    client = graph_client.get_graph_client()
+
+    if folder_name:
+        # フォルダが存在するか確認
+        response = await client.get(endpoint, headers=headers)
+        if response.status_code in (200, 201):
+            for child in response.json().get('value', []):
+                if child.get('name') == folder_name and 'folder' in child:
+                    return child['id'], None
+        else:
+            return None, response.status_code
+
+    folder_data = {
+        "name": folder_name,
+        "folder": {},
+        "@microsoft.graph.conflictBehavior": "rename"
+    }
+
+    response = await client.post(endpoint, headers=headers, json=folder_data)
+
+    if response.status_code in (200, 201):
+        return response.json().get('id'), response.status_code
+    else:
+        return None, response.status_code
+
+@metrics.timed("graph")
+async def user_info_async(auth, app_config=None):
+    token_response = await _get_token_async(auth, app_config)
+    if not token_response:
+        return None, 401
+
+    headers = {
+        'Authorization': 'Bearer ' + token_response['access_token'],
+        'Accept': 'application/json'
+    }
+
+    response = await graph_client.get_graph_client().get(f'{GRAPH_BASE_URL}/me', headers=headers)
+    return response.json()
+
+@metrics.timed("graph")
+async def delete_file_async(file_id, auth, app_config):
+    try:
+        if not file_id or not auth or not app_config:
+            return False, 400
+
+        try:
+            token_response = await _get_token_async(auth, app_config)
+        except Exception:
+            return False, 401
+
+        if not token_response or 'access_token' not in token_response:
+            return False, 401
+
+        headers = {
+            'Authorization': 'Bearer ' + token_response['access_token']
+        }
+        endpoint = _drive_url(app_config, f'items/{file_id}')
+
+        try:
+            response = await graph_client.get_graph_client().delete(endpoint, headers=headers, timeout=30)
+        except httpx.TimeoutException:
+            print("delete_file_async: Request timed out")
+            return False, 408
+        except httpx.HTTPError as req_error:
+            print(f"delete_file_async: Request error: {req_error}")
+            return False, 500
+
+        if response.status_code == 204:
+            return True, response.status_code
+        elif response.status_code == 404:  # 存在しない場合は削除済みとして扱う
+            print("delete_file_async: File not found (404), treating as successful deletion")
+            return True, response.status_code
+        else:
+            return False, response.status_code
+
+    except Exception as e:
+        print(f"Unexpected error in delete_file_async: {type(e).__name__}: {e}")
+        return False, 500
+
+@metrics.timed("graph")
+async def delete_folder_async(folder_id, auth, app_config):
+    try:
+        token_response = await _get_token_async(auth, app_config)
+        if not token_response:
+            return False, 401
+
+        headers = {
+            'Authorization': 'Bearer ' + token_response['access_token']
+        }
+        endpoint = _drive_url(app_config, f'items/{folder_id}')
+
+        response = await graph_client.get_graph_client().delete(endpoint, headers=headers)
+
+        if response.status_code == 204:
+            return True, response.status_code
+        else:
+            return False, response.status_code
+    except Exception as e:
+        return False, 500
+
+@metrics.timed("graph")
+async def upload_large_file_to_spo_async(file_content, file_name, folder_id, access_token, app_config):
+    """
+    4MB以上のファイルをアップロードするための関数（チャンクアップロード）
+
+    file_content は bytes またはファイルオブジェクト。ファイルオブジェクトは
+    UPLOAD_CHUNK_SIZE のバッファに読み込みながら送るので、全体をメモリに載せない。
+    """
+    try:
+        client = graph_client.get_graph_client()
+        create_session_url = _drive_url(app_config, f'items/{folder_id}:/{file_name}:/createUploadSession')
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+
+        session_response = await client.post(create_session_url, headers=headers)
+
+        if session_response.status_code not in (200, 201):
+            return None, None, session_response.status_code
+
+        upload_url = session_response.json()['uploadUrl']
+
+        if hasattr(file_content, 'readinto'):
+            file_size = await run_in_threadpool(_file_size, file_content)
+            buffer = memoryview(bytearray(min(UPLOAD_CHUNK_SIZE, file_size)))
+
+            async def read_chunk(start, length):
+                read = await run_in_threadpool(_readinto, file_content, buffer[:length])
+                return buffer[:read]
+        else:
+            view = memoryview(file_content)
+            file_size = len(view)
+
+            async def read_chunk(start, length):
+                return view[start:start + length]
+
+        start = 0
+        while start < file_size:
+            chunk = await read_chunk(start, min(UPLOAD_CHUNK_SIZE, file_size - start))
+            if not chunk:
+                # 読み込み中にファイルが短くなった
+                return None, None, 500
+            end = start + len(chunk)
+
+            # uploadUrl は事前認証済みなので Authorization ヘッダーは付けない
+            chunk_response = await _put_view(client, upload_url, chunk, {
+                'Content-Range': f'bytes {start}-{end-1}/{file_size}'
+            })
+
+            # 最後のチャンク以外は202が返る
+            if end < file_size and chunk_response.status_code != 202:
+                return None, None, chunk_response.status_code
+            start = end
+
+        if chunk_response.status_code in (200, 201):
+            return chunk_response.json()['id'], folder_id, chunk_response.status_code
+        else:
+            return None, None, chunk_response.status_code
+
+    except Exception as e:
+        return None, None, 500
+
+@metrics.timed("graph")
+async def get_preview_link_async(file_id, auth, app_config):
+    token_response = await _get_token_async(auth, app_config)
+    if not token_response:
+        return None, 401
+    headers = {
+        'Authorization': 'Bearer ' + token_response['access_token'],
+        'Content-Type': 'application/json'
+    }
+    endpoint = _drive_url(app_config, f'items/{file_id}/preview')
+
+    response = await graph_client.get_graph_client().post(endpoint, headers=headers)
+
+    if response.status_code == 200:
+        preview_url = response.json().get('getUrl')
+        encoded_url = urllib.parse.quote(preview_url, safe=':/?&=')
+        return encoded_url, 200
+    return None, response.status_code
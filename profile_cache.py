@@ -0,0 +1,138 @@
+"""
+Microsoft Graph /me プロフィールのキャッシュ
+
+表示名・メール・役職・勤務地はほとんど変わらないため、ms_oid をキーに
+Redis へキャッシュし、ヘッダー表示のたびに Graph を呼ばないようにします。
+
+- プロセス内キャッシュ (GRAPH_PROFILE_LOCAL_TTL 秒) → Redis → Graph の順に参照
+- GRAPH_PROFILE_TTL 秒を過ぎたデータは stale として返しつつ、
+  バックグラウンドで Graph から再取得する (stale-while-revalidate)
+- stale のまま返すのは GRAPH_PROFILE_STALE_TTL 秒まで。それ以降は Redis から消え、
+  次のリクエストで同期的に取得する
+- キャッシュがない場合、同じ ms_oid の同時リクエストは Graph の呼び出しを共有する (single-flight)
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import graph_client
+import metrics
+import single_flight
+from redis_client import async_redis_client
+
+GRAPH_PROFILE_TTL = int(os.getenv("GRAPH_PROFILE_TTL", 60 * 60))
+GRAPH_PROFILE_STALE_TTL = int(os.getenv("GRAPH_PROFILE_STALE_TTL", 60 * 60 * 24))
+GRAPH_PROFILE_LOCAL_TTL = float(os.getenv("GRAPH_PROFILE_LOCAL_TTL", 30))
+
+PROFILE_FIELDS = ("displayName", "mail", "jobTitle", "officeLocation")
+
+# ms_oid -> (有効期限, プロフィール)
+_local_cache: Dict[str, Tuple[float, Dict]] = {}
+# バックグラウンド更新中の ms_oid と、そのタスク（GC で消えないよう参照を保持）
+_refreshing: Set[str] = set()
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+class GraphProfileError(Exception):
+    """Graph API からプロフィールを取得できなかった場合の例外"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _redis_key(ms_oid: str) -> str:
+    return f"graph_profile:{ms_oid}"
+
+
+def _set_local(ms_oid: str, profile: Dict) -> None:
+    if GRAPH_PROFILE_LOCAL_TTL > 0:
+        _local_cache[ms_oid] = (time.monotonic() + GRAPH_PROFILE_LOCAL_TTL, profile)
+
+
+@metrics.timed("graph")
+async def fetch_profile(access_token: str) -> Dict:
+    """Graph API の /me からプロフィールを取得する"""
+    client = graph_client.get_graph_client()
+    response = await client.get(
+        f"{graph_client.GRAPH_BASE_URL}/me",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    if response.status_code != 200:
+        raise GraphProfileError(response.status_code, response.text)
+    user_data = response.json()
+    return {field: user_data.get(field) for field in PROFILE_FIELDS}
+
+
+async def _read_cached(ms_oid: str) -> Optional[Dict]:
+    try:
+        blob = await async_redis_client.get(_redis_key(ms_oid))
+        if blob:
+            return json.loads(blob)
+    except Exception as e:
+        print(f"Failed to get Graph profile cache from Redis: {e}")
+    return None
+
+
+async def _refresh(ms_oid: str, access_token: str) -> Dict:
+    """Graph から取得して Redis とプロセス内キャッシュへ保存する"""
+    profile = await fetch_profile(access_token)
+    entry = {"profile": profile, "fetched_at": time.time()}
+    try:
+        await async_redis_client.set(
+            _redis_key(ms_oid),
+            json.dumps(entry),
+            ex=GRAPH_PROFILE_TTL + GRAPH_PROFILE_STALE_TTL,
+        )
+    except Exception as e:
+        print(f"Failed to store Graph profile cache in Redis: {e}")
+    _set_local(ms_oid, profile)
+    return profile
+
+
+async def _refresh_in_background(ms_oid: str, access_token: str) -> None:
+    try:
+        # 複数ワーカーが同時に再取得しないよう Redis で短いロックを取る
+        locked = await async_redis_client.set(f"graph_profile_lock:{ms_oid}", b"1", nx=True, ex=30)
+        if locked:
+            await _refresh(ms_oid, access_token)
+    except Exception as e:
+        print(f"Background Graph profile refresh failed for ms_oid {ms_oid}: {e}")
+    finally:
+        _refreshing.discard(ms_oid)
+
+
+def _schedule_refresh(ms_oid: str, access_token: str) -> None:
+    if ms_oid in _refreshing:
+        return
+    _refreshing.add(ms_oid)
+    task = asyncio.create_task(_refresh_in_background(ms_oid, access_token))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def get_profile(ms_oid: str, access_token: str) -> Dict:
+    """
+    ms_oid のプロフィールをキャッシュ経由で取得する
+
+    Raises:
+        GraphProfileError: キャッシュがなく Graph からも取得できなかった場合
+    """
+    local = _local_cache.get(ms_oid)
+    if local and local[0] > time.monotonic():
+        return local[1]
+
+    cached = await _read_cached(ms_oid)
+    if cached:
+        profile = cached["profile"]
+        _set_local(ms_oid, profile)
+        if time.time() - cached["fetched_at"] > GRAPH_PROFILE_TTL:
+            _schedule_refresh(ms_oid, access_token)
+        return profile
+
+    # キャッシュがないユーザーの同時リクエストは Graph の呼び出しを1回に集約する
+    return await single_flight.group.do(f"graph_profile:{ms_oid}", lambda: _refresh(ms_oid, access_token))
@@ -0,0 +1,204 @@
+"""
+管理者向けのリクエスト単位プロファイラー
+
+本番で特定のエンドポイントが遅いときに、再デプロイせずに処理時間の内訳を
+調べるためのミドルウェアです。PROFILER_ADMIN_OIDS に含まれる管理者が
+X-Profile ヘッダー（または ?__profile=1）を付けてリクエストすると、
+処理中のスレッドのスタックを PROFILE_INTERVAL 秒ごとにサンプリングし、
+flame graph 用の folded 形式 (flamegraph.pl / speedscope でそのまま読める) で出力します。
+
+- PROFILE_DIR が設定されている場合: ファイルに保存し、パスを X-Profile-File ヘッダーで返す
+- それ以外、または X-Profile: inline の場合: 本来のレスポンスの代わりにプロファイルを返す
+  （SSE・エクスポートなど終わらないレスポンスに備え、PROFILE_INLINE_TIMEOUT 秒で
+  打ち切ってそこまでのプロファイルを返す。X-Profile-Truncated: 1 が付く）
+
+サンプリングスレッドの停止 (join) とファイルの書き込みはスレッドプールで行い、
+イベントループ上の他のリクエストを止めません。
+
+sync エンドポイント・crud はスレッドプール、async の auth / ms_file_control は
+イベントループのスレッドで動くため、待機中でないすべてのスレッドを対象にします。
+同じワーカーで並行して処理中の他のリクエストも含まれるので、スタックの先頭に
+スレッド名を付けて区別できるようにしています。
+PROFILER_ADMIN_OIDS が未設定の場合、ミドルウェアは登録されずオーバーヘッドはありません。
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Set
+from urllib.parse import parse_qs
+
+import anyio
+import anyio.to_thread
+from starlette.requests import HTTPConnection
+
+from auth import get_ms_oid_from_session_cookie
+
+PROFILER_ADMIN_OIDS: Set[str] = {
+    oid.strip() for oid in os.getenv("PROFILER_ADMIN_OIDS", "").split(",") if oid.strip()
+}
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+PROFILE_INLINE_TIMEOUT = float(os.getenv("PROFILE_INLINE_TIMEOUT", 30))
+
+# 待機中とみなすスタック先頭の関数（ファイル名の末尾, 関数名）
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """別スレッドから sys._current_frames() を定期的に読み取り、スタックを数える"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+
+    def folded(self) -> str:
+        """flame graph 用の folded 形式（"root;...;leaf 回数" を1行ずつ）"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _profile_mode(scope) -> Optional[str]:
+    """X-Profile ヘッダー / __profile クエリの値（指定がなければ None）"""
+    for name, value in scope.get("headers", []):
+        if name == b"x-profile":
+            return value.decode("latin-1") or "1"
+    query_string = scope.get("query_string", b"")
+    if b"__profile" in query_string:
+        values = parse_qs(query_string.decode("latin-1")).get("__profile")
+        if values:
+            return values[0] or "1"
+    return None
+
+
+async def _is_admin(scope) -> bool:
+    session_cookie = HTTPConnection(scope).cookies.get("session")
+    if not session_cookie:
+        return False
+    ms_oid = await anyio.to_thread.run_sync(get_ms_oid_from_session_cookie, session_cookie)
+    return ms_oid in PROFILER_ADMIN_OIDS
+
+
+def _profile_path(scope) -> str:
+    path = scope["path"].strip("/").replace("/", "_") or "root"
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return os.path.join(PROFILE_DIR, f"{stamp}-{scope['method']}-{path}.folded")
+
+
+def _write_profile(path: str, folded: str) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(folded)
+
+
+class ProfilingMiddleware:
+    """管理者が X-Profile / ?__profile を付けたリクエストだけをプロファイルする"""
+
+    def __init__(self, app, interval: float = PROFILE_INTERVAL, inline_timeout: float = PROFILE_INLINE_TIMEOUT):
+        self.app = app
+        self.interval = interval
+        self.inline_timeout = inline_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = _profile_mode(scope)
+        if mode is None or not await _is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+
+        inline = mode == "inline" or not PROFILE_DIR
+        profiler = SamplingProfiler(self.interval)
+
+        if inline:
+            status = {"code": None}
+
+            async def send_profiled(message):
+                # 本来のレスポンスは破棄し、ステータスだけを記録する
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+
+            started = time.perf_counter()
+            profiler.start()
+            try:
+                # ストリーミングのレスポンスは終わらないことがあるので時間で打ち切る
+                with anyio.move_on_after(self.inline_timeout) as cancel_scope:
+                    await self.app(scope, receive, send_profiled)
+            finally:
+                await anyio.to_thread.run_sync(profiler.stop)
+            elapsed = time.perf_counter() - started
+            body = profiler.folded().encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"x-profile-original-status", str(status["code"]).encode("latin-1")),
+                    (b"x-profile-elapsed", f"{elapsed:.6f}".encode("latin-1")),
+                    (b"x-profile-samples", str(profiler.samples).encode("latin-1")),
+                    (b"x-profile-truncated", b"1" if cancel_scope.cancelled_caught else b"0"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        path = _profile_path(scope)
+
+        async def send_with_path(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-file", path.encode("utf-8")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_path)
+        finally:
+            await anyio.to_thread.run_sync(profiler.stop)
+            await anyio.to_thread.run_sync(_write_profile, path, profiler.folded())
@@ -0,0 +1,153 @@
+"""
+SQL 実行回数の計測モジュール (N+1 検出・クエリ数の上限チェック)
+
+database.engine で実行された SQL をブロック単位・リクエスト単位で数えます。
+
+使い方:
+    # ブロック内のクエリ数を上限チェック（テスト用）
+    with assert_max_queries(9):
+        crud.get_project_tree(db, project_id)
+
+    # pytest では conftest.py の query_budget フィクスチャとしても使える
+    def test_tree(query_budget, db):
+        with query_budget(9):
+            crud.get_project_tree(db, 1)
+
+    # 開発時: QUERY_DEBUG=True で QueryDebugMiddleware を有効にすると、
+    # 1リクエスト内で同じ形の SQL が QUERY_REPEAT_THRESHOLD 回を超えて
+    # 実行されたときに警告をログ出力する
+"""
+
+import contextvars
+import logging
+import os
+import re
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_DEBUG = os.getenv("QUERY_DEBUG") == "True"
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", 5))
+
+# 現在計測中のカウンター（スレッドプールへもコンテキストごと引き継がれる）
+_current_counter: contextvars.ContextVar = contextvars.ContextVar("query_counter", default=None)
+_instrumented_engines = weakref.WeakSet()
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:[^()]|\([^()]*\))*\)", re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """SQL を「形」に正規化する（IN リストの要素数やリテラルの違いを無視）"""
+    shape = _IN_LIST.sub("IN (...)", statement)
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryCounter:
+    """計測中に実行された SQL を保持する"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def shapes(self) -> Counter:
+        return Counter(normalize_statement(statement) for statement in self.statements)
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """threshold 回を超えて実行された SQL の形と回数（N+1 の疑い）"""
+        return [(shape, n) for shape, n in self.shapes().most_common() if n > threshold]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.statements.append(statement)
+
+
+def instrument(engine=None) -> None:
+    """エンジンに計測用のイベントを登録する（同じエンジンには1回だけ）"""
+    if engine is None:
+        from database import engine
+    if engine in _instrumented_engines:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    _instrumented_engines.add(engine)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    ブロック内で実行された SQL を数える
+
+    Yields:
+        QueryCounter: count / statements / repeated() で結果を参照できる
+    """
+    instrument(engine)
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+@contextmanager
+def assert_max_queries(budget: int, engine=None):
+    """ブロック内の SQL 実行回数が budget を超えたら AssertionError を送出する"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > budget:
+        details = "\n".join(f"  {n} x {shape}" for shape, n in counter.shapes().most_common())
+        raise AssertionError(
+            f"Query budget exceeded: {counter.count} queries (budget {budget})\n{details}"
+        )
+
+
+class QueryDebugMiddleware:
+    """
+    開発用: リクエストごとに SQL を数え、同じ形の SQL の繰り返し (N+1) を警告する
+
+    レスポンスには X-Query-Count ヘッダーを付ける。
+    """
+
+    def __init__(self, app, threshold: Optional[int] = None, engine=None):
+        self.app = app
+        self.threshold = QUERY_REPEAT_THRESHOLD if threshold is None else threshold
+        instrument(engine)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        counter = QueryCounter()
+        token = _current_counter.set(counter)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(counter.count).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _current_counter.reset(token)
+            for shape, n in counter.repeated(self.threshold):
+                logger.warning(
+                    f"Possible N+1: {scope['method']} {scope['path']} ran the same statement {n} times: {shape[:200]}"
+                )
+
@@ -0,0 +1,298 @@
+"""
+レート制限とアドミッション制御
+
+1つのクライアントやスクリプトが一覧エンドポイントを連打して DB プールを
+使い切らないように、次の2段階で負荷を制限します。
+
+- enforce_rate_limit (依存関係): ms_oid（解決できなければ IP）× ルートテンプレート
+  ごとのトークンバケット。Redis 上の Lua スクリプトで原子的に判定するので、
+  複数ワーカー・複数インスタンスで上限を共有する。拒否したクライアントは
+  Retry-After の間プロセス内で拒否し続け、Redis への問い合わせを省く。
+  Redis に接続できない場合はプロセス内のバケットで判定する
+- AdmissionControlMiddleware: ワーカーごとの処理中リクエスト数の上限。
+  DB コネクションプールが埋まる前、またはスレッドプールの待ちが
+  ADMISSION_MAX_THREADPOOL_QUEUE 件に達したら 429 + Retry-After で断る。
+  エクスポート・バッチ・同期などの一括処理は別枠 (ADMISSION_BULK_MAX_IN_FLIGHT) にして、
+  一括処理が混んでいても画面操作のリクエストが待たされないようにする
+"""
+
+import json
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import anyio.to_thread
+from fastapi import HTTPException, Request
+from starlette.responses import JSONResponse
+
+import metrics
+import threadpool
+from database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+from redis_client import async_redis_client
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+# 既定のバケット（1秒あたりの補充トークン数, バケットの容量）
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", 20))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 40))
+
+# ルートテンプレートごとの (補充レート, 容量)。一覧・一括処理は既定より厳しくする
+# RATE_LIMIT_ROUTES='{"/ships/": [5, 10]}' のように JSON で上書きできる
+ROUTE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "/users/": (5, 10),
+    "/ships/": (5, 10),
+    "/workload/": (2, 5),
+    "/sync": (2, 5),
+    "/export/{entity}": (0.2, 2),
+    "/batch": (5, 10),
+}
+ROUTE_LIMITS.update({
+    route: tuple(limit) for route, limit in json.loads(os.getenv("RATE_LIMIT_ROUTES", "{}")).items()
+})
+
+# レート制限・アドミッション制御の対象外（死活監視・メトリクス・長時間接続の SSE）
+EXEMPT_PATHS = {"/", "/metrics", "/healthz", "/readyz", "/events"}
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "True") == "True"
+# 既定は DB コネクションの上限 (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+ADMISSION_BULK_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_BULK_MAX_IN_FLIGHT", max(1, ADMISSION_MAX_IN_FLIGHT // 4)))
+BULK_PATH_PREFIXES = ("/export/", "/batch", "/sync")
+# スレッドプールの空き待ちがこの件数以上になったら受け付けない（既定はスレッド数と同じ）
+ADMISSION_MAX_THREADPOOL_QUEUE = int(os.getenv("ADMISSION_MAX_THREADPOOL_QUEUE", threadpool.THREADPOOL_SIZE))
+
+SESSION_OID_CACHE_TTL = 60
+
+# KEYS[1]: バケットのキー / ARGV: 補充レート, 容量, 消費トークン数
+# 戻り値: {許可なら 1, 再試行までの秒数, 残りトークン数}
+# 現在時刻は Redis の TIME を使う（インスタンス間の時計のずれでバケットが壊れないように）
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry_after), tostring(tokens)}
+"""
+
+_token_bucket = async_redis_client.register_script(TOKEN_BUCKET_LUA)
+
+
+class TokenBucket:
+    """Redis に接続できないときに使うプロセス内のトークンバケット"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+        return False, (cost - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        """満タンまで補充済みなら True（新しいバケットと同じなので捨ててよい）"""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+# バケットのキー -> 拒否を続ける期限 (monotonic)
+_denied_until: Dict[str, float] = {}
+_local_buckets: Dict[str, TokenBucket] = {}
+# Redis のキー (セッション / user_id -> ms_oid) -> (有効期限, ms_oid)
+_resolved_oids: Dict[str, Tuple[float, Optional[str]]] = {}
+
+
+def _prune(cache: Dict, expired: Callable[[Any, float], bool], limit: int = 10000) -> None:
+    """件数が limit を超えたら期限切れのエントリだけを捨てる（有効な拒否は残す）"""
+    if len(cache) <= limit:
+        return
+    now = time.monotonic()
+    for key in [key for key, value in cache.items() if expired(value, now)]:
+        del cache[key]
+
+
+def _denial_expired(until: float, now: float) -> bool:
+    return until <= now
+
+
+def _oid_expired(entry: Tuple[float, Optional[str]], now: float) -> bool:
+    return entry[0] <= now
+
+
+def _bucket_expired(bucket: "TokenBucket", now: float) -> bool:
+    return bucket.is_full(now)
+
+
+async def _lookup_ms_oid(key: str) -> Optional[str]:
+    """auth と同じ Redis のキーから ms_oid を引く（結果は SESSION_OID_CACHE_TTL 秒キャッシュ）"""
+    cached = _resolved_oids.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    try:
+        blob = await async_redis_client.get(key)
+        ms_oid = blob.decode("utf-8") if isinstance(blob, bytes) else blob
+    except Exception:
+        ms_oid = None
+    _prune(_resolved_oids, _oid_expired)
+    _resolved_oids[key] = (time.monotonic() + SESSION_OID_CACHE_TTL, ms_oid)
+    return ms_oid
+
+
+async def _resolve_identity(request: Request) -> str:
+    """
+    レート制限の単位: ms_oid > クライアント IP
+
+    ms_oid は get_current_user と同じく session cookie、なければ X-User-ID から解決する。
+    X-User-ID の値そのものは使わない（リクエストごとに値を変えればバケットを
+    作り直せてしまうため）。解決できない場合は IP で制限する。
+    """
+    ms_oid = None
+    session = request.cookies.get("session")
+    if session:
+        ms_oid = await _lookup_ms_oid(f"shared:ms_oid_by_session:{session}")
+    user_id = request.headers.get("x-user-id")
+    if not ms_oid and user_id and user_id.isdigit():
+        ms_oid = await _lookup_ms_oid(f"shared:ms_oid_by_user:{int(user_id)}")
+    if ms_oid:
+        return f"oid:{ms_oid}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def _route_limit(route_path: str) -> Tuple[float, float]:
+    return ROUTE_LIMITS.get(route_path, (RATE_LIMIT_RATE, RATE_LIMIT_BURST))
+
+
+async def check_rate_limit(identity: str, route_path: str, cost: float = 1) -> Tuple[bool, float]:
+    """
+    identity × route_path のバケットからトークンを取り出す
+
+    Returns:
+        (許可されたか, 再試行までの秒数)
+    """
+    key = f"rate_limit:{identity}:{route_path}"
+    now = time.monotonic()
+    denied_until = _denied_until.get(key)
+    if denied_until is not None:
+        if denied_until > now:
+            return False, denied_until - now
+        del _denied_until[key]
+
+    rate, burst = _route_limit(route_path)
+    try:
+        allowed, retry_after, _ = await _token_bucket(keys=[key], args=[rate, burst, cost])
+        allowed, retry_after = bool(int(allowed)), float(retry_after)
+    except Exception as e:
+        print(f"Rate limit fallback to local bucket: {e}")
+        bucket = _local_buckets.get(key)
+        if bucket is None:
+            _prune(_local_buckets, _bucket_expired)
+            bucket = _local_buckets[key] = TokenBucket(rate, burst)
+        allowed, retry_after = bucket.take(cost)
+
+    if not allowed:
+        _prune(_denied_until, _denial_expired)
+        _denied_until[key] = now + retry_after
+    return allowed, retry_after
+
+
+def _retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+async def enforce_rate_limit(request: Request) -> None:
+    """
+    全ルート共通の依存関係: ユーザー × ルートのレート制限
+
+    Raises:
+        HTTPException: 429（Retry-After ヘッダー付き）
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", request.url.path)
+    if route_path in EXEMPT_PATHS:
+        return
+    identity = await _resolve_identity(request)
+    allowed, retry_after = await check_rate_limit(identity, route_path)
+    if not allowed:
+        metrics.REQUESTS_REJECTED.labels(reason="rate_limit").inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": _retry_after_header(retry_after)},
+        )
+
+
+class AdmissionControlMiddleware:
+    """処理中のリクエスト数が上限に達したら、処理を始める前に 429 を返す"""
+
+    def __init__(self, app, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 bulk_max_in_flight: int = ADMISSION_BULK_MAX_IN_FLIGHT,
+                 max_threadpool_queue: int = ADMISSION_MAX_THREADPOOL_QUEUE):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.bulk_max_in_flight = bulk_max_in_flight
+        self.max_threadpool_queue = max_threadpool_queue
+        self.in_flight = 0
+        self.bulk_in_flight = 0
+
+    def _reject_reason(self, bulk: bool) -> Optional[str]:
+        if self.in_flight >= self.max_in_flight:
+            return "admission"
+        if bulk and self.bulk_in_flight >= self.bulk_max_in_flight:
+            return "admission_bulk"
+        # 一時的な待ちでは断らず、スレッドプールの待ちが溜まっている場合だけ断る
+        if anyio.to_thread.current_default_thread_limiter().statistics().tasks_waiting >= self.max_threadpool_queue:
+            return "admission_threadpool"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_CONTROL_ENABLED or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        bulk = scope["path"].startswith(BULK_PATH_PREFIXES)
+        reason = self._reject_reason(bulk)
+        if reason is not None:
+            metrics.REQUESTS_REJECTED.labels(reason=reason).inc()
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry later"},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        if bulk:
+            self.bulk_in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            if bulk:
+                self.bulk_in_flight -= 1
@@ -1,13 +1,25 @@
 import os
 import redis
+import redis.asyncio as redis_async
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Redis接続設定
 REDIS_URL = os.environ.get("REDIS_URL")
+# 変更通知の publish 用クライアントのタイムアウト（秒）。Redis が応答しなくても待ち続けない
+REDIS_PUBLISH_TIMEOUT = float(os.environ.get("REDIS_PUBLISH_TIMEOUT", 2))
 if REDIS_URL:
     redis_client = redis.from_url(REDIS_URL, decode_responses=False)
+    # 変更通知の publish 用（短いタイムアウト付き）
+    publisher_redis_client = redis.from_url(
+        REDIS_URL,
+        decode_responses=False,
+        socket_timeout=REDIS_PUBLISH_TIMEOUT,
+        socket_connect_timeout=REDIS_PUBLISH_TIMEOUT
+    )
+    # 非同期版（pub/sub の購読などイベントループ上で使う処理用）
+    async_redis_client = redis_async.from_url(REDIS_URL, decode_responses=False)
 else:
     REDIS_HOST = os.environ.get("REDIS_HOST", "ntb-redis. redis.cache.windows.net")
     REDIS_PORT = int(os. environ.get("REDIS_PORT", 6380))
@@ -19,6 +31,24 @@ else:
         ssl=True,
         decode_responses=False
     )
+    # 変更通知の publish 用（短いタイムアウト付き）
+    publisher_redis_client = redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        ssl=True,
+        decode_responses=False,
+        socket_timeout=REDIS_PUBLISH_TIMEOUT,
+        socket_connect_timeout=REDIS_PUBLISH_TIMEOUT
+    )
+    # 非同期版（pub/sub の購読などイベントループ上で使う処理用）
+    async_redis_client = redis_async.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        ssl=True,
+        decode_responses=False
+    )
 
 # 起動時にRedis接続を確認
 try:
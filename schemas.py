@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 from pydantic import BaseModel, Field, ConfigDict
 
 
@@ -332,3 +332,105 @@ class ProjectPhotoInDB(ProjectPhotoBase):
     id: int
     created_at: datetime
     updated_at: datetime
+
+
+# ProjectTree Schemas (プロジェクト詳細画面用のネスト構造)
+class TodoTree(TodoInDB):
+    assignments: list[TodoAssignmentInDB] = []
+    attachments: list[TodoAttachmentInDB] = []
+    comment_count: int = Field(0, title="コメント件数")
+
+
+class TaskTree(TaskInDB):
+    todos: list[TodoTree] = []
+    assignments: list[TaskAssignmentInDB] = []
+    attachments: list[TaskAttachmentInDB] = []
+    comment_count: int = Field(0, title="コメント件数")
+
+
+class ProjectTree(ProjectInDB):
+    ship: Optional[Ship] = None
+    owner: Optional[User] = None
+    tasks: list[TaskTree] = []
+
+
+# Timeline Schemas (プロジェクトの活動タイムライン)
+class TimelineEntry(BaseModel):
+    kind: str = Field(..., title="種別", description="task_comment / todo_comment / task_attachment / todo_attachment / photo")
+    id: int
+    project_id: int
+    task_number: Optional[int] = None
+    todo_number: Optional[int] = None
+    user_id: int
+    created_at: datetime
+    file_id: Optional[str] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+
+
+class TimelinePage(BaseModel):
+    items: list[TimelineEntry] = []
+    next_cursor: Optional[str] = Field(None, title="次ページのカーソル")
+
+
+# Tombstone Schemas (差分同期用の削除記録)
+class TombstoneInDB(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    table_name: str = Field(..., title="テーブル名")
+    project_id: Optional[int] = Field(None, title="プロジェクトID")
+    record_key: str = Field(..., title="削除した行の主キー (JSON)")
+    deleted_at: datetime
+
+
+# Sync Schemas (差分同期)
+class SyncResponse(BaseModel):
+    cursor: Optional[str] = Field(None, title="次回の since に指定するカーソル")
+    has_more: bool = Field(False, title="件数上限で打ち切ったかどうか")
+    projects: list[ProjectInDB] = []
+    tasks: list[TaskInDB] = []
+    todos: list[TodoInDB] = []
+    task_comments: list[TaskCommentInDB] = []
+    todo_comments: list[TodoCommentInDB] = []
+    task_attachments: list[TaskAttachmentInDB] = []
+    todo_attachments: list[TodoAttachmentInDB] = []
+    photos: list[ProjectPhotoInDB] = []
+    tombstones: list[TombstoneInDB] = []
+
+
+# MyWork Schemas (ログインユーザーの担当一覧)
+class MyWork(BaseModel):
+    user_id: int = Field(..., title="ユーザID")
+    todos: list[TodoInDB] = []
+    tasks: list[TaskInDB] = []
+
+
+# Workload Schemas (担当者別の未完了件数)
+class WorkloadEntry(BaseModel):
+    user_id: int = Field(..., title="ユーザID")
+    open_todos: int = Field(0, title="未完了Todo件数")
+    open_tasks: int = Field(0, title="未完了タスク件数")
+    oldest_start: Optional[datetime] = Field(None, title="未完了Todoの最古の開始日時")
+
+
+# Batch Schemas (一括更新API用)
+class BatchOperation(BaseModel):
+    op: str = Field(..., title="操作名", description="create_todo, update_task, delete_todo_assignment など")
+    ref: Optional[str] = Field(None, title="参照名", description="後続の操作から \"$参照名.フィールド\" で結果を参照するための名前（\"$\" で始まる文字列そのものは \"$$\" と書く）")
+    key: dict[str, Any] = Field({}, title="対象キー", description="更新・削除対象の主キー")
+    data: dict[str, Any] = Field({}, title="入力データ", description="作成・更新に使う各スキーマの内容")
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(..., title="操作リスト", min_length=1)
+
+
+class BatchResult(BaseModel):
+    op: str
+    ref: Optional[str] = None
+    result: Any
+
+
+class BatchResponse(BaseModel):
+    results: list[BatchResult]
@@ -0,0 +1,76 @@
+"""
+同一リクエストの集約 (single-flight)
+
+フリートのダッシュボードを開くと、多数のユーザーが同時に /ships/ や同じ
+プロジェクト画面を読み込み、まったく同じクエリが並行して実行されます。
+ここでは「ルートテンプレート + 正規化したパラメーター（+ 必要なら認証スコープ）」を
+キーにして、同じワーカー内で実行中の処理があればその結果を待って共有します。
+
+- 先に来たリクエストの処理をタスクとして実行し、後から来たリクエストはその完了を待つ
+- 結果（例外を含む）は待っていた全リクエストに返し、完了したらキーを破棄する
+  （結果のキャッシュではないので、完了後のリクエストは新しく実行される）
+- 先頭のリクエストが切断されても、待っている他のリクエストの処理は中断しない
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "True") == "True"
+
+# キーに含めないクエリパラメーター（結果に影響しないもの）
+IGNORED_PARAMS = {"__profile"}
+
+
+def request_key(request: Request, scope: Optional[str] = None) -> str:
+    """
+    ルートテンプレート・パスパラメーター・クエリパラメーターから集約キーを作る
+
+    Args:
+        scope: ユーザーごとに結果が異なる場合の認証スコープ（ms_oid など）
+    """
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    params = sorted(
+        (name, value) for name, value in request.query_params.multi_items() if name not in IGNORED_PARAMS
+    )
+    path_params = sorted((name, str(value)) for name, value in request.path_params.items())
+    return json.dumps([request.method, path, path_params, params, scope], ensure_ascii=False)
+
+
+class SingleFlight:
+    """キーごとに実行中のタスクを1つだけ保持し、同じキーの呼び出しで結果を共有する"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """key で実行中の処理があればその結果を待ち、なければ fn() を実行する"""
+        if not SINGLE_FLIGHT_ENABLED:
+            return await fn()
+        task = self._in_flight.get(key)
+        if task is not None:
+            metrics.SINGLE_FLIGHT_SHARED.inc()
+        else:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # 待っている側がキャンセルされてもタスク本体は止めない
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def run_sync(self, key: str, func: Callable, *args) -> Any:
+        """同期関数をスレッドプールで実行し、同じキーの呼び出しで結果を共有する"""
+        return await self.do(key, lambda: run_in_threadpool(func, *args))
+
+
+group = SingleFlight()
@@ -0,0 +1,75 @@
+"""/batch の参照 ($参照名.フィールド / $$) とプロジェクト単位の権限確認"""
+
+import pytest
+
+import crud
+import models
+from schemas import BatchOperation
+
+
+def _run(db, user_id, *operations):
+    return crud.execute_batch(db, [BatchOperation(**operation) for operation in operations], user_id=user_id)
+
+
+def test_reference_resolves_earlier_result(db, project, owner):
+    results = _run(
+        db, owner.id,
+        {"op": "create_task", "ref": "t", "data": {"project_id": project.id, "name": "new"}},
+        {"op": "create_todo", "data": {
+            "project_id": project.id, "task_number": "$t.task_number", "description": "child",
+        }},
+    )
+    task_number = results[0]["result"]["task_number"]
+    assert results[1]["result"]["task_number"] == task_number
+    assert db.query(models.Todo).filter_by(project_id=project.id, task_number=task_number).count() == 1
+
+
+def test_dollar_strings_are_kept_unless_declared(db, project, owner):
+    results = _run(
+        db, owner.id,
+        {"op": "create_task", "ref": "t", "data": {"project_id": project.id, "name": "$100 budget"}},
+        {"op": "create_task", "data": {"project_id": project.id, "name": "$$t.task_number"}},
+    )
+    assert results[0]["result"]["name"] == "$100 budget"
+    assert results[1]["result"]["name"] == "$t.task_number"
+
+
+def test_reference_to_later_operation_is_rejected(db, project, owner):
+    with pytest.raises(ValueError):
+        _run(
+            db, owner.id,
+            {"op": "create_todo", "data": {
+                "project_id": project.id, "task_number": "$t.task_number", "description": "early",
+            }},
+            {"op": "create_task", "ref": "t", "data": {"project_id": project.id, "name": "late"}},
+        )
+
+
+def test_non_member_cannot_touch_project(db, project, outsider):
+    tasks_before = db.query(models.Task).count()
+    with pytest.raises(PermissionError):
+        _run(db, outsider.id, {"op": "create_task", "data": {"project_id": project.id, "name": "x"}})
+    with pytest.raises(PermissionError):
+        _run(db, outsider.id, {"op": "delete_project", "key": {"project_id": project.id}})
+    assert db.query(models.Task).count() == tasks_before
+    assert db.get(models.Project, project.id) is not None
+
+
+def test_failed_operation_rolls_back_whole_batch(db, project, owner, outsider):
+    with pytest.raises(PermissionError):
+        _run(
+            db, owner.id,
+            {"op": "create_task", "data": {"project_id": project.id, "name": "kept?"}},
+            {"op": "create_project", "data": {"name": "other", "owner_id": outsider.id}},
+        )
+    assert db.query(models.Task).filter_by(name="kept?").count() == 0
+
+
+def test_batch_endpoint_requires_login_and_access(client, project, outsider):
+    operation = {"op": "update_project", "key": {"project_id": project.id}, "data": {"name": "renamed"}}
+    body = {"operations": [operation]}
+    assert client.post("/batch", json=body).status_code == 401
+    assert client.post("/batch", json=body, headers={"X-Test-User": "oid-outsider"}).status_code == 403
+    response = client.post("/batch", json=body, headers={"X-Test-User": "oid-owner"})
+    assert response.status_code == 200
+    assert response.json()["results"][0]["result"]["name"] == "renamed"
@@ -0,0 +1,58 @@
+"""UPDATE / DELETE を1文で発行する *_direct 関数 (_update_where / _delete_where)"""
+
+import json
+
+import crud
+import models
+from schemas import ProjectUpdate, TaskUpdate
+
+
+def _task(db, project):
+    return db.query(models.Task).filter_by(project_id=project.id).first()
+
+
+def test_update_direct_reports_whether_row_existed(db, project, query_budget):
+    project_id = project.id
+    with query_budget(1):
+        assert crud.update_project_direct(db, project_id, ProjectUpdate(name="renamed")) is True
+    assert crud.update_project_direct(db, 9999, ProjectUpdate(name="missing")) is False
+
+    updated = crud.update_project_direct(db, project_id, ProjectUpdate(yard="Yard"), reread=True)
+    assert updated.name == "renamed" and updated.yard == "Yard"
+    assert crud.update_project_direct(db, 9999, ProjectUpdate(yard="Yard"), reread=True) is None
+
+
+def test_update_direct_queues_change_event_only_when_updated(db, project):
+    task = _task(db, project)
+    events = []
+    original = crud.queue_change
+    crud.queue_change = lambda session, project_id, entity, action, key: events.append((entity, action, key))
+    try:
+        crud.update_task_direct(db, project.id, task.task_number, TaskUpdate(name="changed"))
+        crud.update_task_direct(db, project.id, 9999, TaskUpdate(name="missing"))
+    finally:
+        crud.queue_change = original
+    assert events == [("tasks", "updated", {"project_id": project.id, "task_number": task.task_number})]
+
+
+def test_delete_direct_records_tombstone_in_same_transaction(db, project, query_budget):
+    todo = db.query(models.Todo).filter_by(project_id=project.id).first()
+    project_id, task_number, todo_number = todo.project_id, todo.task_number, todo.todo_number
+
+    # Tombstone の INSERT ... SELECT と DELETE の2文だけ
+    with query_budget(2):
+        assert crud.delete_todo_direct(db, project_id, task_number, todo_number) is True
+    assert crud.delete_todo_direct(db, project_id, task_number, todo_number) is False
+
+    tombstones = db.query(models.Tombstone).all()
+    assert len(tombstones) == 1
+    assert tombstones[0].table_name == "todos"
+    assert tombstones[0].project_id == project_id
+    assert json.loads(tombstones[0].record_key) == {
+        "project_id": project_id, "task_number": task_number, "todo_number": todo_number,
+    }
+
+
+def test_delete_direct_of_missing_row_writes_no_tombstone(db, project):
+    assert crud.delete_task_comment_direct(db, 9999) is False
+    assert db.query(models.Tombstone).count() == 0
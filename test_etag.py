@@ -0,0 +1,63 @@
+"""ETag の弱い比較・圧縮方式ごとの ETag と 304 応答"""
+
+from datetime import datetime
+
+from sqlalchemy import update
+
+import models
+from utils import encoded_etag, etag_matches, make_etag
+
+
+def test_make_etag_is_weak_and_depends_on_version():
+    etag = make_etag("users", (datetime(2024, 1, 1), 3), 0, 100)
+    assert etag.startswith('W/"')
+    assert etag != make_etag("users", (datetime(2024, 1, 1), 4), 0, 100)
+
+
+def test_etag_matches_uses_weak_comparison():
+    etag = make_etag("users", 1)
+    strong = etag.removeprefix("W/")
+    assert etag_matches(etag, etag)
+    assert etag_matches(strong, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_encoded_etag_variants_match_the_same_version():
+    etag = make_etag("ships", 1)
+    gzip_etag = encoded_etag(etag, "gzip")
+    assert gzip_etag != etag and gzip_etag.endswith('-gzip"')
+    assert encoded_etag(etag, "identity") == etag
+    assert etag_matches(gzip_etag, etag)
+    assert etag_matches(encoded_etag(etag, "br"), etag)
+
+
+def test_users_list_returns_304_until_a_row_changes(client, db, owner, outsider):
+    first = client.get("/users/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert "accept-encoding" in first.headers["vary"].lower()
+
+    cached = client.get("/users/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    # 別の行の updated_at だけが変わっても版が変わる
+    stamp = db.query(models.User.updated_at).filter_by(id=owner.id).scalar()
+    db.execute(update(models.User).where(models.User.id == outsider.id).values(updated_at=stamp))
+    db.commit()
+    changed = client.get("/users/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_project_tree_304_requires_access(client, project):
+    headers = {"X-Test-User": "oid-owner"}
+    first = client.get(f"/projects/{project.id}/tree", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert client.get(f"/projects/{project.id}/tree", headers={**headers, "If-None-Match": etag}).status_code == 304
+    assert client.get(f"/projects/{project.id}/tree", headers={"If-None-Match": etag}).status_code == 401
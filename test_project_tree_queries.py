@@ -0,0 +1,61 @@
+"""get_project_tree のクエリ数がタスク・Todo の件数に依存しないことの確認"""
+
+from datetime import datetime
+
+import crud
+import fast_json
+import models
+import schemas
+from query_counter import count_queries
+
+
+def _create_project(db, owner_id: int, tasks: int, todos_per_task: int) -> int:
+    """担当者・コメント付きのタスクと Todo を持つプロジェクトを作る"""
+    project = models.Project(name=f"P{tasks}x{todos_per_task}", owner_id=owner_id, ship_id=1)
+    db.add(project)
+    db.flush()
+    for t in range(tasks):
+        task = models.Task(project_id=project.id, name=f"task {t}")
+        db.add(task)
+        db.flush()
+        db.add(models.TaskAssignment(owner_id, project.id, task.task_number))
+        db.add(models.TaskComment(project.id, task.task_number, owner_id, "comment"))
+        for d in range(todos_per_task):
+            todo = models.Todo(
+                project_id=project.id, task_number=task.task_number,
+                description=f"todo {d}", start=datetime(2024, 1, 1),
+            )
+            db.add(todo)
+            db.flush()
+            db.add(models.TodoAssignment(owner_id, project.id, task.task_number, todo.todo_number))
+            db.add(models.TodoComment(project.id, task.task_number, todo.todo_number, owner_id, "comment"))
+    db.commit()
+    return project.id
+
+
+def _load_tree(db, project_id: int) -> bytes:
+    """エンドポイントと同じく取得からシリアライズまで行う（遅延ロードも数える）"""
+    db.expire_all()
+    return fast_json.dump_model(schemas.ProjectTree, crud.get_project_tree(db, project_id=project_id))
+
+
+def _tree_query_count(db, project_id: int) -> int:
+    with count_queries() as counter:
+        _load_tree(db, project_id)
+    return counter.count
+
+
+def test_project_tree_query_count_is_constant(db, query_budget):
+    db.add(models.User(id=1, email="owner@example.com", name="Owner", ms_id="oid-owner"))
+    db.add(models.Ship(id=1, name="Ship"))
+    db.flush()
+    small = _create_project(db, owner_id=1, tasks=1, todos_per_task=1)
+    large = _create_project(db, owner_id=1, tasks=8, todos_per_task=5)
+
+    small_count = _tree_query_count(db, small)
+    assert small_count == _tree_query_count(db, large)
+
+    with query_budget(small_count):
+        tree = schemas.ProjectTree.model_validate_json(_load_tree(db, large))
+    assert len(tree.tasks) == 8
+    assert all(len(task.todos) == 5 and task.comment_count == 1 for task in tree.tasks)
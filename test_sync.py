@@ -0,0 +1,89 @@
+"""/sync の (updated_at, 主キー) カーソルと tombstones"""
+
+from datetime import datetime
+
+from sqlalchemy import update
+
+import crud
+import models
+from schemas import TaskUpdate
+
+
+def _add_todos_with_same_timestamp(db, project, count: int) -> datetime:
+    task = db.query(models.Task).filter_by(project_id=project.id).first()
+    for i in range(count):
+        db.add(models.Todo(project_id=project.id, task_number=task.task_number, description=f"bulk {i}"))
+        # todo_number は flush 時に採番されるので1件ずつ flush する
+        db.flush()
+    db.commit()
+    stamp = datetime(2024, 1, 1, 12, 0, 0)
+    db.execute(update(models.Todo).values(updated_at=stamp))
+    db.commit()
+    return stamp
+
+
+def _sync_all(db, **kwargs):
+    """has_more が false になるまで cursor をたどり、ページを返す"""
+    pages, since = [], None
+    while True:
+        page = crud.get_changes_since(db, since=since, **kwargs)
+        pages.append(page)
+        if not page["has_more"]:
+            return pages
+        since = page["cursor"]
+
+
+def test_cursor_pages_through_identical_timestamps(db, project):
+    _add_todos_with_same_timestamp(db, project, 6)
+    total = db.query(models.Todo).count()
+
+    pages = _sync_all(db, limit=3)
+    keys = [(todo.task_number, todo.todo_number) for page in pages for todo in page["todos"]]
+    assert len(keys) == total
+    assert len(set(keys)) == total
+    assert len(pages) > 1
+
+
+def test_cursor_returns_only_later_changes(db, project):
+    first = crud.get_changes_since(db, limit=100)
+    assert first["has_more"] is False
+    assert crud.get_changes_since(db, since=first["cursor"], limit=100)["todos"] == []
+
+    task = db.query(models.Task).filter_by(project_id=project.id).first()
+    crud.update_task_direct(db, project.id, task.task_number, TaskUpdate(name="changed"))
+    changed = crud.get_changes_since(db, since=first["cursor"], limit=100)
+    assert [t.name for t in changed["tasks"]] == ["changed"]
+
+
+def test_tombstones_page_without_duplicates(db, project):
+    _add_todos_with_same_timestamp(db, project, 4)
+    for todo in db.query(models.Todo).all():
+        assert crud.delete_todo_direct(db, project.id, todo.task_number, todo.todo_number)
+    stamp = datetime(2024, 1, 2)
+    db.execute(update(models.Tombstone).values(deleted_at=stamp))
+    db.commit()
+    deleted = db.query(models.Tombstone).count()
+
+    pages = _sync_all(db, limit=2)
+    ids = [tombstone.id for page in pages for tombstone in page["tombstones"]]
+    assert sorted(ids) == sorted(set(ids))
+    assert len(ids) == deleted == 5
+
+
+def test_sync_is_scoped_to_accessible_projects(db, project, owner, outsider):
+    assert crud.get_changes_since(db, user_id=owner.id)["projects"]
+    changes = crud.get_changes_since(db, user_id=outsider.id)
+    assert changes["projects"] == [] and changes["todos"] == []
+
+
+def test_sync_runs_one_query_per_table(db, project, query_budget):
+    with query_budget(len(crud.SYNC_ENTITIES) + 1):
+        crud.get_changes_since(db, limit=10)
+
+
+def test_sync_endpoint_validates_limit_and_login(client, project):
+    assert client.get("/sync").status_code == 401
+    headers = {"X-Test-User": "oid-owner"}
+    assert client.get("/sync?limit=-5", headers=headers).status_code == 422
+    assert client.get("/sync?since=not-a-cursor", headers=headers).status_code == 400
+    assert client.get("/sync", headers=headers).status_code == 200
@@ -0,0 +1,76 @@
+"""
+同期処理用スレッドプールの容量設定とメトリクス
+
+def エンドポイントや同期の依存関係 (get_db など) は AnyIO の既定スレッドプール
+（既定 40 スレッド）で実行されます。ここでは起動時に容量を THREADPOOL_SIZE へ
+変更し、次の値を取得できるようにします。
+
+- active_threads: 実行中のスレッド数 (borrowed_tokens)
+- queue_depth: 空きスレッド待ちのタスク数 (tasks_waiting)
+- wait: スレッドプールへ投入されてからスレッドで処理が始まるまでの時間
+  （anyio.to_thread.run_sync 経由の投入ごとに metrics の threadpool_wait_seconds へ記録。
+  def エンドポイント・同期の依存関係・run_in_threadpool がすべて対象）
+
+DB のコネクションプール (DB_POOL_SIZE + DB_MAX_OVERFLOW) と合わせて調整し、
+スレッド待ちと DB 待ちのどちらが詰まっているかを切り分けるために使います。
+"""
+
+import functools
+import os
+import time
+from typing import Dict, Optional
+
+import anyio.to_thread
+
+import metrics
+
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", 40))
+
+
+def configure_threadpool(size: Optional[int] = None) -> int:
+    """
+    既定スレッドプールの容量を設定する（lifespan などイベントループ上で呼び出す）
+
+    Returns:
+        int: 設定後の容量
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = size or THREADPOOL_SIZE
+    instrument_run_sync()
+    return limiter.total_tokens
+
+
+def instrument_run_sync() -> None:
+    """
+    anyio.to_thread.run_sync を、投入から実行開始までの待ち時間を記録する版に置き換える（1回だけ）
+
+    Starlette の run_in_threadpool は呼び出しのたびに anyio.to_thread.run_sync を参照するので、
+    FastAPI の def エンドポイント・同期の依存関係もこの経路を通る。
+    """
+    run_sync = anyio.to_thread.run_sync
+    if getattr(run_sync, "_records_wait", False):
+        return
+
+    @functools.wraps(run_sync)
+    async def timed_run_sync(func, *args, **kwargs):
+        submitted = time.perf_counter()
+
+        def run(*call_args):
+            metrics.observe_threadpool_wait(time.perf_counter() - submitted)
+            return func(*call_args)
+
+        return await run_sync(run, *args, **kwargs)
+
+    timed_run_sync._records_wait = True
+    anyio.to_thread.run_sync = timed_run_sync
+
+
+def snapshot() -> Dict:
+    """スレッドプールの現在の状態（イベントループ上で呼び出す）"""
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {
+        "capacity": stats.total_tokens,
+        "active_threads": stats.borrowed_tokens,
+        "queue_depth": stats.tasks_waiting,
+    }
+
@@ -1,4 +1,6 @@
 import os
+import hashlib
+from typing import Optional
 from datetime import datetime
 from pytz import timezone
 
@@ -31,3 +33,65 @@ def generate_unique_filename(file):
     unique_filename = f"{current_datetime}_{name}{ext}"
     
     return unique_filename
+
+
+def make_etag(*parts) -> str:
+    """
+    版情報から弱いETagを生成する
+
+    版は updated_at（秒単位）の集計から求めるため、同じ秒の同じ行への更新は
+    区別できない。内容の完全一致は保証できないので弱い ETag (W/) にする。
+
+    Args:
+        *parts: 版を表す値（updated_at の集計、件数、クエリパラメータなど）
+
+    Returns:
+        str: W/ 付きのダブルクォートで囲んだETag文字列
+    """
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+# 圧縮したレスポンスの ETag に付ける接尾辞（圧縮方式ごとに別の表現として区別する）
+ETAG_ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """
+    圧縮方式ごとの ETag を返す（W/"abc" -> W/"abc-gzip"）
+
+    Args:
+        etag: 圧縮前のレスポンスの ETag
+        encoding: Content-Encoding（None / identity の場合はそのまま）
+    """
+    if not encoding or encoding == "identity" or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _strip_encoding_suffix(etag: str) -> str:
+    for suffix in ETAG_ENCODING_SUFFIXES:
+        if etag.endswith(f'{suffix}"'):
+            return f'{etag[:-len(suffix) - 1]}"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match ヘッダーが指定のETagに一致するか判定する
+
+    Args:
+        if_none_match: リクエストの If-None-Match ヘッダー値
+        etag: 現在のETag
+
+    Returns:
+        bool: 一致する場合 True（304 Not Modified を返してよい）
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match は弱い比較で判定する (RFC 9110 13.1.2)
+    # 圧縮版の ETag (encoded_etag) も同じ版として扱う（304 は本文を返さないため）
+    candidates = [_strip_encoding_suffix(tag.strip().removeprefix("W/")) for tag in if_none_match.split(",")]
+    return _strip_encoding_suffix(etag.removeprefix("W/")) in candidates
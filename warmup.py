@@ -0,0 +1,141 @@
+"""
+起動時のウォームアップ
+
+デプロイ直後の最初のリクエストは、DB・Redis への最初の接続、SQLAlchemy の
+マッパー設定と crud のクエリのコンパイル、pydantic の TypeAdapter の構築を
+まとめて負担するため遅くなります。lifespan でリクエストを受け付ける前に
+これらを済ませ、終わってから health.monitor.mark_ready() で受け付け可能にします。
+
+各段階は失敗しても起動を止めず、ログを出して次へ進みます（全体で WARMUP_TIMEOUT 秒まで）。
+WARMUP_TIMEOUT はウォームアップを待つ時間の上限で、スレッドで実行中のクエリは
+止めません（タイムアウト後もそのクエリは DB 側で最後まで実行されます）。
+そのため代表クエリはプロジェクト1件・ユーザー1人に絞り、データ量に比例する
+集計は実行しません。WARMUP_ENABLED=False で無効にできます。
+"""
+
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import anyio.to_thread
+from sqlalchemy import func, text
+from sqlalchemy.orm import configure_mappers
+
+import crud
+import fast_json
+import models
+import schemas
+from database import DB_POOL_SIZE, SessionLocal, engine
+from redis_client import async_redis_client, redis_client
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "True") == "True"
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 30))
+# 事前に開いておく DB 接続数（既定はコネクションプールの常駐数）
+WARMUP_POOL_CONNECTIONS = int(os.getenv("WARMUP_POOL_CONNECTIONS", DB_POOL_SIZE))
+
+# 起動時に TypeAdapter を構築しておくレスポンススキーマ
+LIST_SCHEMAS = (schemas.User, schemas.Ship)
+MODEL_SCHEMAS = (schemas.ProjectTree,)
+
+
+def open_pool_connections(count: int = WARMUP_POOL_CONNECTIONS) -> int:
+    """count 本の接続を同時に開いてからプールへ返す"""
+    connections = []
+    try:
+        for _ in range(count):
+            connection = engine.connect()
+            connection.execute(text("SELECT 1"))
+            connections.append(connection)
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def run_representative_queries() -> None:
+    """
+    主要な crud のクエリを1回ずつ実行し、SQL のコンパイル結果をキャッシュさせる
+
+    全ワーカーが同時に起動しても負荷にならないよう、集計・差分同期は
+    エンドポイントと同じ形のまま1プロジェクト・1ユーザーに絞って実行する。
+    """
+    db = SessionLocal()
+    try:
+        crud.get_users_version(db)
+        crud.get_users(db, limit=1)
+        crud.get_ships_version(db)
+        crud.get_ships(db, limit=1)
+        project_id = db.query(func.min(models.Project.id)).scalar()
+        user_id = db.query(func.min(models.User.id)).scalar()
+        if project_id is not None:
+            crud.get_project_tree_version(db, project_id=project_id)
+            crud.get_project_tree(db, project_id=project_id)
+            crud.get_project_timeline(db, project_id=project_id, limit=1)
+        if user_id is not None:
+            crud.get_open_todos_for_user(db, user_id, limit=1)
+            crud.get_open_tasks_for_user(db, user_id, limit=1)
+        if project_id is not None and user_id is not None:
+            crud.get_workload(db, project_id=project_id, user_id=user_id)
+            crud.get_changes_since(db, project_id=project_id, limit=1, user_id=user_id)
+    finally:
+        db.rollback()
+        db.close()
+
+
+def build_type_adapters() -> None:
+    for schema in LIST_SCHEMAS:
+        fast_json.list_adapter(schema)
+    for schema in MODEL_SCHEMAS:
+        fast_json.model_adapter(schema)
+
+
+async def warm_redis() -> None:
+    """同期・非同期の両クライアントで接続を確立する"""
+    await async_redis_client.ping()
+    await anyio.to_thread.run_sync(redis_client.ping)
+
+
+async def _step(name: str, fn: Callable, timings: Dict[str, Optional[float]]) -> None:
+    started = time.perf_counter()
+    try:
+        result = fn()
+        if asyncio.iscoroutine(result):
+            await result
+        timings[name] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        timings[name] = None
+        print(f"Warmup step '{name}' failed: {e}")
+
+
+async def run_warmup(primers: Sequence[Callable[[], None]] = ()) -> Dict[str, Optional[float]]:
+    """
+    ウォームアップを実行する
+
+    Args:
+        primers: キャッシュを温める同期関数（マスターデータの圧縮済みキャッシュなど）。
+                 スレッドプールで実行する
+
+    Returns:
+        dict: 段階ごとの所要秒数（失敗した段階は None）
+    """
+    timings: Dict[str, Optional[float]] = {}
+    if not WARMUP_ENABLED:
+        return timings
+
+    async def run_all() -> None:
+        await _step("mappers", configure_mappers, timings)
+        await _step("type_adapters", build_type_adapters, timings)
+        await _step("db_pool", lambda: anyio.to_thread.run_sync(open_pool_connections), timings)
+        await _step("redis", warm_redis, timings)
+        await _step("queries", lambda: anyio.to_thread.run_sync(run_representative_queries), timings)
+        for primer in primers:
+            await _step(primer.__name__.lstrip("_"), lambda primer=primer: anyio.to_thread.run_sync(primer), timings)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(run_all(), timeout=WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Warmup timed out after {WARMUP_TIMEOUT}s")
+    print(f"Warmup finished in {time.perf_counter() - started:.3f}s: {timings}")
+    return timings